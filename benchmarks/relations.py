@@ -0,0 +1,130 @@
+# coding: utf-8
+"""Relations introspection on a synthetic catalog.
+
+Creates a schema with the given number of tables, every table refers to the previous one and every 10th table has
+a composite foreign key. Then compares the current ``BASE_RELATIONS_QUERY`` with the previous one, that was built on
+``information_schema.key_column_usage``.
+
+    python benchmarks/relations.py -D xdump_benchmark -U postgres --tables 10000
+"""
+from time import time
+
+import click
+
+from xdump.postgresql import BASE_RELATIONS_QUERY, PostgreSQLBackend
+
+SCHEMA = "xdump_benchmark"
+INFORMATION_SCHEMA_RELATIONS_QUERY = """
+SELECT
+  DISTINCT
+  TC.constraint_name,
+  TC.table_name,
+  KCU.column_name,
+  CCU.foreign_table_name,
+  CCU.foreign_column_name
+FROM
+  (
+    SELECT
+      CN.conname AS constraint_name,
+      CL.relname AS table_name
+    FROM pg_namespace NS,
+      pg_constraint CN,
+      pg_class CL
+    WHERE
+      NS.oid = CL.relnamespace AND
+      CN.conrelid = CL.oid AND
+      CN.contype = 'f' AND
+      CL.relkind = 'r' AND
+      NOT pg_is_other_temp_schema(NS.oid)
+    ) AS TC
+    JOIN information_schema.key_column_usage AS KCU
+      ON TC.constraint_name = KCU.constraint_name AND
+         KCU.table_name = TC.table_name
+    JOIN (
+      SELECT
+        CL.relname AS foreign_table_name,
+        AT.attname AS foreign_column_name,
+        CN.conname AS constraint_name
+      FROM pg_class CL,
+        pg_attribute AT,
+        pg_constraint CN
+      WHERE
+        CL.oid = AT.attrelid AND
+        CL.oid = CN.confrelid AND
+        AT.attnum = ANY (CN.confkey) AND
+        NOT AT.attisdropped AND
+        CN.contype = 'f' AND
+        CL.relkind = 'r'
+      ) AS CCU
+    ON CCU.constraint_name = TC.constraint_name
+"""
+TABLE_SQL = """
+CREATE TABLE {schema}.table_{index} (
+  id INTEGER NOT NULL,
+  kind INTEGER NOT NULL,
+  parent_id INTEGER NULL,
+  parent_kind INTEGER NULL,
+  PRIMARY KEY (id, kind),
+  UNIQUE (id)
+);
+"""
+SIMPLE_FOREIGN_KEY_SQL = (
+    "ALTER TABLE {schema}.table_{index} ADD FOREIGN KEY (parent_id) REFERENCES {schema}.table_{parent} (id);"
+)
+COMPOSITE_FOREIGN_KEY_SQL = (
+    "ALTER TABLE {schema}.table_{index} "
+    "ADD FOREIGN KEY (parent_id, parent_kind) REFERENCES {schema}.table_{parent} (id, kind);"
+)
+
+
+def create_catalog(backend, tables, batch_size=500):
+    backend.run("DROP SCHEMA IF EXISTS {0} CASCADE".format(SCHEMA))
+    backend.run("CREATE SCHEMA {0}".format(SCHEMA))
+    for start in range(0, tables, batch_size):
+        statements = []
+        for index in range(start, min(start + batch_size, tables)):
+            statements.append(TABLE_SQL.format(schema=SCHEMA, index=index))
+            if index:
+                template = COMPOSITE_FOREIGN_KEY_SQL if index % 10 == 0 else SIMPLE_FOREIGN_KEY_SQL
+                statements.append(template.format(schema=SCHEMA, index=index, parent=index - 1))
+        backend.run("".join(statements))
+        backend.get_connection().commit()
+
+
+def measure(backend, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time()
+        result = backend.run(query)
+        timings.append(time() - start)
+    return min(timings), len(result)
+
+
+@click.command()
+@click.option("-D", "--dbname", required=True)
+@click.option("-U", "--user", required=True)
+@click.option("-W", "--password", default="")
+@click.option("-H", "--host", default="127.0.0.1")
+@click.option("-P", "--port", default="5432")
+@click.option("--tables", type=click.IntRange(1), default=10000, show_default=True)
+@click.option("--repeat", type=click.IntRange(1), default=3, show_default=True)
+@click.option("--keep", is_flag=True, help="Keep the synthetic schema after the benchmark.")
+def main(dbname, user, password, host, port, tables, repeat, keep):
+    backend = PostgreSQLBackend(dbname=dbname, user=user, password=password, host=host, port=port)
+    click.echo("Creating {0} tables in `{1}` schema".format(tables, SCHEMA))
+    create_catalog(backend, tables)
+    try:
+        for name, query in (
+            ("pg_catalog", BASE_RELATIONS_QUERY),
+            ("information_schema", INFORMATION_SCHEMA_RELATIONS_QUERY),
+        ):
+            elapsed, rows = measure(backend, query, repeat)
+            click.echo("{0}: {1:.3f}s, {2} rows".format(name, elapsed, rows))
+    finally:
+        if not keep:
+            backend.run("DROP SCHEMA {0} CASCADE".format(SCHEMA))
+            backend.get_connection().commit()
+
+
+if __name__ == "__main__":
+    main()
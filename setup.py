@@ -1,6 +1,4 @@
 # coding: utf-8
-import sys
-
 from setuptools import setup
 
 import xdump
@@ -13,8 +11,6 @@ install_requires = [
     "psycopg2",
     "click>=6",
 ]
-if sys.version_info[0] == 2:
-    install_requires.append("repoze.lru==0.7")
 
 setup(
     name="xdump",
@@ -47,6 +43,7 @@ setup(
     install_requires=install_requires,
     extras_require={
         "django": ["django>=1.11"],
+        "toml": ["toml"],
     },
     entry_points="""
         [console_scripts]
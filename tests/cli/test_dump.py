@@ -1,7 +1,13 @@
+import os
+import shutil
 import zipfile
 
 import pytest
 
+from xdump.cli import dump
+
+from ..conftest import IS_POSTGRES
+
 
 @pytest.mark.usefixtures("schema", "data")
 def test_single_full_table(cli, archive_filename, db_helper):
@@ -58,9 +64,210 @@ def test_partial_tables_invalid(cli):
     )
 
 
+@pytest.mark.parametrize("spec", ("tickets:100%", "tickets:100", "tickets:100%:42"))
+@pytest.mark.usefixtures("schema", "data")
+def test_sample(cli, archive_filename, spec):
+    result = cli.dump("--sample", spec)
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    assert archive.read("dump/data/tickets.csv").count(b"\n") == 6
+    assert archive.read("dump/data/employees.csv").count(b"\n") == 4
+
+
+@pytest.mark.parametrize("spec", ("tickets", "tickets:0%", "tickets:five", "tickets:5%:seed"))
+@pytest.mark.usefixtures("schema", "data")
+def test_sample_invalid(cli, spec):
+    result = cli.dump("--sample", spec)
+    assert result.exception
+    assert "sample specification should be in the following format" in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_transform(cli, archive_filename):
+    result = cli.dump("-f", "groups", "-x", "groups.name:upper(name)", "--no-schema")
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    assert archive.read("dump/data/groups.csv") == b"id,name\n1,ADMIN\n2,USER\n"
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_transform_invalid(cli):
+    result = cli.dump("-f", "groups", "-x", "name:upper(name)")
+    assert result.exception
+    assert "transform specification should be in the following format" in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_columns(cli, archive_filename):
+    result = cli.dump(
+        "-f",
+        "groups",
+        "-f",
+        "tickets",
+        "--include-columns",
+        "groups:id",
+        "--exclude-columns",
+        "tickets:message,subject",
+    )
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    assert archive.read("dump/data/groups.csv") == b"id\n1\n2\n"
+    assert archive.read("dump/data/tickets.csv").startswith(b"id,author_id\n")
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_columns_invalid(cli):
+    result = cli.dump("-f", "groups", "--include-columns", "groups")
+    assert result.exception
+    assert "columns specification should be in the following format" in result.output
+
+
 @pytest.mark.usefixtures("schema", "data")
 def test_no_schema(cli, archive_filename):
     result = cli.dump("-f", "groups", "--no-schema")
     assert not result.exception
     archive = zipfile.ZipFile(archive_filename)
-    assert archive.namelist() == ["dump/data/groups.csv"]
+    assert archive.namelist() == ["dump/data/groups.csv", "dump/manifest.json"]
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_work_dir(cli, archive_filename, tmpdir):
+    work_dir = str(tmpdir.join("work"))
+    result = cli.dump("-f", "groups", "--no-schema", "--work-dir", work_dir)
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    assert archive.namelist() == ["dump/data/groups.csv", "dump/manifest.json"]
+    assert not os.path.exists(work_dir)
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_resume_without_plan(cli, tmpdir):
+    result = cli.dump("--work-dir", str(tmpdir), "--resume")
+    assert result.exit_code == 1
+    assert "There is no interrupted dump in" in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_resume_without_work_dir(cli):
+    result = cli.dump("--resume")
+    assert result.exit_code == 2
+    assert 'Option "--resume" requires "--work-dir".' in result.output
+
+
+@pytest.mark.postgres
+@pytest.mark.usefixtures("schema", "data")
+def test_to_db(cli, backend, db_helper):
+    target = db_helper.get_new_database_name()
+    backend.create_database(target, backend.user)
+    result = cli.call(dump.postgres, "-f", "groups", "--to-db", target)
+    assert not result.exception
+    assert result.output == "Transferring ...\nTarget database: {0}\nDone!\n".format(target)
+    backend.dbname = target
+    backend.cache_clear()
+    assert backend.run("SELECT name FROM groups ORDER BY id") == [{"name": "Admin"}, {"name": "User"}]
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize(
+    "args, option",
+    (
+        (("-o", "dump.zip"), "--output"),
+        (("-c", "stored"), "--compression"),
+        (("--compression-jobs", "2"), "--compression-jobs"),
+        (("--chunk-size", "10"), "--chunk-size"),
+        (("--work-dir", "work"), "--work-dir"),
+        (("--skip-unchanged",), "--skip-unchanged"),
+    ),
+)
+def test_to_db_with_archive_options(cli, args, option):
+    result = cli.call(dump.postgres, "-f", "groups", "--to-db", "target", *args)
+    assert result.exit_code == 2
+    assert 'Option "{0}" can not be used with "--to-db".'.format(option) in result.output
+
+
+@pytest.mark.postgres
+def test_no_output(cli):
+    result = cli.call(dump.postgres)
+    assert result.exception
+    assert 'Missing option "-o" / "--output".' in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_chunk_size(cli, archive_filename):
+    result = cli.dump("-f", "tickets", "--chunk-size", "3")
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    assert [name for name in archive.namelist() if name.startswith("dump/data/tickets")] == [
+        "dump/data/tickets.0001.csv",
+        "dump/data/tickets.0002.csv",
+    ]
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_compression_jobs(cli, archive_filename, db_helper):
+    result = cli.dump("-f", "groups", "--compression-jobs", "2")
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    db_helper.assert_groups(archive)
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_jobs(cli, archive_filename, db_helper):
+    result = cli.dump("-f", "groups", "-f", "employees", "-j", "2")
+    assert not result.exception
+    archive = zipfile.ZipFile(archive_filename)
+    db_helper.assert_groups(archive)
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_skip_unchanged(cli, backend, archive_filename):
+    backend.dump(archive_filename, ["groups"])
+    backend.cache_clear()
+    result = cli.dump("-f", "groups", "--skip-unchanged")
+    assert not result.exception
+    assert "The database is not changed since the last dump, the output file is kept" in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_run(isolated_cli_runner, backend, tmpdir, db_helper):
+    output = str(tmpdir.join("groups.zip"))
+    config = tmpdir.join("profiles.toml")
+    if IS_POSTGRES:
+        connection = u'backend = "postgres"\ndbname = "{0}"\nuser = "{1}"\npassword = "{2}"\nhost = "{3}"\nport = "{4}"'
+        connection = connection.format(backend.dbname, backend.user, backend.password or "", backend.host, backend.port)
+    else:
+        connection = u'backend = "sqlite"\ndbname = "{0}"'.format(backend.dbname)
+    config.write(
+        u'[connection]\n{0}\n\n[profiles.groups]\noutput = "{1}"\nfull_tables = ["groups"]\n\n'
+        u'[profiles.tickets]\noutput = "{2}"\nfull_tables = ["tickets"]\n'.format(
+            connection, output, str(tmpdir.join("tickets.zip"))
+        )
+    )
+    result = isolated_cli_runner.invoke(dump.run, (str(config), "-p", "groups"), catch_exceptions=False)
+    assert not result.exception
+    assert result.output == "Running 1 profiles ...\nProfile groups: {0}\nDone!\n".format(output)
+    db_helper.assert_groups(zipfile.ZipFile(output))
+    assert not tmpdir.join("tickets.zip").exists()
+
+
+def test_run_unknown_profile(isolated_cli_runner, tmpdir):
+    config = tmpdir.join("profiles.toml")
+    config.write(u'[connection]\nbackend = "sqlite"\ndbname = "test.db"\n')
+    result = isolated_cli_runner.invoke(dump.run, (str(config), "-p", "groups"))
+    assert result.exception
+    assert "Unknown profiles: groups" in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_diff(isolated_cli_runner, backend, tmpdir):
+    first, second = str(tmpdir.join("first.zip")), str(tmpdir.join("second.zip"))
+    backend.dump(first, ["groups"], dump_schema=False)
+    shutil.copy(first, second)
+    result = isolated_cli_runner.invoke(dump.diff, (first, second), catch_exceptions=False)
+    assert result.exit_code == 0
+    assert result.output == "No differences\n"
+    with zipfile.ZipFile(second, "a") as archive:
+        archive.writestr("dump/data/employees.csv", "id,first_name\n1,John\n")
+    result = isolated_cli_runner.invoke(dump.diff, (first, second, "--range-size", "5"), catch_exceptions=False)
+    assert result.exit_code == 1
+    assert result.output == "employees: keys 0..4 differ (0 rows vs 1 rows)\n"
@@ -1,7 +1,12 @@
 import sqlite3
+import zipfile
 
 import pytest
 
+from xdump.base import INITIAL_SETUP_MEMBER, PROGRESS_TABLE_SQL
+from xdump.cli import load
+from xdump.utils import get_archive_id
+
 from ..conftest import EMPLOYEES_SQL, IS_POSTGRES
 
 
@@ -33,6 +38,8 @@ def test_cleanup_methods(cli, archive_filename, backend, cleanup_method, dump_kw
         pass
     result = cli.load("-i", archive_filename, "-m", cleanup_method)
     assert not result.exception
+    # The database could be re-created by the CLI, connections of this backend are not valid anymore
+    backend.cache_clear()
     assert backend.run("SELECT name FROM groups") == [
         {"name": "Admin"},
         {"name": "User"},
@@ -43,3 +50,116 @@ def test_cleanup_methods(cli, archive_filename, backend, cleanup_method, dump_kw
         {"id": 3, "first_name": "John", "last_name": "Smith"},
         {"id": 1, "first_name": "John", "last_name": "Doe"},
     ]
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_merge(cli, archive_filename, backend):
+    backend.dump(archive_filename, ["groups"], dump_schema=False)
+    backend.run("UPDATE groups SET name = 'Changed' WHERE id = 2")
+    backend.run("INSERT INTO groups (id, name) VALUES (3, 'Extra')")
+    backend.run("COMMIT")
+    result = cli.load("-i", archive_filename, "-m", "merge")
+    assert not result.exception
+    assert backend.run("SELECT name FROM groups ORDER BY id") == [
+        {"name": "Admin"},
+        {"name": "User"},
+        {"name": "Extra"},
+    ]
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_resume(cli, archive_filename, backend):
+    """The database is not cleaned up and loaded tables are skipped."""
+    backend.dump(archive_filename, ["groups"], dump_schema=False)
+    try:
+        backend.run("COMMIT")
+    except sqlite3.OperationalError:
+        pass
+    backend.run(PROGRESS_TABLE_SQL)
+    archive_id = get_archive_id(zipfile.ZipFile(archive_filename))
+    backend.mark_loaded(archive_id, [INITIAL_SETUP_MEMBER, "dump/data/groups.csv"])
+    backend.get_connection().commit()
+    result = cli.load("-i", archive_filename, "-m", "truncate", "--resume")
+    assert not result.exception
+    assert result.output.splitlines()[2] == "Resuming ..."
+    assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+    assert not backend.table_exists("xdump_progress")
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_tables(cli, archive_filename, backend):
+    backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False)
+    try:
+        backend.run("COMMIT")
+    except sqlite3.OperationalError:
+        pass
+    result = cli.load("-i", archive_filename, "-m", "truncate", "-t", "groups")
+    assert not result.exception
+    assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+    assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 0
+
+
+@pytest.mark.postgres
+@pytest.mark.usefixtures("schema", "data")
+def test_jobs(cli, archive_filename, backend):
+    backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2)
+    backend.run("COMMIT")
+    result = cli.load("-i", archive_filename, "-m", "truncate", "-j", "2")
+    assert not result.exception
+    backend.cache_clear()
+    assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 5
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_read_ahead(cli, archive_filename, backend):
+    backend.dump(archive_filename, ["groups"], dump_schema=False)
+    try:
+        backend.run("COMMIT")
+    except sqlite3.OperationalError:
+        pass
+    result = cli.load("-i", archive_filename, "-m", "truncate", "--read-ahead", "0")
+    assert not result.exception
+    assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_skip_empty(cli, archive_filename, backend):
+    backend.dump(archive_filename, ["groups"], dump_schema=False)
+    try:
+        backend.run("COMMIT")
+    except sqlite3.OperationalError:
+        pass
+    result = cli.load("-i", archive_filename, "-m", "truncate", "--skip-empty")
+    assert not result.exception
+    assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+
+
+def test_skip_empty_without_truncate(cli, archive_filename):
+    result = cli.load("-i", archive_filename, "--skip-empty")
+    assert result.exit_code == 2
+    assert 'Option "--skip-empty" requires "-m truncate".' in result.output
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_verify(isolated_cli_runner, archive_filename, backend, request):
+    backend.dump(archive_filename, ["groups"], dump_schema=False)
+    try:
+        backend.run("COMMIT")
+    except sqlite3.OperationalError:
+        pass
+    if IS_POSTGRES:
+        parameters = request.getfixturevalue("dsn_parameters")
+        command = load.verify_postgres
+        args = ("-U", parameters["user"], "-H", parameters["host"], "-P", parameters["port"])
+        args += ("-D", parameters["dbname"])
+    else:
+        command = load.verify_sqlite
+        args = ("-D", backend.dbname)
+    result = isolated_cli_runner.invoke(command, args + ("-i", archive_filename), catch_exceptions=False)
+    assert result.exit_code == 0
+    assert result.output == "No differences\n"
+    backend.run("UPDATE groups SET name = 'Changed' WHERE id = 2")
+    backend.run("COMMIT")
+    result = isolated_cli_runner.invoke(command, args + ("-i", archive_filename), catch_exceptions=False)
+    assert result.exit_code == 1
+    assert result.output == "groups: keys 0..9999 differ (2 rows vs 2 rows)\n"
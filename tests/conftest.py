@@ -10,6 +10,7 @@ import pytest
 
 from ._compat import patch
 
+pytest_plugins = ("pytester",)
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 EMPLOYEES_SQL = """
 WITH RECURSIVE employees_cte AS (
@@ -177,6 +178,7 @@ class PostgreSQLWrapper(BackendWrapper):
             "dump/sequences.sql",
             "dump/data/groups.csv",
             "dump/data/employees.csv",
+            "dump/manifest.json",
         ]
 
     def assert_unused_sequences(self, archive):
@@ -204,6 +206,7 @@ class SQLiteWrapper(BackendWrapper):
             "dump/schema.sql",
             "dump/data/groups.csv",
             "dump/data/employees.csv",
+            "dump/manifest.json",
         ]
 
     def get_tables_count(self):
@@ -0,0 +1,24 @@
+# coding: utf-8
+import pytest
+
+from ..conftest import EMPLOYEES_SQL, IS_POSTGRES, IS_SQLITE
+
+
+@pytest.fixture(autouse=True)
+def setup(settings, backend):
+    if IS_POSTGRES:
+        settings.DATABASES["default"]["ENGINE"] = "django.db.backends.postgresql"
+        for source, target in (
+            ("user", "USER"),
+            ("password", "PASSWORD"),
+            ("host", "HOST"),
+            ("port", "PORT"),
+        ):
+            settings.DATABASES["default"][target] = getattr(backend, source)
+    elif IS_SQLITE:
+        settings.DATABASES["default"]["ENGINE"] = "django.db.backends.sqlite3"
+    settings.DATABASES["default"]["NAME"] = backend.dbname
+    settings.XDUMP = {
+        "FULL_TABLES": ("groups",),
+        "PARTIAL_TABLES": {"employees": EMPLOYEES_SQL},
+    }
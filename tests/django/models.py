@@ -0,0 +1,32 @@
+# coding: utf-8
+from django.db import models
+
+
+class Group(models.Model):
+    name = models.TextField()
+
+    class Meta:
+        db_table = "groups"
+        managed = False
+
+
+class Employee(models.Model):
+    first_name = models.TextField()
+    last_name = models.TextField()
+    manager = models.ForeignKey("self", models.CASCADE, null=True, related_name="subordinates")
+    referrer = models.ForeignKey("self", models.CASCADE, null=True, related_name="referrals")
+    group = models.ForeignKey(Group, models.CASCADE, null=True)
+
+    class Meta:
+        db_table = "employees"
+        managed = False
+
+
+class Ticket(models.Model):
+    author = models.ForeignKey(Employee, models.CASCADE)
+    subject = models.TextField()
+    message = models.TextField()
+
+    class Meta:
+        db_table = "tickets"
+        managed = False
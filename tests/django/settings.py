@@ -1,6 +1,6 @@
 # coding: utf-8
 
 SECRET_KEY = "foo"
-INSTALLED_APPS = ("xdump.extra.django",)
+INSTALLED_APPS = ("xdump.extra.django", "tests.django.apps.TestAppConfig")
 
 DATABASES = {"default": {}}
@@ -7,31 +7,11 @@ from django.core.management import call_command
 
 from xdump.sqlite import SQLiteBackend
 
-from ..conftest import EMPLOYEES_SQL, IS_POSTGRES, IS_SQLITE
+from ..conftest import IS_POSTGRES, IS_SQLITE
 
 pytestmark = pytest.mark.usefixtures("schema", "data")
 
 
-@pytest.fixture(autouse=True)
-def setup(settings, backend):
-    if IS_POSTGRES:
-        settings.DATABASES["default"]["ENGINE"] = "django.db.backends.postgresql"
-        for source, target in (
-            ("user", "USER"),
-            ("password", "PASSWORD"),
-            ("host", "HOST"),
-            ("port", "PORT"),
-        ):
-            settings.DATABASES["default"][target] = getattr(backend, source)
-    elif IS_SQLITE:
-        settings.DATABASES["default"]["ENGINE"] = "django.db.backends.sqlite"
-    settings.DATABASES["default"]["NAME"] = backend.dbname
-    settings.XDUMP = {
-        "FULL_TABLES": ("groups",),
-        "PARTIAL_TABLES": {"employees": EMPLOYEES_SQL},
-    }
-
-
 def test_xdump(db_helper, archive_filename):
     call_command("xdump", archive_filename)
     db_helper.assert_dump(archive_filename)
@@ -68,10 +48,11 @@ def test_custom_backend_via_config(settings, db_helper, archive_filename):
     db_helper.assert_dump(archive_filename)
 
 
-def test_xload(archive_filename, db_helper):
+def test_xload(backend, archive_filename, db_helper):
     call_command("xdump", archive_filename)
     assert db_helper.get_tickets_count() == 5
     call_command("xload", archive_filename, cleanup_method="recreate")
+    backend.cache_clear()
     assert db_helper.get_tickets_count() == 0
 
 
@@ -81,15 +62,15 @@ def test_dump_schema(archive_filename, db_helper):
     schema = archive.read("dump/schema.sql")
     db_helper.assert_schema(schema)
     if IS_POSTGRES:
-        assert archive.namelist() == ["dump/schema.sql", "dump/sequences.sql"]
+        assert archive.namelist() == ["dump/schema.sql", "dump/sequences.sql", "dump/manifest.json"]
     else:
-        assert archive.namelist() == ["dump/schema.sql"]
+        assert archive.namelist() == ["dump/schema.sql", "dump/manifest.json"]
 
 
 def test_dump_data(archive_filename):
     call_command("xdump", archive_filename, dump_schema=False)
     archive = zipfile.ZipFile(archive_filename)
-    assert archive.namelist() == ["dump/data/groups.csv", "dump/data/employees.csv"]
+    assert archive.namelist() == ["dump/data/groups.csv", "dump/data/employees.csv", "dump/manifest.json"]
 
 
 def test_skip_recreate(backend, execute_file, archive_filename, db_helper):
@@ -127,3 +108,11 @@ def test_truncate_load(backend, archive_filename, db_helper):
     assert backend.run("SELECT id, first_name, last_name FROM employees") == [
         {"id": 1, "first_name": "John", "last_name": "Doe"}
     ]
+
+
+def test_xload_tables(backend, archive_filename, db_helper):
+    call_command("xdump", archive_filename)
+    call_command("xload", archive_filename, cleanup_method="recreate", tables=["groups"])
+    backend.cache_clear()
+    assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+    assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 0
@@ -0,0 +1,105 @@
+# coding: utf-8
+import zipfile
+
+import pytest
+from django.core.management import call_command
+
+from xdump.extra.django.plan import get_dump_kwargs, get_foreign_keys, get_table_name
+
+from .._compat import patch
+from .models import Employee, Ticket
+
+pytestmark = pytest.mark.usefixtures("schema", "data")
+
+
+def test_get_table_name():
+    assert get_table_name("testapp.Employee") == "employees"
+    assert get_table_name("employees") == "employees"
+
+
+def test_get_foreign_keys():
+    foreign_keys = [foreign_key for foreign_key in get_foreign_keys() if foreign_key["table_name"] == "employees"]
+    assert sorted(foreign_keys, key=lambda item: item["column_name"]) == [
+        {
+            "table_name": "employees",
+            "column_name": "group_id",
+            "foreign_table_name": "groups",
+            "foreign_column_name": "id",
+        },
+        {
+            "table_name": "employees",
+            "column_name": "manager_id",
+            "foreign_table_name": "employees",
+            "foreign_column_name": "id",
+        },
+        {
+            "table_name": "employees",
+            "column_name": "referrer_id",
+            "foreign_table_name": "employees",
+            "foreign_column_name": "id",
+        },
+    ]
+
+
+@pytest.mark.parametrize(
+    "value",
+    (
+        Ticket.objects.filter(subject__in=["Sub 1", "Sub 5"]),
+        lambda: Ticket.objects.filter(subject__in=["Sub 1", "Sub 5"]),
+        {"subject__in": ["Sub 1", "Sub 5"]},
+    ),
+)
+def test_partial_tables(settings, backend, value):
+    settings.XDUMP = {"FULL_TABLES": ["testapp.Group"], "PARTIAL_TABLES": {"testapp.Ticket": value}}
+    kwargs = get_dump_kwargs(backend)
+    assert kwargs["full_tables"] == ["groups"]
+    assert [row["id"] for row in backend.run(kwargs["partial_tables"]["tickets"])] == [1, 5]
+
+
+def test_lookups_without_model(settings, backend):
+    settings.XDUMP = {"FULL_TABLES": [], "PARTIAL_TABLES": {"tickets": {"id": 1}}}
+    with pytest.raises(ValueError, match="Lookups could be used only with model labels. Got: tickets"):
+        get_dump_kwargs(backend)
+
+
+def test_quoting(backend):
+    queryset = Employee.objects.filter(last_name="O'Neil").exclude(first_name__contains="%")
+    kwargs_settings = {"FULL_TABLES": [], "PARTIAL_TABLES": {"employees": queryset}}
+    with patch.dict("django.conf.settings.XDUMP", kwargs_settings):
+        sql = get_dump_kwargs(backend)["partial_tables"]["employees"]
+    assert backend.run(sql) == []
+
+
+def test_foreign_keys_from_models(settings, backend, archive_filename):
+    """Relations are not introspected if they are taken from models."""
+    settings.XDUMP = {
+        "FULL_TABLES": [],
+        "PARTIAL_TABLES": {"testapp.Ticket": {"id": 1}},
+        "FOREIGN_KEYS_FROM_MODELS": True,
+    }
+    with patch.object(backend, "get_dependencies") as get_dependencies, patch(
+        "xdump.extra.django.xdump.management.core._init_backend", return_value=backend
+    ):
+        call_command("xdump", archive_filename, dump_schema=False)
+    assert not get_dependencies.called
+    archive = zipfile.ZipFile(archive_filename)
+    assert archive.namelist() == [
+        "dump/data/tickets.csv",
+        "dump/data/employees.csv",
+        "dump/data/groups.csv",
+        "dump/manifest.json",
+    ]
+    manifest = backend.read_manifest(archive)
+    assert manifest.restore_order == [["groups"], ["employees"], ["tickets"]]
+
+
+def test_transforms(settings, backend):
+    settings.XDUMP = {
+        "FULL_TABLES": ["testapp.Employee"],
+        "PARTIAL_TABLES": {},
+        "TRANSFORMS": {"testapp.Employee": {"last_name": "'Hidden'"}},
+        "COLUMNS": {"testapp.Employee": {"exclude": ["referrer_id"]}},
+    }
+    kwargs = get_dump_kwargs(backend)
+    assert kwargs["transforms"] == {"employees": {"last_name": "'Hidden'"}}
+    assert kwargs["columns"] == {"employees": {"exclude": ["referrer_id"]}}
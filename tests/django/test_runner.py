@@ -0,0 +1,131 @@
+# coding: utf-8
+import pytest
+from django.db import connections
+from django.db.utils import load_backend
+
+from xdump.extra.django.runner import XDumpTestRunner
+
+from .._compat import Mock, patch
+from ..conftest import EMPLOYEES_SQL, IS_SQLITE
+
+pytestmark = pytest.mark.usefixtures("schema", "data")
+
+
+@pytest.fixture
+def connection(settings, archive_filename):
+    settings.XDUMP["TEST_DUMP"] = archive_filename
+    connection = Mock(alias="default", settings_dict=settings.DATABASES["default"])
+    connection._test_serialized_contents = None
+    return connection
+
+
+@pytest.fixture
+def setup_databases(connection):
+    with patch("django.test.runner.DiscoverRunner.setup_databases", return_value=[(connection, "test", True)]) as setup:
+        yield setup
+
+
+@pytest.mark.parametrize("dump_schema", (True, False))
+def test_load_once(backend, archive_filename, connection, setup_databases, dump_schema):
+    backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL}, dump_schema=dump_schema)
+    backend.run("DELETE FROM tickets")
+    backend.run("COMMIT")
+    runner = XDumpTestRunner(parallel=3)
+    loaded = []
+
+    def clone_test_db(**kwargs):
+        # The database could be re-created
+        backend.cache_clear()
+        loaded.append(backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"])
+
+    connection.creation.clone_test_db.side_effect = clone_test_db
+    assert runner.setup_databases() == [(connection, "test", True)]
+    # The dump is loaded before the database is cloned, Django's own cloning is disabled
+    setup_databases.assert_called_once_with()
+    assert [call[1]["suffix"] for call in connection.creation.clone_test_db.call_args_list] == ["1", "2", "3"]
+    assert loaded == [4, 4, 4]
+    assert runner.parallel == 3
+
+
+def test_mirror(connection, setup_databases):
+    setup_databases.return_value = [(connection, "test", False)]
+    runner = XDumpTestRunner(parallel=2)
+    with patch.object(runner, "load_dump") as load_dump:
+        runner.setup_databases()
+    assert not load_dump.called
+    assert not connection.creation.clone_test_db.called
+
+
+def test_other_aliases(settings, connection, setup_databases):
+    settings.XDUMP["TEST_DATABASES"] = ("other",)
+    runner = XDumpTestRunner()
+    with patch.object(runner, "load_dump") as load_dump:
+        runner.setup_databases()
+    assert not load_dump.called
+
+
+
+@pytest.fixture
+def run_setup(settings, archive_filename, django_db_blocker):
+    """Runs the real setup of test databases and counts rows in the test database and in its clones."""
+    settings.XDUMP["TEST_DUMP"] = archive_filename
+
+    def run(table_name="employees", parallel=2, keepdb=False, before_teardown=None):
+        runner = XDumpTestRunner(parallel=parallel, keepdb=keepdb, interactive=False, verbosity=0)
+        with django_db_blocker.unblock():
+            old_config = runner.setup_databases()
+            try:
+                creation = connections["default"].creation
+                databases = [connections["default"].settings_dict] + [
+                    creation.get_test_db_clone_settings(str(index + 1)) for index in range(parallel - 1)
+                ]
+                counts = []
+                for database in databases:
+                    # Django connects to in-memory databases by their URIs
+                    connection = load_backend(database["ENGINE"]).DatabaseWrapper(database)
+                    try:
+                        with connection.cursor() as cursor:
+                            cursor.execute("SELECT COUNT(*) FROM {0}".format(table_name))
+                            counts.append(cursor.fetchone()[0])
+                            if before_teardown is not None:
+                                before_teardown(cursor)
+                    finally:
+                        connection.close()
+            finally:
+                runner.teardown_databases(old_config)
+        return counts
+
+    return run
+
+
+@pytest.fixture
+def on_disk(monkeypatch, tmpdir):
+    """SQLite test databases are in memory by default, they can't be kept between runs."""
+    if IS_SQLITE:
+        monkeypatch.setitem(connections["default"].settings_dict["TEST"], "NAME", str(tmpdir.join("test_xdump.db")))
+
+
+def test_setup_databases(backend, archive_filename, run_setup):
+    backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL})
+    assert run_setup() == [4, 4]
+
+
+@pytest.mark.usefixtures("on_disk")
+def test_setup_databases_on_disk(backend, archive_filename, run_setup):
+    backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL})
+    assert run_setup() == [4, 4]
+
+
+@pytest.mark.usefixtures("on_disk")
+def test_keepdb(backend, archive_filename, run_setup):
+    backend.dump(archive_filename, ["groups"])
+
+    def delete_group(cursor):
+        cursor.execute("DELETE FROM groups WHERE id = 2")
+
+    assert run_setup("groups", parallel=1, keepdb=True, before_teardown=delete_group) == [2]
+    try:
+        # The kept database is not loaded again
+        assert run_setup("groups", parallel=1, keepdb=True) == [1]
+    finally:
+        run_setup("groups", parallel=1)
@@ -0,0 +1,20 @@
+CREATE TABLE regions (
+  country                   TEXT                     NOT NULL,
+  code                      INTEGER                  NOT NULL,
+  name                      TEXT                     NOT NULL,
+  parent_code               INTEGER                  NULL,
+  PRIMARY KEY (country, code),
+  FOREIGN KEY (country, parent_code) REFERENCES regions (country, code)
+);
+CREATE TABLE offices (
+  id                        INTEGER                  NOT NULL PRIMARY KEY,
+  region_code               INTEGER                  NOT NULL,
+  country                   TEXT                     NOT NULL,
+  FOREIGN KEY (country, region_code) REFERENCES regions (country, code)
+);
+INSERT INTO regions (country, code, name, parent_code) VALUES
+  ('US', 1, 'North', NULL),
+  ('US', 2, 'New York', 1),
+  ('DE', 1, 'Bavaria', NULL),
+  ('DE', 2, 'Berlin', NULL);
+INSERT INTO offices (id, region_code, country) VALUES (1, 2, 'US'), (2, 2, 'DE');
@@ -1,8 +1,17 @@
 # coding: utf-8
+import csv
+import io
+import os
 import zipfile
 
 import pytest
 
+from xdump.base import INITIAL_SETUP_MEMBER, PROGRESS_TABLE_SQL
+from xdump.checkpoint import CheckpointError, Plan, WorkDir
+from xdump.sampling import Sample
+from xdump.utils import get_archive_id
+
+from ._compat import patch
 from .conftest import DATABASE, EMPLOYEES_SQL, IS_POSTGRES, IS_SQLITE
 
 
@@ -33,6 +42,16 @@ def test_logging_parametrized(backend, capsys):
     assert "Execution time: " in out
 
 
+def test_connection_pool(backend):
+    """The backend keeps its own connection, while workers could check out separate ones."""
+    connection = backend.get_connection()
+    assert backend.get_connection() is connection
+    with backend.connection() as worker_connection:
+        assert worker_connection is not connection
+    backend.cache_clear()
+    assert backend.get_connection() is not connection
+
+
 @pytest.mark.usefixtures("schema")
 def test_dump_schema(backend, db_helper):
     """Schema should not include any COPY statements."""
@@ -146,9 +165,9 @@ class TestHighLevelInterface:
         schema = archive.read("dump/schema.sql")
         db_helper.assert_schema(schema)
         if DATABASE == "postgres":
-            assert archive.namelist() == ["dump/schema.sql", "dump/sequences.sql"]
+            assert archive.namelist() == ["dump/schema.sql", "dump/sequences.sql", "dump/manifest.json"]
         else:
-            assert archive.namelist() == ["dump/schema.sql"]
+            assert archive.namelist() == ["dump/schema.sql", "dump/manifest.json"]
 
     @pytest.mark.usefixtures("schema", "data")
     def test_dump_data(self, backend, archive_filename):
@@ -159,7 +178,7 @@ class TestHighLevelInterface:
             dump_schema=False,
         )
         archive = zipfile.ZipFile(archive_filename)
-        assert archive.namelist() == ["dump/data/groups.csv", "dump/data/employees.csv"]
+        assert archive.namelist() == ["dump/data/groups.csv", "dump/data/employees.csv", "dump/manifest.json"]
 
     @pytest.mark.usefixtures("schema", "data")
     def test_skip_recreate(self, backend, archive_filename, db_helper, execute_file):
@@ -186,6 +205,339 @@ class TestHighLevelInterface:
             result = backend.run("SELECT nextval('groups_id_seq')")
             assert result[0]["nextval"] == 1
 
+    @pytest.mark.usefixtures("schema", "data")
+    @pytest.mark.parametrize(
+        "chunk_size, expected",
+        (
+            (None, ["dump/data/groups.csv", "dump/data/employees.csv"]),
+            (
+                2,
+                [
+                    "dump/data/groups.csv",
+                    "dump/data/employees.0001.csv",
+                    "dump/data/employees.0002.csv",
+                    "dump/data/employees.0003.csv",
+                ],
+            ),
+        ),
+    )
+    def test_load_tables(self, backend, archive_filename, chunk_size, expected):
+        """Only given tables and tables they refer to are loaded. All chunks of a table are loaded."""
+        backend.dump(archive_filename, ["tickets", "employees", "groups"], chunk_size=chunk_size)
+        backend.recreate_database()
+        with patch.object(zipfile.ZipFile, "open", autospec=True, side_effect=zipfile.ZipFile.open) as opened:
+            backend.load(archive_filename, tables=["employees"])
+        opened_files = [call[0][1] for call in opened.call_args_list if call[0][1].startswith("dump/data/")]
+        assert opened_files == expected
+        assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 5
+        assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+        assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 0
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_manifest(self, backend, archive_filename):
+        backend.dump(archive_filename, ["groups", "tickets"], {"employees": "SELECT * FROM employees WHERE id = 1"})
+        manifest = backend.read_manifest(zipfile.ZipFile(archive_filename))
+        assert {table_name: info["rows"] for table_name, info in manifest.tables.items()} == {
+            "groups": 2,
+            "tickets": 5,
+            "employees": 3,
+        }
+        assert manifest.restore_order == [["groups"], ["employees"], ["tickets"]]
+
+    @pytest.mark.usefixtures("schema", "data")
+    @pytest.mark.parametrize("work_dir", (False, True))
+    def test_introspect_once(self, backend, archive_filename, tmpdir, work_dir):
+        """Relations are introspected once for both related data and the manifest."""
+        work_dir = str(tmpdir.join("work")) if work_dir else None
+        with patch.object(backend, "introspect_foreign_keys", wraps=backend.introspect_foreign_keys) as introspect:
+            backend.dump(archive_filename, ["groups"], {"tickets": "SELECT * FROM tickets"}, work_dir=work_dir)
+        assert introspect.call_count == 1
+        manifest = backend.read_manifest(zipfile.ZipFile(archive_filename))
+        assert manifest.restore_order == [["groups"], ["employees"], ["tickets"]]
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_load_without_manifest(self, backend, archive_filename, tmpdir):
+        """Archives from older versions have no manifest."""
+        backend.dump(archive_filename, ["groups", "employees"], dump_schema=False)
+        old_archive_filename = str(tmpdir.join("old.zip"))
+        with zipfile.ZipFile(archive_filename) as archive, zipfile.ZipFile(old_archive_filename, "w") as old_archive:
+            for name in archive.namelist():
+                if name != backend.manifest_filename:
+                    old_archive.writestr(name, archive.read(name))
+        backend.truncate()
+        with patch.object(backend, "introspect_foreign_keys", wraps=backend.introspect_foreign_keys) as introspect:
+            backend.load(old_archive_filename, tables=["employees"])
+        assert introspect.call_count == 1
+        assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 5
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_load_unknown_tables(self, backend, archive_filename):
+        backend.dump(archive_filename, ["groups"], dump_schema=False)
+        with pytest.raises(ValueError, match="Tables are not found in the archive: tickets"):
+            backend.load(archive_filename, tables=["groups", "tickets"])
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_chunks(self, backend, archive_filename):
+        backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2)
+        archive = zipfile.ZipFile(archive_filename)
+        assert [name for name in archive.namelist() if name.startswith("dump/data/tickets")] == [
+            "dump/data/tickets.0001.csv",
+            "dump/data/tickets.0002.csv",
+            "dump/data/tickets.0003.csv",
+        ]
+        manifest = backend.read_manifest(archive)
+        assert manifest.tables["tickets"]["rows"] == 5
+        assert [item["rows"] for item in manifest.tables["tickets"]["files"]] == [2, 2, 1]
+        backend.truncate()
+        backend.load(archive_filename)
+        assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 5
+        assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 5
+
+    @pytest.mark.parametrize("compression", (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED))
+    @pytest.mark.parametrize("compression_jobs", (1, 3))
+    @pytest.mark.usefixtures("schema", "data")
+    def test_compression_jobs(self, backend, archive_filename, compression, compression_jobs):
+        backend.dump(
+            archive_filename,
+            ["groups", "employees", "tickets"],
+            dump_schema=False,
+            compression=compression,
+            chunk_size=2,
+            compression_jobs=compression_jobs,
+        )
+        archive = zipfile.ZipFile(archive_filename)
+        assert archive.testzip() is None
+        assert [info.compress_type for info in archive.infolist()] == [compression] * len(archive.infolist())
+        assert archive.namelist()[:2] == ["dump/data/groups.csv", "dump/data/employees.0001.csv"]
+        manifest = backend.read_manifest(archive)
+        assert manifest.tables["tickets"]["compressed_size"] == sum(
+            archive.getinfo(name).compress_size for name in archive.namelist() if name.startswith("dump/data/tickets")
+        )
+        backend.truncate()
+        backend.load(archive_filename)
+        assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 5
+
+    @pytest.mark.parametrize("read_ahead", (0, 1, 3))
+    @pytest.mark.usefixtures("schema", "data")
+    def test_read_ahead(self, backend, archive_filename, read_ahead):
+        backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2)
+        backend.truncate()
+        backend.load(archive_filename, read_ahead=read_ahead)
+        assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 5
+        if read_ahead:
+            assert backend.read_ahead_stats.members == 7
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_chunks_small_table(self, backend):
+        assert backend.get_table_chunks("groups", 10) == ["SELECT * FROM groups"]
+        assert backend.get_table_chunks("groups") == ["SELECT * FROM groups"]
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_merge(self, backend, archive_filename):
+        """Rows from the dump are inserted or updated, other rows are kept."""
+        backend.dump(archive_filename, ["groups", "employees"], dump_schema=False)
+        backend.run("UPDATE groups SET name = 'Changed' WHERE id = 2")
+        backend.run("INSERT INTO groups (id, name) VALUES (3, 'Extra')")
+        backend.run("DELETE FROM employees WHERE id = 5")
+        backend.load(archive_filename, merge=True)
+        assert backend.run("SELECT id, name FROM groups ORDER BY id") == [
+            {"id": 1, "name": "Admin"},
+            {"id": 2, "name": "User"},
+            {"id": 3, "name": "Extra"},
+        ]
+        assert backend.run("SELECT id, last_name FROM employees WHERE id = 5") == [{"id": 5, "last_name": "Snow"}]
+        assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 5
+
+    @pytest.mark.usefixtures("schema")
+    def test_merge_without_primary_key(self, backend, archive_filename, cursor):
+        cursor.execute("CREATE TABLE logs (message TEXT)")
+        cursor.execute("INSERT INTO logs (message) VALUES ('Message')")
+        backend.dump(archive_filename, ["logs"], dump_schema=False)
+        with pytest.raises(ValueError, match="Table logs has no primary key, its rows could not be merged"):
+            backend.load(archive_filename, merge=True)
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_verify(self, backend, archive_filename):
+        """Digests, calculated by the database, match digests of the archive."""
+        backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2)
+        assert backend.verify(archive_filename) == []
+        backend.run("UPDATE employees SET last_name = 'Changed' WHERE id = 4")
+        backend.run("DELETE FROM tickets WHERE id = 1")
+        differences = backend.verify(archive_filename, range_size=2)
+        assert [str(difference) for difference in differences] == [
+            "employees: keys 4..5 differ (2 rows vs 2 rows)",
+            "tickets: keys 0..1 differ (1 rows vs 0 rows)",
+        ]
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_transforms(self, backend, archive_filename, db_helper):
+        """Columns are transformed by the database in export queries of full, chunked and partial tables."""
+        backend.dump(
+            archive_filename,
+            ["groups", "employees"],
+            {"tickets": "SELECT * FROM tickets WHERE id = 1"},
+            dump_schema=False,
+            chunk_size=3,
+            transforms={
+                "employees": {"last_name": "'Hidden'", "first_name": "first_name || '!'"},
+                "tickets": {"message": "upper(message)"},
+                "unknown": {"column": "NULL"},
+            },
+        )
+        archive = zipfile.ZipFile(archive_filename)
+        rows = [
+            row
+            for name in archive.namelist()
+            if name.startswith("dump/data/employees.")
+            for row in self.read_rows(archive, name)
+        ]
+        assert {(row["first_name"], row["last_name"]) for row in rows} == {("John!", "Hidden")}
+        assert len(rows) == 5
+        db_helper.assert_content(archive, "tickets", {TICKETS_HEADER, b"1,1,Sub 1,MESSAGE 1"})
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_transforms_unknown_column(self, backend, archive_filename):
+        with pytest.raises(ValueError, match="Transformed columns are not found in `groups` table: email"):
+            backend.dump(archive_filename, ["groups"], transforms={"groups": {"email": "NULL"}})
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_columns(self, backend, archive_filename, db_helper):
+        """Omitted columns are still used to select related data and are filled with defaults on load."""
+        backend.dump(
+            archive_filename,
+            ["groups"],
+            {"employees": "SELECT * FROM employees WHERE id = 2"},
+            dump_schema=False,
+            columns={"employees": {"exclude": ["manager_id", "referrer_id"]}, "groups": {"include": ["name", "id"]}},
+        )
+        archive = zipfile.ZipFile(archive_filename)
+        db_helper.assert_content(
+            archive, "employees", {b"id,first_name,last_name,group_id", b"1,John,Doe,1", b"2,John,Black,1"}
+        )
+        db_helper.assert_content(archive, "groups", {b"id,name", b"1,Admin", b"2,User"})
+        backend.truncate()
+        backend.load(archive_filename)
+        assert backend.run("SELECT id, manager_id FROM employees ORDER BY id") == [
+            {"id": 1, "manager_id": None},
+            {"id": 2, "manager_id": None},
+        ]
+
+    def interrupt_dump(self, backend, archive_filename, work_dir):
+        """Fails the export of the second data file. Returns queries of the exported ones."""
+        export_to_csv = backend.export_to_csv
+        queries = []
+
+        def export(sql, connection=None):
+            queries.append(sql)
+            if len(queries) == 2:
+                raise RuntimeError("Interrupted")
+            return export_to_csv(sql, connection)
+
+        with patch.object(backend, "export_to_csv", side_effect=export):
+            with pytest.raises(RuntimeError, match="Interrupted"):
+                backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL}, work_dir=work_dir)
+        if IS_SQLITE:
+            # As if the process died - SQLite has no snapshots and its dump transaction is not finished
+            backend.cache_clear()
+        return queries
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_resume(self, backend, archive_filename, db_helper, tmpdir):
+        """Already exported data files are not exported again."""
+        work_dir = str(tmpdir.join("work"))
+        queries = self.interrupt_dump(backend, archive_filename, work_dir)
+        assert not os.path.exists(archive_filename)
+        assert WorkDir(work_dir).exists("dump/data/groups.csv")
+        with patch.object(backend, "export_to_csv", wraps=backend.export_to_csv) as export:
+            backend.dump(archive_filename, work_dir=work_dir, resume=True)
+        assert [call[0][0] for call in export.call_args_list] == queries[1:]
+        db_helper.assert_dump(archive_filename)
+        manifest = backend.read_manifest(zipfile.ZipFile(archive_filename))
+        assert manifest.restore_order == [["groups"], ["employees"]]
+        # The rest of data files is exported from the same state of the database
+        assert manifest.source["state"] is not None
+        assert not os.path.exists(work_dir)
+
+    @pytest.mark.usefixtures("schema", "data")
+    @pytest.mark.parametrize("state", ("changed", None))
+    def test_resume_changed_database(self, backend, archive_filename, tmpdir, state):
+        """Without a snapshot the dump is resumed only if the database is not changed."""
+        work_dir = str(tmpdir.join("work"))
+        with patch.object(backend, "supports_snapshots", False):
+            self.interrupt_dump(backend, archive_filename, work_dir)
+        with patch.object(backend, "get_source_state", return_value=state):
+            with pytest.raises(CheckpointError, match="The database is changed since the interrupted dump was started"):
+                backend.dump(archive_filename, work_dir=work_dir, resume=True)
+        assert not os.path.exists(archive_filename)
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_checkpoints_cleanup(self, backend, archive_filename, db_helper, tmpdir):
+        """Only checkpoints are removed from the work directory."""
+        work_dir = tmpdir.mkdir("work")
+        work_dir.join("notes.txt").write("")
+        backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL}, work_dir=str(work_dir))
+        db_helper.assert_dump(archive_filename)
+        assert os.listdir(str(work_dir)) == ["notes.txt"]
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_resume_without_plan(self, backend, archive_filename, tmpdir):
+        with pytest.raises(CheckpointError, match="There is no interrupted dump in"):
+            backend.dump(archive_filename, work_dir=str(tmpdir), resume=True)
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_unfinished_dump(self, backend, archive_filename, tmpdir):
+        """An interrupted dump is not overwritten by a new one."""
+        WorkDir(str(tmpdir)).write_plan(Plan(tasks=[]))
+        with pytest.raises(CheckpointError, match="contains an interrupted dump"):
+            backend.dump(archive_filename, ["groups"], work_dir=str(tmpdir))
+
+    @pytest.mark.usefixtures("schema", "data", "dump")
+    def test_resume_load(self, backend, archive_filename):
+        """Committed tables are not loaded again."""
+        backend.recreate_database()
+        load_data_file = backend.load_data_file
+
+        def load(table_name, fd, connection=None):
+            if table_name == "employees":
+                raise RuntimeError("Interrupted")
+            return load_data_file(table_name, fd, connection)
+
+        with patch.object(backend, "load_data_file", side_effect=load):
+            with pytest.raises(RuntimeError, match="Interrupted"):
+                backend.load(archive_filename, resumable=True)
+        # As if the process died
+        backend.cache_clear()
+        assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+        assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 0
+        assert backend.table_exists("xdump_progress")
+
+        with patch.object(backend, "load_data_file", wraps=backend.load_data_file) as loader:
+            backend.load(archive_filename, resume=True)
+        assert [call[0][0] for call in loader.call_args_list] == ["employees"]
+        assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+        assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 4
+        assert not backend.table_exists("xdump_progress")
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_resume_another_archive(self, backend, archive_filename, tmpdir):
+        """Progress of a different archive is not taken into account."""
+        backend.dump(archive_filename, ["groups"], dump_schema=False)
+        with zipfile.ZipFile(archive_filename) as archive:
+            other_id = get_archive_id(archive)
+        # Now it is a different archive
+        with zipfile.ZipFile(archive_filename, "a") as archive:
+            archive.writestr("dump/notes.txt", "")
+        backend.truncate()
+        backend.run(PROGRESS_TABLE_SQL)
+        backend.mark_loaded(other_id, [INITIAL_SETUP_MEMBER, "dump/data/groups.csv"])
+        backend.get_connection().commit()
+        backend.load(archive_filename, resume=True, merge=True)
+        assert backend.run('SELECT COUNT(*) AS "count" FROM groups')[0]["count"] == 2
+        assert not backend.table_exists("xdump_progress")
+
+    def read_rows(self, archive, name):
+        return list(csv.DictReader(io.StringIO(archive.read(name).decode())))
+
     @pytest.mark.usefixtures("schema", "data")
     def test_truncate_load(self, backend, archive_filename, db_helper):
         backend.dump(
@@ -206,6 +558,60 @@ class TestHighLevelInterface:
             {"id": 1, "first_name": "John", "last_name": "Doe"}
         ]
 
+    @pytest.mark.usefixtures("schema", "data")
+    @pytest.mark.parametrize("checkpoints", (False, True))
+    def test_skip_unchanged(self, backend, archive_filename, cursor, tmpdir, checkpoints):
+        """The archive is not made again if neither the database nor dump parameters are changed."""
+        work_dir = str(tmpdir.join("work")) if checkpoints else None
+
+        def dump(**kwargs):
+            result = backend.dump(archive_filename, ["groups"], work_dir=work_dir, skip_unchanged=True, **kwargs)
+            # The next dump is made in a new transaction, as in another run
+            backend.cache_clear()
+            return result
+
+        assert dump()
+        source = backend.read_manifest(zipfile.ZipFile(archive_filename)).source
+        assert source["state"] is not None
+        with patch.object(backend, "export_to_csv") as export:
+            assert not dump()
+        assert not export.called
+        assert dump(dump_schema=False)
+        assert not dump(dump_schema=False)
+        cursor.execute("UPDATE groups SET name = 'Changed' WHERE id = 1")
+        assert dump(dump_schema=False)
+        assert backend.read_manifest(zipfile.ZipFile(archive_filename)).source["state"] != source["state"]
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_skip_unchanged_another_archive(self, backend, archive_filename, tmpdir):
+        """Archives without the source are made again."""
+        filename = str(tmpdir.join("other.zip"))
+        with zipfile.ZipFile(filename, "w") as archive:
+            archive.writestr("dump/data/groups.csv", "id,name\n")
+        assert backend.dump(filename, ["groups"], skip_unchanged=True)
+        backend.cache_clear()
+        assert backend.dump(archive_filename, ["groups"], skip_unchanged=True)
+
+
+@pytest.mark.usefixtures("schema", "data")
+@pytest.mark.parametrize("batch_size", (1, 500))
+def test_get_non_empty_tables(backend, cursor, batch_size):
+    cursor.execute("DELETE FROM tickets")
+    with patch("xdump.base.PROBE_BATCH_SIZE", batch_size):
+        assert backend.get_non_empty_tables(["groups", "tickets", "employees"]) == ["groups", "employees"]
+
+
+@pytest.mark.usefixtures("schema", "data")
+@pytest.mark.parametrize("skip_empty", (True, False))
+def test_truncate(backend, cursor, skip_empty):
+    cursor.execute("DELETE FROM tickets")
+    with patch.object(backend, "run", wraps=backend.run) as run:
+        backend.truncate(skip_empty=skip_empty)
+    cleanups = [call[0][0] for call in run.call_args_list if call[0][0].startswith(("TRUNCATE", "DELETE"))]
+    assert any("tickets" in sql for sql in cleanups) is not skip_empty
+    for table_name in ("groups", "employees", "tickets"):
+        assert backend.run('SELECT COUNT(*) AS "count" FROM {0}'.format(table_name))[0]["count"] == 0
+
 
 @pytest.mark.usefixtures("schema")
 def test_write_schema(backend, db_helper, archive):
@@ -333,3 +739,73 @@ class TestAutoSelect:
     def test_multiple_recursive_relations(self):
         self.assert_content("employees", {EMPLOYEES_HEADER, SNOW, BROWN, SMITH, DOE})
         self.assert_all_groups()
+
+
+class TestCompositeKeys:
+    @pytest.fixture(autouse=True)
+    def setup(self, execute_file):
+        execute_file("sql/composite.sql")
+
+    def test_introspection(self, backend):
+        """Columns of composite keys are paired by their positions in the constraint."""
+        foreign_keys = sorted(
+            (foreign_key["table_name"], foreign_key["column_name"], foreign_key["foreign_column_name"])
+            for foreign_key in backend.introspect_foreign_keys()
+        )
+        assert foreign_keys == [
+            ("offices", ["country", "region_code"], ["country", "code"]),
+            ("regions", ["country", "parent_code"], ["country", "code"]),
+        ]
+
+    def test_related_data(self, backend, archive_filename, db_helper):
+        """Related rows are selected by all columns of the key, including self-references."""
+        backend.dump(archive_filename, [], {"offices": "SELECT * FROM offices WHERE id = 1"})
+        archive = zipfile.ZipFile(archive_filename)
+        db_helper.assert_content(archive, "offices", {b"id,region_code,country", b"1,2,US"})
+        db_helper.assert_content(
+            archive, "regions", {b"country,code,name,parent_code", b"US,1,North,", b"US,2,New York,1"}
+        )
+
+
+class TestSampling:
+    def read_rows(self, archive, table):
+        return list(csv.DictReader(io.StringIO(archive.read("dump/data/{}.csv".format(table)).decode())))
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_full_sample(self, backend, archive_filename):
+        backend.dump(archive_filename, samples={"tickets": Sample(100)})
+        archive = zipfile.ZipFile(archive_filename)
+        assert len(self.read_rows(archive, "tickets")) == 5
+        assert len(self.read_rows(archive, "employees")) == 3
+
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.usefixtures("schema", "data")
+    def test_related_data(self, backend, archive_filename, seed):
+        """Related data should be selected for the same sampled rows."""
+        backend.dump(archive_filename, samples={"employees": Sample(50, seed=seed)})
+        archive = zipfile.ZipFile(archive_filename)
+        employees = {row["id"] for row in self.read_rows(archive, "employees")}
+        groups = {row["id"] for row in self.read_rows(archive, "groups")} if employees else set()
+        for row in self.read_rows(archive, "employees"):
+            assert row["manager_id"] in employees | {""}
+            assert row["group_id"] in groups
+
+    @pytest.mark.usefixtures("schema", "data")
+    def test_seed(self, backend):
+        sql = backend.get_sample_sql("employees", Sample(50, seed=42))
+        assert backend.run(sql) == backend.run(sql)
+
+    def test_intersection_error(self, backend, archive_filename):
+        with pytest.raises(ValueError, match="`samples` should not contain tables from `partial_tables`"):
+            backend.dump(archive_filename, [], {"employees": EMPLOYEES_SQL}, samples={"employees": Sample(5)})
+
+
+@pytest.mark.parametrize("percent", (0, -1, 101))
+def test_invalid_sample_percent(percent):
+    with pytest.raises(ValueError):
+        Sample(percent)
+
+
+def test_invalid_sample_method():
+    with pytest.raises(ValueError):
+        Sample(5, method="unknown")
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+from xdump.checkpoint import PLAN_VERSION, CheckpointError, Plan, WorkDir
+
+
+@pytest.fixture
+def work_dir(tmpdir):
+    return WorkDir(str(tmpdir.join("work")))
+
+
+def test_plan_roundtrip():
+    plan = Plan(
+        tasks=[("groups", "dump/data/groups.csv", "SELECT * FROM groups")],
+        snapshot="00000003-0000001B-1",
+        initial_setup_files=["dump/schema.sql"],
+    )
+    loaded = Plan.loads(plan.dumps().encode("utf-8"))
+    assert loaded.tasks == plan.tasks
+    assert loaded.snapshot == plan.snapshot
+    assert loaded.initial_setup_files == plan.initial_setup_files
+    assert loaded.foreign_keys is None
+
+
+def test_unsupported_plan_version():
+    data = json.loads(Plan(tasks=[]).dumps())
+    data["version"] = PLAN_VERSION + 1
+    with pytest.raises(CheckpointError, match="Unsupported plan version: 2. Maximum supported version is 1"):
+        Plan.loads(json.dumps(data))
+
+
+def test_writestr(work_dir):
+    work_dir.writestr("dump/schema.sql", u"CREATE TABLE groups (id INTEGER)")
+    work_dir.writestr("dump/data/groups.csv", b"id\n1\n")
+    assert work_dir.read("dump/schema.sql") == b"CREATE TABLE groups (id INTEGER)"
+    assert work_dir.exists("dump/data/groups.csv")
+    assert not work_dir.exists("dump/data/employees.csv")
+    assert sorted(os.listdir(os.path.join(work_dir.path, "dump", "data"))) == ["groups.csv"]
+
+
+def test_clear(work_dir):
+    work_dir.write_plan(Plan(tasks=[]))
+    work_dir.writestr("dump/schema.sql", b"")
+    work_dir.writestr("dump/data/groups.csv", b"id\n1\n")
+    work_dir.writestr("dump/data/other.csv", b"")
+    work_dir.clear(["dump/schema.sql", "dump/data/groups.csv"])
+    assert not work_dir.has_plan()
+    assert os.listdir(work_dir.path) == ["dump"]
+    work_dir.clear(["dump/data/other.csv"])
+    assert not os.path.exists(work_dir.path)
@@ -0,0 +1,44 @@
+# coding: utf-8
+import sys
+import zipfile
+
+import pytest
+
+from xdump.compression import can_write_compressed, compress, write_compressed
+
+from ._compat import patch
+
+METHODS = [zipfile.ZIP_DEFLATED]
+if sys.version_info[0] == 3:
+    METHODS.extend([zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA])
+DATA = b"id,name\n" + b"".join(b"%d,Name %d\n" % (number, number) for number in range(1000))
+
+
+@pytest.mark.parametrize("compress_type", METHODS)
+@pytest.mark.parametrize("internals", (True, False))
+def test_write_compressed(archive_filename, compress_type, internals):
+    with patch("xdump.compression.can_write_compressed", return_value=internals):
+        with zipfile.ZipFile(archive_filename, "w", compress_type) as file:
+            file.writestr("first.csv", b"id\n1\n")
+            info = write_compressed(file, "second.csv", compress(DATA, compress_type))
+            file.writestr("third.csv", b"id\n3\n")
+    assert info.file_size == len(DATA)
+    assert info.compress_size < len(DATA)
+    with zipfile.ZipFile(archive_filename) as file:
+        assert file.testzip() is None
+        assert file.namelist() == ["first.csv", "second.csv", "third.csv"]
+        assert file.getinfo("second.csv").compress_type == compress_type
+        assert file.read("second.csv") == DATA
+        assert file.read("third.csv") == b"id\n3\n"
+
+
+@pytest.mark.skipif(sys.version_info[:2] > (3, 7), reason="Checked only on supported Python versions")
+def test_zipfile_internals(archive_filename):
+    """Private members of ``ZipFile``, that are used to append compressed data, should not be changed silently."""
+    with zipfile.ZipFile(archive_filename, "w") as file:
+        assert can_write_compressed(file)
+
+
+def test_unsupported_method():
+    with pytest.raises(ValueError, match="Unsupported compression method: 0"):
+        compress(DATA, zipfile.ZIP_STORED)
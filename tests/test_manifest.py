@@ -0,0 +1,81 @@
+import pytest
+
+from xdump.manifest import MANIFEST_VERSION, Manifest
+
+
+@pytest.fixture
+def manifest(archive):
+    manifest = Manifest()
+    for table_name, data in (("employees", b"id,group_id\n1,1\n"), ("groups", b"id,name\n1,Admin\n2,User\n")):
+        filename = "dump/data/{0}.csv".format(table_name)
+        archive.writestr(filename, data)
+        manifest.add_file(table_name, archive.getinfo(filename), data)
+    manifest.set_dependencies({"employees": {"employees", "groups", "unknown"}})
+    return manifest
+
+
+def test_add_file(manifest, archive):
+    info = archive.getinfo("dump/data/groups.csv")
+    assert manifest.tables["groups"] == {
+        "rows": 2,
+        "size": 23,
+        "compressed_size": info.compress_size,
+        "files": [
+            {
+                "file": "dump/data/groups.csv",
+                "rows": 2,
+                "size": 23,
+                "compressed_size": info.compress_size,
+                "sha256": "b82e0a8ed81e746f26dde3ea6f565c01299473a19a568fdb8cd0ab6285da3984",
+            }
+        ],
+    }
+
+
+def test_multiple_files(manifest, archive):
+    archive.writestr("dump/data/groups.0002.csv", b"id,name\n3,Guest\n")
+    manifest.add_file("groups", archive.getinfo("dump/data/groups.0002.csv"), b"id,name\n3,Guest\n")
+    assert manifest.tables["groups"]["rows"] == 3
+    assert manifest.tables["groups"]["size"] == 39
+    assert manifest.get_data_files() == [
+        ("groups", "dump/data/groups.csv"),
+        ("groups", "dump/data/groups.0002.csv"),
+        ("employees", "dump/data/employees.csv"),
+    ]
+
+
+def test_restore_order(manifest):
+    assert manifest.dependencies == {"employees": ["employees", "groups"], "groups": []}
+    assert manifest.restore_order == [["groups"], ["employees"]]
+    assert manifest.get_data_files() == [("groups", "dump/data/groups.csv"), ("employees", "dump/data/employees.csv")]
+
+
+def test_is_self_referencing(manifest):
+    assert manifest.is_self_referencing("employees")
+    assert not manifest.is_self_referencing("groups")
+
+
+def test_serialization(manifest):
+    loaded = Manifest.loads(manifest.dumps().encode())
+    assert loaded.version == MANIFEST_VERSION
+    assert loaded.tables == manifest.tables
+    assert loaded.restore_order == manifest.restore_order
+    assert loaded.source is None
+
+
+def test_source_serialization(manifest):
+    manifest.source = {"state": {"counter": 1, "files": [["test.db", 8192, 1.5]]}, "parameters": "0" * 64}
+    assert Manifest.loads(manifest.dumps()).source == manifest.source
+
+
+def test_without_source():
+    """Manifests of older versions don't have the source."""
+    manifest = Manifest.loads('{"version": 1, "tables": {}, "dependencies": {}, "restore_order": []}')
+    assert manifest.source is None
+
+
+def test_unsupported_version():
+    with pytest.raises(ValueError, match="Unsupported manifest version"):
+        Manifest.loads(
+            '{"version": %d, "tables": {}, "dependencies": {}, "restore_order": []}' % (MANIFEST_VERSION + 1)
+        )
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from xdump.pipe import Pipe, PipeClosed
+
+
+def write_chunks(pipe, chunks):
+    for chunk in chunks:
+        pipe.write(chunk)
+    pipe.close_writer()
+
+
+def test_read():
+    pipe = Pipe(maxsize=2)
+    chunks = [b"id,name\n"] + [u"{0},Group {0}\n".format(i).encode() for i in range(100)]
+    writer = threading.Thread(target=write_chunks, args=(pipe, chunks))
+    writer.start()
+    data = b""
+    while True:
+        chunk = pipe.read(7)
+        if not chunk:
+            break
+        assert len(chunk) <= 7
+        data += chunk
+    writer.join()
+    assert data == b"".join(chunks)
+
+
+def test_read_all():
+    pipe = Pipe()
+    write_chunks(pipe, [b"foo", b"", b"bar"])
+    assert pipe.read() == b"foobar"
+    assert pipe.read() == b""
+
+
+def test_readline():
+    pipe = Pipe()
+    write_chunks(pipe, [b"id,na", b"me\n1,Admin\n2,", b"User"])
+    assert pipe.readline() == b"id,name\n"
+    assert pipe.readline() == b"1,Admin\n"
+    assert pipe.read() == b"2,User"
+    assert pipe.readline() == b""
+
+
+def test_closed_reader():
+    """When the reader is gone, a blocked writer should not hang forever."""
+    pipe = Pipe(maxsize=1)
+    pipe.write(b"foo")
+    pipe.close()
+    with pytest.raises(PipeClosed):
+        pipe.write(b"bar")
+
+
+def test_closed_writer():
+    pipe = Pipe()
+    pipe.close()
+    with pytest.raises(PipeClosed):
+        pipe.read(1)
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from xdump.pool import ConnectionPool, PoolError
+
+from ._compat import Mock
+
+
+@pytest.fixture
+def connect():
+    return Mock(side_effect=lambda: Mock())
+
+
+def test_min_size(connect):
+    pool = ConnectionPool(connect, min_size=2, max_size=3)
+    assert connect.call_count == 2
+    assert pool.size == 2
+
+
+@pytest.mark.parametrize("min_size, max_size", ((2, 1), (0, 0), (-1, 1)))
+def test_invalid_size(connect, min_size, max_size):
+    with pytest.raises(ValueError):
+        ConnectionPool(connect, min_size=min_size, max_size=max_size)
+
+
+def test_reuse(connect):
+    pool = ConnectionPool(connect)
+    with pool.connection() as first:
+        pass
+    first.rollback.assert_called_once_with()
+    with pool.connection() as second:
+        assert second is first
+    assert connect.call_count == 1
+
+
+def test_max_size(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=1)
+    connection = pool.acquire()
+    with pytest.raises(PoolError):
+        pool.acquire(timeout=0.01)
+    pool.release(connection)
+    assert pool.acquire(timeout=0.01) is connection
+
+
+def test_wait_for_release(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=1)
+    connection = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    pool.release(connection)
+    waiter.join()
+    assert acquired == [connection]
+
+
+def test_health_check(connect):
+    pool = ConnectionPool(connect, is_usable=lambda connection: not connection.broken)
+    connection = pool.acquire()
+    connection.broken = True
+    pool.release(connection)
+    new_connection = pool.acquire()
+    new_connection.broken = False
+    assert new_connection is not connection
+    connection.close.assert_called_once_with()
+    assert pool.size == 1
+
+
+def test_failed_rollback(connect):
+    pool = ConnectionPool(connect)
+    connection = pool.acquire()
+    connection.rollback.side_effect = RuntimeError
+    pool.release(connection)
+    connection.close.assert_called_once_with()
+    assert pool.size == 0
+
+
+def test_failed_connect():
+    pool = ConnectionPool(Mock(side_effect=RuntimeError), min_size=0, max_size=1)
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    assert pool.size == 0
+
+
+def test_close(connect):
+    pool = ConnectionPool(connect, min_size=2)
+    idle, used = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    idle.close.assert_called_once_with()
+    assert not used.close.called
+    pool.release(used)
+    used.close.assert_called_once_with()
+    with pytest.raises(PoolError):
+        pool.acquire()
@@ -1,6 +1,9 @@
 # coding: utf-8
 import pytest
 
+from xdump.checkpoint import CheckpointError, WorkDir
+from xdump.postgresql import get_staging_table_name
+
 from ._compat import Mock, patch
 from .conftest import is_search_path_fixed
 
@@ -83,3 +86,185 @@ def test_run_dump_environment_empty_password(backend):
 def test_postgres_version(version, is_fixed):
     mocked_connection = Mock(server_version=version)
     assert is_search_path_fixed(mocked_connection) == is_fixed
+
+
+@pytest.fixture
+def target_backend(backend, db_helper):
+    from xdump.postgresql import PostgreSQLBackend
+
+    dbname = db_helper.get_new_database_name()
+    backend.drop_database(dbname)
+    backend.create_database(dbname, backend.user)
+    return PostgreSQLBackend(
+        dbname=dbname, user=backend.user, password=backend.password, host=backend.host, port=backend.port
+    )
+
+
+@pytest.mark.parametrize("jobs", (1, 4))
+@pytest.mark.usefixtures("schema", "data")
+def test_transfer(backend, target_backend, jobs):
+    with patch.object(backend, "introspect_foreign_keys", wraps=backend.introspect_foreign_keys) as introspect:
+        backend.transfer(target_backend, ["groups"], {"tickets": "SELECT * FROM tickets WHERE id = 2"}, jobs=jobs)
+    # Relations are introspected once for both related data and the transfer order
+    assert introspect.call_count == 1
+    assert target_backend.run("SELECT name FROM groups ORDER BY id") == [{"name": "Admin"}, {"name": "User"}]
+    assert target_backend.run("SELECT id FROM employees ORDER BY id") == [{"id": 1}, {"id": 2}]
+    assert target_backend.run("SELECT id FROM tickets") == [{"id": 2}]
+    assert target_backend.run("SELECT currval('groups_id_seq')")[0]["currval"] == 2
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_transfer_transforms(backend, target_backend):
+    backend.transfer(target_backend, ["groups"], transforms={"groups": {"name": "upper(name)"}})
+    assert target_backend.run("SELECT name FROM groups ORDER BY id") == [{"name": "ADMIN"}, {"name": "USER"}]
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_transfer_columns(backend, target_backend):
+    backend.transfer(target_backend, ["groups", "employees"], columns={"employees": {"exclude": ["manager_id"]}})
+    assert target_backend.run("SELECT COUNT(*) FROM employees WHERE manager_id IS NULL")[0]["count"] == 5
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_transfer_error(backend, target_backend):
+    import psycopg2
+
+    with pytest.raises(psycopg2.ProgrammingError):
+        backend.transfer(target_backend, ["groups"], {"employees": "SELECT * FROM unknown"})
+
+
+@pytest.mark.usefixtures("schema")
+def test_get_dependencies(backend):
+    assert backend.get_dependencies(["groups", "employees", "tickets"]) == {
+        "employees": {"employees", "groups"},
+        "tickets": {"employees"},
+    }
+
+
+@pytest.mark.parametrize("method", ("system", "bernoulli"))
+def test_get_sample_sql(backend, method):
+    from xdump.sampling import Sample
+
+    assert backend.get_sample_sql("tickets", Sample("2.5", seed=42, method=method)) == (
+        "SELECT * FROM tickets TABLESAMPLE {0} (2.5) REPEATABLE (42)".format(method.upper())
+    )
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_get_chunk_key(backend):
+    assert backend.get_chunk_key("tickets") == "id"
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_concurrent_dump_load(backend, archive_filename):
+    backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2, jobs=2)
+    backend.truncate()
+    backend.load(archive_filename, jobs=2)
+    backend.cache_clear()
+    assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 5
+    assert backend.run('SELECT COUNT(*) AS "count" FROM employees')[0]["count"] == 5
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_concurrent_merge(backend, archive_filename):
+    """Only rows, that differ from the dump, are updated."""
+    backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2)
+    backend.run("UPDATE groups SET name = 'Changed' WHERE id = 2")
+    backend.run("DELETE FROM tickets WHERE id = 5")
+    backend.run("COMMIT")
+    versions = {row["id"]: row["xmin"] for row in backend.run("SELECT id, xmin::text FROM groups")}
+    backend.load(archive_filename, jobs=2, merge=True)
+    backend.cache_clear()
+    assert backend.run("SELECT name FROM groups WHERE id = 2") == [{"name": "User"}]
+    rows = backend.run("SELECT id, xmin::text FROM groups")
+    updated = {row["id"] for row in rows if row["xmin"] != versions[row["id"]]}
+    assert updated == {2}
+    assert backend.run('SELECT COUNT(*) AS "count" FROM tickets')[0]["count"] == 5
+
+
+def test_staging_table_name():
+    """Long table names with the same prefix don't collide after the truncation to 63 characters."""
+    names = {get_staging_table_name("t" * 70 + suffix) for suffix in ("a", "b")}
+    assert len(names) == 2
+    assert all(len(name) <= 63 for name in names)
+
+
+def test_merge_long_table_name(backend, archive_filename):
+    table_name = "t" * 63
+    backend.run("CREATE TABLE {0} (id INTEGER PRIMARY KEY, name TEXT)".format(table_name))
+    backend.run("INSERT INTO {0} VALUES (1, 'A'), (2, 'B')".format(table_name))
+    backend.run("COMMIT")
+    backend.dump(archive_filename, [table_name], dump_schema=False)
+    backend.run("UPDATE {0} SET name = 'Changed' WHERE id = 2".format(table_name))
+    backend.run("COMMIT")
+    backend.load(archive_filename, merge=True)
+    backend.cache_clear()
+    assert backend.run("SELECT name FROM {0} ORDER BY id".format(table_name)) == [{"name": "A"}, {"name": "B"}]
+
+
+@pytest.fixture
+def expired_snapshot(backend, archive_filename, tmpdir):
+    """Work directory of a dump, that was interrupted together with its process."""
+    work_dir = str(tmpdir.join("work"))
+    with patch.object(backend, "export_to_csv", side_effect=RuntimeError("Interrupted")):
+        with pytest.raises(RuntimeError, match="Interrupted"):
+            backend.dump(archive_filename, ["groups", "employees"], work_dir=work_dir, jobs=2)
+    snapshot = WorkDir(work_dir).read_plan().snapshot
+    assert backend.is_snapshot_valid(snapshot)
+    # The snapshot is released when the exporting transaction ends
+    backend.cache_clear()
+    assert not backend.is_snapshot_valid(snapshot)
+    return work_dir
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_resume_expired_snapshot(backend, archive_filename, db_helper, expired_snapshot):
+    """If the database is not changed since the snapshot was exported, the rest is exported in one transaction."""
+    backend.dump(archive_filename, work_dir=expired_snapshot, resume=True, jobs=2)
+    db_helper.assert_dump(archive_filename)
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_resume_expired_snapshot_changed_database(backend, archive_filename, expired_snapshot):
+    backend.run("UPDATE groups SET name = 'Changed' WHERE id = 2")
+    backend.run("COMMIT")
+    with pytest.raises(CheckpointError, match="The database is changed since the interrupted dump was started"):
+        backend.dump(archive_filename, work_dir=expired_snapshot, resume=True)
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_concurrent_resumable_load(backend, archive_filename):
+    backend.dump(archive_filename, ["groups", "employees", "tickets"], chunk_size=2)
+    backend.recreate_database()
+    backend.load(archive_filename, jobs=2, resumable=True)
+    assert backend.run("SELECT COUNT(*) FROM tickets")[0]["count"] == 5
+    assert not backend.table_exists("xdump_progress")
+
+
+@pytest.mark.usefixtures("schema", "data")
+def test_truncate_restarts_sequences_of_empty_tables(backend):
+    backend.run("DELETE FROM tickets")
+    backend.truncate(skip_empty=True)
+    assert backend.run("SELECT nextval('tickets_id_seq')")[0]["nextval"] == 1
+    assert backend.run("SELECT nextval('groups_id_seq')")[0]["nextval"] == 1
+
+
+@pytest.mark.usefixtures("schema", "data")
+@pytest.mark.parametrize("skip_empty", (False, True))
+def test_load_frozen(backend, archive_filename, skip_empty):
+    """Tables, truncated in the same transaction, are loaded with COPY FREEZE."""
+    backend.dump(archive_filename, ["groups", "employees", "tickets"], dump_schema=False)
+    backend.run("COMMIT")
+    backend.run("DELETE FROM tickets")
+    backend.truncate(skip_empty=skip_empty)
+    assert backend.is_new_in_transaction("groups")
+    # Empty tables are not truncated with `skip_empty`
+    assert backend.is_new_in_transaction("tickets") is not skip_empty
+    with patch.object(backend, "copy_expert", wraps=backend.copy_expert) as copy_expert:
+        backend.load(archive_filename)
+    statements = {call[0][0].split()[1]: call[0][0] for call in copy_expert.call_args_list}
+    assert statements["groups"].endswith("WITH (FORMAT CSV, FREEZE)")
+    assert statements["employees"].endswith("WITH (FORMAT CSV, FREEZE)")
+    assert statements["tickets"].endswith("WITH CSV" if skip_empty else "WITH (FORMAT CSV, FREEZE)")
+    assert backend.run("SELECT COUNT(*) FROM employees")[0]["count"] == 5
+    assert not backend.is_new_in_transaction("groups")
@@ -0,0 +1,60 @@
+import zipfile
+
+import pytest
+
+from xdump.prefetch import MEGABYTE, READ_AHEAD_BLOCK_SIZE, ReadAhead
+
+NAMES = ["dump/data/table_{0}.csv".format(number) for number in range(10)]
+
+
+@pytest.fixture
+def members(archive_filename):
+    with zipfile.ZipFile(archive_filename, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in NAMES:
+            archive.writestr(name, name.encode() * 100)
+    return zipfile.ZipFile(archive_filename)
+
+
+@pytest.mark.parametrize("block_size", (100, MEGABYTE))
+def test_read_ahead(members, block_size):
+    reader = ReadAhead(members, NAMES, 1, block_size)
+    assert [(name, fd.read()) for name, fd in reader] == [(name, name.encode() * 100) for name in NAMES]
+    assert reader.stats.members == 10
+    assert reader.stats.size == sum(len(name) * 100 for name in NAMES)
+    assert reader.stats.max_buffered >= 1
+
+
+def test_big_member(archive_filename):
+    """Members are not held in memory as a whole, only up to ``size`` megabytes are buffered."""
+    data = b"id,name\n" + b"".join(u"{0},Group {0}\n".format(i).encode() for i in range(300000))
+    with zipfile.ZipFile(archive_filename, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("dump/data/groups.csv", data)
+        archive.writestr("dump/data/employees.csv", b"id\n")
+    reader = ReadAhead(zipfile.ZipFile(archive_filename), ["dump/data/groups.csv", "dump/data/employees.csv"], 1)
+    contents = [(name, fd.readline() + fd.read(100) + fd.read()) for name, fd in reader]
+    assert contents == [("dump/data/groups.csv", data), ("dump/data/employees.csv", b"id\n")]
+    assert len(data) > 4 * MEGABYTE
+    assert reader.stats.max_buffered <= MEGABYTE // READ_AHEAD_BLOCK_SIZE
+
+
+def test_unread_member(members):
+    """The rest of a member, that is not read by the consumer, is skipped."""
+    reader = ReadAhead(members, NAMES, 1, 100)
+    assert [(name, fd.read(10)) for name, fd in reader] == [(name, name.encode()[:10]) for name in NAMES]
+
+
+def test_error(members):
+    reader = iter(ReadAhead(members, NAMES[:2] + ["unknown"] + NAMES[2:]))
+    assert next(reader)[0] == NAMES[0]
+    assert next(reader)[0] == NAMES[1]
+    with pytest.raises(KeyError):
+        next(reader)
+
+
+def test_stop(members):
+    """If the consumer stops early, the reader is stopped as well."""
+    reader = ReadAhead(members, NAMES, 1)
+    iterator = iter(reader)
+    next(iterator)
+    iterator.close()
+    assert reader.stats.members < len(NAMES)
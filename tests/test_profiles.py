@@ -0,0 +1,95 @@
+# coding: utf-8
+import zipfile
+
+import pytest
+
+from xdump.profiles import Profile, get_backend_path, get_profiles, read_config, run_profiles
+from xdump.sampling import Sample
+
+from ._compat import patch
+from .conftest import EMPLOYEES_SQL
+
+CONFIG = u"""
+[connection]
+backend = "sqlite"
+dbname = "test.db"
+
+[profiles.groups]
+output = "groups.zip"
+full_tables = ["groups"]
+compression = "stored"
+
+[profiles.employees]
+output = "employees.zip"
+partial_tables = { employees = "SELECT * FROM employees WHERE id = 1" }
+samples = { tickets = { percent = 50, seed = 1 } }
+dump_schema = false
+chunk_size = 100
+
+[profiles.employees.transforms.employees]
+last_name = "'Hidden'"
+"""
+
+
+@pytest.fixture
+def config_file(tmpdir):
+    path = tmpdir.join("profiles.toml")
+    path.write(CONFIG)
+    return str(path)
+
+
+def test_read_config(config_file):
+    config = read_config(config_file)
+    assert get_backend_path(config["connection"]) == "xdump.sqlite.SQLiteBackend"
+    groups, employees = get_profiles(config)
+    assert groups.get_dump_kwargs() == {
+        "full_tables": ("groups",),
+        "partial_tables": {},
+        "samples": {},
+        "compression": zipfile.ZIP_STORED,
+        "dump_schema": True,
+        "dump_data": True,
+        "chunk_size": None,
+        "transforms": None,
+        "columns": None,
+    }
+    assert employees.samples == {"tickets": Sample(50, seed=1)}
+    assert employees.chunk_size == 100
+    assert employees.transforms == {"employees": {"last_name": "'Hidden'"}}
+
+
+def test_select_profiles(config_file):
+    config = read_config(config_file)
+    assert [profile.name for profile in get_profiles(config, ["employees"])] == ["employees"]
+    with pytest.raises(ValueError, match="Unknown profiles: unknown"):
+        get_profiles(config, ["employees", "unknown"])
+
+
+def test_invalid_profile():
+    with pytest.raises(ValueError, match="Invalid profile `groups`"):
+        get_profiles({"profiles": {"groups": {"output": "groups.zip", "unknown": 1}}})
+
+
+@pytest.mark.parametrize("jobs", (1, 2))
+@pytest.mark.usefixtures("schema", "data")
+def test_run_profiles(backend, db_helper, tmpdir, jobs):
+    profiles = [
+        Profile(name="groups", output=str(tmpdir.join("groups.zip")), full_tables=["groups"]),
+        Profile(
+            name="employees", output=str(tmpdir.join("employees.zip")), partial_tables={"employees": EMPLOYEES_SQL}
+        ),
+        Profile(name="schema", output=str(tmpdir.join("schema.zip")), dump_data=False),
+    ]
+    finished = []
+    with patch.object(backend, "dump_schema", wraps=backend.dump_schema) as dump_schema, patch.object(
+        backend, "introspect_foreign_keys", wraps=backend.introspect_foreign_keys
+    ) as introspect_foreign_keys:
+        run_profiles(backend, profiles, jobs, callback=lambda profile: finished.append(profile.name))
+    assert dump_schema.call_count == 1
+    assert introspect_foreign_keys.call_count == 1
+    assert sorted(finished) == ["employees", "groups", "schema"]
+    db_helper.assert_groups(zipfile.ZipFile(profiles[0].output))
+    archive = zipfile.ZipFile(profiles[1].output)
+    db_helper.assert_employees(archive)
+    db_helper.assert_schema(archive.read("dump/schema.sql"))
+    assert not [name for name in zipfile.ZipFile(profiles[2].output).namelist() if name.startswith("dump/data/")]
@@ -0,0 +1,132 @@
+# coding: utf-8
+import os
+import zipfile
+
+import pytest
+
+from xdump.extra.pytest_plugin import TEMPLATE_PREFIX, get_template_name, load_archive, rolled_back
+from xdump.sqlite import SQLiteBackend
+from xdump.utils import get_archive_id
+
+from ._compat import patch
+from .conftest import EMPLOYEES_SQL, IS_SQLITE
+
+pytestmark = pytest.mark.usefixtures("schema", "data")
+
+
+def count(backend, table_name):
+    return backend.run('SELECT COUNT(*) AS "count" FROM {0}'.format(table_name))[0]["count"]
+
+
+@pytest.fixture
+def template(backend, archive_filename, tmpdir):
+    backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL})
+    backend.cache_clear()
+    with zipfile.ZipFile(archive_filename) as archive:
+        name = get_template_name(backend, get_archive_id(archive), str(tmpdir))
+    yield name
+    backend.cache_clear()
+    backend.drop_database(name)
+
+
+def test_load_archive(backend, archive_filename, tmpdir, template):
+    """The archive is loaded only once, then the database is re-created from the template."""
+    load_archive(backend, archive_filename, str(tmpdir))
+    assert backend.database_exists(template)
+    assert count(backend, "employees") == 4
+    backend.run("DELETE FROM tickets")
+    backend.get_connection().commit()
+    with patch.object(type(backend), "load", side_effect=AssertionError("The archive should not be loaded")):
+        load_archive(backend, archive_filename, str(tmpdir))
+    assert count(backend, "employees") == 4
+    assert count(backend, "tickets") == 0
+    assert not backend.database_exists(template + "_new")
+
+
+def test_load_data_only(backend, archive_filename):
+    """Data-only archives are loaded into the existing schema."""
+    backend.dump(archive_filename, ["groups"], dump_schema=False)
+    backend.cache_clear()
+    backend.run("DELETE FROM tickets")
+    backend.run("DELETE FROM employees")
+    backend.get_connection().commit()
+    with patch.object(backend, "database_exists") as database_exists:
+        load_archive(backend, archive_filename)
+    assert not database_exists.called
+    assert count(backend, "groups") == 2
+
+
+def test_get_template_name(backend, tmpdir):
+    name = get_template_name(backend, "a" * 64, str(tmpdir))
+    if IS_SQLITE:
+        assert name == os.path.join(str(tmpdir), TEMPLATE_PREFIX + "a" * 16 + ".db")
+    else:
+        assert name == TEMPLATE_PREFIX + "a" * 16
+
+
+def test_rolled_back(backend):
+    with rolled_back(backend):
+        backend.run("DELETE FROM tickets")
+        backend.run("CREATE TABLE extra (id INTEGER)")
+        assert count(backend, "tickets") == 0
+    assert count(backend, "tickets") == 5
+    assert not backend.table_exists("extra")
+
+
+PLUGIN_CONFTEST = """
+import pytest
+
+from xdump.sqlite import SQLiteBackend
+
+pytest_plugins = ("xdump.extra.pytest_plugin",)
+
+
+@pytest.fixture(scope="session")
+def xdump_backend():
+    return SQLiteBackend(dbname="test.db")
+"""
+PLUGIN_TESTS = """
+def count(backend, table_name):
+    return backend.run("SELECT COUNT(*) AS count FROM {0}".format(table_name))[0]["count"]
+
+
+def test_change(xdump_db):
+    xdump_db.run("DELETE FROM employees")
+    xdump_db.run("CREATE TABLE extra (id INTEGER)")
+    assert count(xdump_db, "employees") == 0
+
+
+def test_rolled_back(xdump_db):
+    assert count(xdump_db, "employees") == 4
+    assert not xdump_db.table_exists("extra")
+"""
+# Django settings are not configured in the inner sessions
+NO_DJANGO = ("-p", "no:django")
+
+
+@pytest.mark.sqlite
+def test_plugin(testdir, backend, archive_filename):
+    """The archive is loaded into a template in the first session, next sessions re-create the database from it.
+
+    Changes, made by every test, are rolled back.
+    """
+    backend.dump(archive_filename, ["groups"], {"employees": EMPLOYEES_SQL})
+    testdir.makeconftest(PLUGIN_CONFTEST)
+    testdir.makepyfile(PLUGIN_TESTS)
+    # The value is joined with the option, otherwise pytest looks for the initial conftest next to the archive
+    args = NO_DJANGO + ("--xdump-archive=" + archive_filename,)
+    result = testdir.runpytest(*args)
+    result.assert_outcomes(passed=2)
+    with patch.object(SQLiteBackend, "load", side_effect=AssertionError("The archive should not be loaded")):
+        result = testdir.runpytest(*args)
+    result.assert_outcomes(passed=2)
+    assert len(list(testdir.tmpdir.join(".pytest_cache").visit(TEMPLATE_PREFIX + "*.db"))) == 1
+
+
+@pytest.mark.sqlite
+def test_plugin_no_archive(testdir):
+    testdir.makeconftest(PLUGIN_CONFTEST)
+    testdir.makepyfile(PLUGIN_TESTS)
+    result = testdir.runpytest(*NO_DJANGO)
+    result.assert_outcomes(errors=2)
+    result.stdout.fnmatch_lines(["*Specify the archive with `--xdump-archive` option*"])
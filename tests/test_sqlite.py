@@ -1,9 +1,13 @@
 import sqlite3
+import zipfile
 
 import pytest
 
+from xdump.sampling import Sample
 from xdump.sqlite import SQLiteBackend
 
+from ._compat import patch
+
 pytestmark = [pytest.mark.sqlite]
 
 
@@ -14,3 +18,176 @@ pytestmark = [pytest.mark.sqlite]
 def test_old_version_info():
     with pytest.raises(RuntimeError):
         SQLiteBackend(dbname="tests")
+
+
+@pytest.fixture
+def sqlite_backend(dbname):
+    return SQLiteBackend(dbname=dbname)
+
+
+def test_dump_schema_order(sqlite_backend, execute_file, cursor):
+    """Indexes, views and triggers are dumped after all tables, internal tables are skipped."""
+    execute_file("sql/schema.sql")
+    cursor.executescript(
+        """
+        CREATE VIEW admins AS SELECT * FROM employees WHERE group_id = 1;
+        CREATE INDEX employees_group_idx ON employees (group_id);
+        CREATE TRIGGER tickets_author AFTER INSERT ON tickets BEGIN SELECT 1; END;
+        CREATE TABLE counters (id INTEGER PRIMARY KEY AUTOINCREMENT);
+        """
+    )
+    schema = sqlite_backend.dump_schema()
+    positions = [
+        schema.index(statement)
+        for statement in (
+            b"CREATE TABLE groups",
+            b"CREATE TABLE counters",
+            b"CREATE INDEX employees_group_idx",
+            b"CREATE VIEW admins",
+            b"CREATE TRIGGER tickets_author",
+        )
+    ]
+    assert positions == sorted(positions)
+    assert b"sqlite_sequence" not in schema
+
+
+@pytest.mark.parametrize("table_name", ("sqlitedata", "sqlite1"))
+def test_dump_schema_sqlite_prefix(sqlite_backend, cursor, table_name):
+    """Only the literal ``sqlite_`` prefix marks internal objects."""
+    cursor.execute("CREATE TABLE {0} (id INTEGER PRIMARY KEY)".format(table_name))
+    assert sqlite_backend.dump_schema() == "CREATE TABLE {0} (id INTEGER PRIMARY KEY);\n".format(table_name).encode()
+
+
+def test_dump_schema_load(sqlite_backend, execute_file, tmpdir):
+    execute_file("sql/schema.sql")
+    schema = sqlite_backend.dump_schema()
+    target = SQLiteBackend(dbname=str(tmpdir.join("target.db")))
+    target.run_setup_file(schema)
+    assert target.tables == ["groups", "employees", "tickets"]
+
+
+def test_recreate_in_memory_database():
+    """Shared in-memory databases, e.g. Django test databases, are cleaned up without removing any files."""
+    dbname = "file:memorydb_xdump?mode=memory&cache=shared"
+    holder = sqlite3.connect(dbname, uri=True)
+    try:
+        holder.executescript(
+            """
+            CREATE TABLE groups (id INTEGER PRIMARY KEY);
+            CREATE VIEW all_groups AS SELECT * FROM groups;
+            CREATE INDEX groups_idx ON groups (id);
+            """
+        )
+        backend = SQLiteBackend(dbname=dbname)
+        assert backend.tables == ["groups"]
+        backend.recreate_database()
+        assert holder.execute("SELECT name FROM sqlite_master").fetchall() == []
+        backend.run_setup_file("CREATE TABLE employees (id INTEGER PRIMARY KEY)")
+        assert holder.execute("SELECT name FROM sqlite_master").fetchall() == [("employees",)]
+        backend.cache_clear()
+    finally:
+        holder.close()
+
+
+def test_merge_unchanged_rows(sqlite_backend, execute_file, cursor, archive_filename):
+    """Only rows, that differ from the dump, are updated."""
+    execute_file("sql/schema.sql")
+    execute_file("sql/sqlite_data.sql")
+    cursor.executescript(
+        """
+        CREATE TABLE updates (group_id INTEGER);
+        CREATE TRIGGER groups_update AFTER UPDATE ON groups BEGIN INSERT INTO updates VALUES (NEW.id); END;
+        """
+    )
+    sqlite_backend.dump(archive_filename, ["groups"], dump_schema=False)
+    sqlite_backend.run("COMMIT")
+    cursor.execute("UPDATE groups SET name = 'Changed' WHERE id = 2")
+    cursor.execute("DELETE FROM updates")
+    sqlite_backend.load(archive_filename, merge=True)
+    assert sqlite_backend.run("SELECT name FROM groups ORDER BY id") == [{"name": "Admin"}, {"name": "User"}]
+    assert sqlite_backend.run("SELECT group_id FROM updates") == [{"group_id": 2}]
+
+
+@pytest.mark.parametrize("journal_mode", ("wal", "delete"))
+def test_concurrent_dump(sqlite_backend, execute_file, cursor, tmpdir, journal_mode):
+    """Data files exported by worker processes are the same as exported by the dump connection."""
+    cursor.execute("PRAGMA journal_mode = {0}".format(journal_mode)).fetchall()
+    execute_file("sql/schema.sql")
+    execute_file("sql/sqlite_data.sql")
+    archives = []
+    for jobs in (1, 3):
+        filename = str(tmpdir.join("dump_{0}.zip".format(jobs)))
+        backend = SQLiteBackend(dbname=sqlite_backend.dbname)
+        backend.dump(filename, ["groups", "employees", "tickets"], dump_schema=False, chunk_size=2, jobs=jobs)
+        backend.cache_clear()
+        with zipfile.ZipFile(filename) as archive:
+            archives.append({name: archive.read(name) for name in archive.namelist()})
+    assert archives[0] == archives[1]
+    assert len(archives[1]) == 8
+
+
+@pytest.mark.parametrize("journal_mode", ("wal", "delete"))
+def test_skip_unchanged(sqlite_backend, execute_file, cursor, archive_filename, journal_mode):
+    """Changes are detected in WAL mode as well, including the ones moved to the database file by checkpoints."""
+    cursor.execute("PRAGMA journal_mode = {0}".format(journal_mode)).fetchall()
+    execute_file("sql/schema.sql")
+    execute_file("sql/sqlite_data.sql")
+
+    def dump():
+        result = sqlite_backend.dump(archive_filename, ["groups"], dump_schema=False, skip_unchanged=True)
+        sqlite_backend.cache_clear()
+        return result
+
+    assert dump()
+    assert not dump()
+    cursor.execute("UPDATE groups SET name = 'Changed' WHERE id = 1")
+    assert dump()
+    assert not dump()
+    # The WAL file is emptied, changes are only in the database file
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    dump()
+    cursor.execute("UPDATE groups SET name = 'Again' WHERE id = 1")
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    assert dump()
+    assert not dump()
+
+
+def test_catalog_cache(sqlite_backend, execute_file, cursor):
+    """The catalog is introspected once and again only after the schema is changed by any connection."""
+    execute_file("sql/schema.sql")
+    with patch.object(sqlite_backend, "introspect_catalog", wraps=sqlite_backend.introspect_catalog) as introspect:
+        assert sqlite_backend.tables == ["groups", "employees", "tickets"]
+        assert sqlite_backend.get_dependencies(["employees"]) == {"employees": {"employees", "groups"}}
+        assert sqlite_backend.table_exists("tickets")
+        assert introspect.call_count == 1
+        cursor.execute("CREATE TABLE counters (id INTEGER, kind INTEGER, PRIMARY KEY (kind, id))")
+        assert sqlite_backend.table_exists("counters")
+        assert sqlite_backend.get_catalog().get_primary_key("counters") == ["kind", "id"]
+        assert introspect.call_count == 2
+
+
+def test_catalog(sqlite_backend, execute_file):
+    execute_file("sql/schema.sql")
+    catalog = sqlite_backend.get_catalog()
+    assert catalog.columns["groups"] == ["id", "name"]
+    assert catalog.get_primary_key("groups") == ["id"]
+    assert catalog.get_primary_key("unknown") == []
+    assert sorted(row["from"] for row in catalog.foreign_keys["employees"]) == ["group_id", "manager_id", "referrer_id"]
+
+
+def test_sample_without_rowid(sqlite_backend, cursor):
+    """WITHOUT ROWID tables are sampled by the hash of their integer primary key."""
+    cursor.executescript(
+        """
+        CREATE TABLE points (id INTEGER PRIMARY KEY, name TEXT) WITHOUT ROWID;
+        CREATE TABLE tags (name TEXT PRIMARY KEY) WITHOUT ROWID;
+        INSERT INTO points (id, name) VALUES (1, 'A'), (2, 'B'), (3, 'C'), (4, 'D');
+        INSERT INTO tags (name) VALUES ('A');
+        """
+    )
+    sql = sqlite_backend.get_sample_sql("points", Sample(100, seed=1))
+    assert len(sqlite_backend.run(sql)) == 4
+    sql = sqlite_backend.get_sample_sql("points", Sample(50, seed=1))
+    assert sqlite_backend.run(sql) == sqlite_backend.run(sql)
+    with pytest.raises(ValueError, match="Table tags has no rowid and no single-column integer primary key"):
+        sqlite_backend.get_sample_sql("tags", Sample(50))
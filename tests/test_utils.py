@@ -1,5 +1,168 @@
-from xdump.utils import make_options
+import zipfile
+
+import pytest
+
+from xdump.utils import (
+    count_csv_rows,
+    get_archive_id,
+    get_dependency_levels,
+    get_parameters_hash,
+    get_projected_columns,
+    make_options,
+    make_row_value,
+    map_concurrently,
+    run_concurrently,
+    unwrap_columns,
+)
 
 
 def test_make_options():
     assert list(make_options("-t", ["foo", "bar"])) == ["-t", "foo", "-t", "bar"]
+
+
+def test_get_archive_id(tmpdir):
+    def make_archive(name, members):
+        filename = str(tmpdir.join(name))
+        with zipfile.ZipFile(filename, "w") as archive:
+            for member, data in members:
+                archive.writestr(member, data)
+        return zipfile.ZipFile(filename)
+
+    members = [("dump/data/groups.csv", b"id\n1\n"), ("dump/schema.sql", b"")]
+    archive_id = get_archive_id(make_archive("first.zip", members))
+    assert get_archive_id(make_archive("second.zip", members[::-1])) == archive_id
+    assert get_archive_id(make_archive("third.zip", [("dump/data/groups.csv", b"id\n2\n")])) != archive_id
+
+
+def test_get_parameters_hash():
+    parameters_hash = get_parameters_hash({"full_tables": ["groups"], "chunk_size": None})
+    assert get_parameters_hash({"chunk_size": None, "full_tables": ["groups"]}) == parameters_hash
+    assert get_parameters_hash({"full_tables": ["groups"], "chunk_size": 10}) != parameters_hash
+
+
+@pytest.mark.parametrize(
+    "projection, expected",
+    (
+        (None, ["id", "name", "payload"]),
+        ({"include": ["name", "id"]}, ["id", "name"]),
+        ({"exclude": ["payload"]}, ["id", "name"]),
+    ),
+)
+def test_get_projected_columns(projection, expected):
+    assert get_projected_columns("events", ["id", "name", "payload"], projection) == expected
+
+
+@pytest.mark.parametrize(
+    "projection, message",
+    (
+        ({"include": ["id"], "exclude": ["name"]}, "Projection of `events` table should contain either"),
+        ({"only": ["id"]}, "Projection of `events` table should contain either"),
+        ({"include": ["unknown"]}, "Included columns are not found in `events` table: unknown"),
+        ({"exclude": ["unknown"]}, "Excluded columns are not found in `events` table: unknown"),
+        ({"exclude": ["id", "name"]}, "All columns of `events` table are excluded"),
+    ),
+)
+def test_get_projected_columns_invalid(projection, message):
+    with pytest.raises(ValueError, match=message):
+        get_projected_columns("events", ["id", "name"], projection)
+
+
+@pytest.mark.parametrize(
+    "value, alias, expected",
+    (
+        ("id", None, "id"),
+        ("id", "T", "T.id"),
+        (["id"], "T", "T.id"),
+        (["country", "code"], None, "(country, code)"),
+        (("country", "code"), "T", "(T.country, T.code)"),
+    ),
+)
+def test_make_row_value(value, alias, expected):
+    assert make_row_value(value, alias) == expected
+
+
+@pytest.mark.parametrize("columns, expected", ((["id"], "id"), (["country", "code"], ["country", "code"])))
+def test_unwrap_columns(columns, expected):
+    assert unwrap_columns(columns) == expected
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    (
+        (b"", 0),
+        (b"id,name\n", 0),
+        (b"id,name\n1,Admin\n2,User\n", 2),
+        (b"id,name\n1,Admin\n2,User", 2),
+        (b'id,name\n1,"Multi\nline"\n2,"With ""quotes""\n"\n', 2),
+    ),
+)
+def test_count_csv_rows(data, expected):
+    assert count_csv_rows(data) == expected
+
+
+@pytest.mark.parametrize(
+    "tables, dependencies, expected",
+    (
+        (["groups", "employees"], {}, [["groups", "employees"]]),
+        (
+            ["tickets", "employees", "groups"],
+            {"tickets": {"employees"}, "employees": {"employees", "groups"}},
+            [["groups"], ["employees"], ["tickets"]],
+        ),
+        # References to tables outside of the given ones are ignored
+        (["employees"], {"employees": {"groups"}}, [["employees"]]),
+        # Cyclic dependencies are placed to the last level
+        (["a", "b", "c"], {"a": {"b"}, "b": {"a"}, "c": {"a"}}, [["a", "b", "c"]]),
+    ),
+)
+def test_get_dependency_levels(tables, dependencies, expected):
+    assert get_dependency_levels(tables, dependencies) == expected
+
+
+@pytest.mark.parametrize("workers", (1, 4))
+def test_run_concurrently(workers):
+    result = []
+    run_concurrently(result.append, range(10), workers)
+    assert sorted(result) == list(range(10))
+
+
+def test_run_concurrently_error():
+    def function(item):
+        if item == 3:
+            raise ValueError("Failed")
+
+    with pytest.raises(ValueError, match="Failed"):
+        run_concurrently(function, range(10), 4)
+
+
+@pytest.mark.parametrize("workers", (1, 3))
+def test_map_concurrently(workers):
+    assert list(map_concurrently(lambda item: item * 2, range(10), workers)) == [item * 2 for item in range(10)]
+
+
+def test_map_concurrently_error():
+    def function(item):
+        if item == 3:
+            raise ValueError("Failed")
+        return item
+
+    results = map_concurrently(function, range(10), 4)
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(ValueError, match="Failed"):
+        next(results)
+
+
+def test_map_concurrently_chained():
+    doubled = map_concurrently(lambda item: item * 2, iter(range(20)), 3)
+    assert list(map_concurrently(lambda item: item + 1, doubled, 2)) == [item * 2 + 1 for item in range(20)]
+
+
+def test_map_concurrently_source_error():
+    def items():
+        yield 1
+        raise ValueError("Failed")
+
+    results = map_concurrently(lambda item: item, items(), 2)
+    assert next(results) == 1
+    with pytest.raises(ValueError, match="Failed"):
+        next(results)
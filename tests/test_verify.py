@@ -0,0 +1,74 @@
+# coding: utf-8
+import zipfile
+
+import pytest
+
+from xdump.verify import Difference, TableDigest, diff_archives, get_range, row_hash
+
+
+def make_archive(filename, **tables):
+    with zipfile.ZipFile(filename, "w") as archive:
+        for name, data in tables.items():
+            archive.writestr("dump/data/{0}.csv".format(name), data)
+    return filename
+
+
+@pytest.mark.parametrize("value, expected", (("0", 0), ("9", 0), ("10", 1), ("-1", -1), ("", None), ("a1", None)))
+def test_get_range(value, expected):
+    assert get_range(value, 10) == expected
+
+
+def test_row_hash():
+    value = row_hash([u"1", u"Admin"])
+    assert -(2 ** 63) <= value < 2 ** 63
+    assert value == row_hash([b"1", b"Admin"])
+    # Values are separated
+    assert value != row_hash([u"1A", u"dmin"])
+
+
+def test_table_digest_order():
+    first, second = TableDigest(), TableDigest()
+    for fields in (["1", "Admin"], ["2", "User"]):
+        first.add_row(fields)
+    for fields in (["2", "User"], ["1", "Admin"]):
+        second.add_row(fields)
+    assert first.ranges == second.ranges
+    assert first.rows == 2
+
+
+def test_diff_archives(tmpdir):
+    first = make_archive(
+        str(tmpdir.join("first.zip")),
+        groups="id,name\n1,Admin\n2,User\n",
+        employees="id,name\n1,John\n15,Jane\n",
+        tickets="id\n1\n",
+    )
+    second = make_archive(
+        str(tmpdir.join("second.zip")),
+        groups="id,name\n2,User\n1,Admin\n",
+        employees="id,name\n1,John\n15,Janet\n",
+        logs="message\ntext\n",
+    )
+    differences = diff_archives(first, second, range_size=10)
+    assert [str(difference) for difference in differences] == [
+        "employees: keys 10..19 differ (1 rows vs 1 rows)",
+        "logs: rows with non-integer keys differ (0 rows vs 1 rows)",
+        "tickets: keys 0..9 differ (1 rows vs 0 rows)",
+    ]
+    assert differences[0].bounds == (10, 19)
+
+
+def test_diff_chunks(tmpdir):
+    """Data files of the same table are combined."""
+    first = str(tmpdir.join("first.zip"))
+    with zipfile.ZipFile(first, "w") as archive:
+        archive.writestr("dump/data/groups.0001.csv", "id,name\n1,Admin\n")
+        archive.writestr("dump/data/groups.0002.csv", "id,name\n2,User\n")
+    second = make_archive(str(tmpdir.join("second.zip")), groups="id,name\n1,Admin\n2,User\n")
+    assert diff_archives(first, second) == []
+
+
+def test_difference_str():
+    difference = Difference(table_name="groups", key_range=None, range_size=10, rows=0, other_rows=2)
+    assert difference.bounds is None
+    assert str(difference) == "groups: rows with non-integer keys differ (0 rows vs 2 rows)"
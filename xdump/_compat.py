@@ -12,14 +12,14 @@ except NameError:
     FileNotFoundError = OSError
 
 try:
-    from functools import lru_cache
+    from queue import Empty, Full, Queue
 except ImportError:
-    from repoze.lru import lru_cache as cache
+    from Queue import Empty, Full, Queue  # noqa
 
-    def lru_cache():
-        def wrapper(f):
-            wrapped = cache(None)(f)
-            wrapped.cache_clear = wrapped._cache.clear
-            return wrapped
-
-        return wrapper
+try:
+    from tomllib import loads as toml_loads
+except ImportError:
+    try:
+        from toml import loads as toml_loads
+    except ImportError:
+        toml_loads = None
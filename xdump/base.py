@@ -1,19 +1,50 @@
 # coding: utf-8
+import hashlib
+import itertools
 import os
 import zipfile
 from contextlib import contextmanager
+from functools import partial
 from time import time
 
-from ._compat import lru_cache
+from . import __version__
+from .checkpoint import WorkDir, dump_with_checkpoints
+from .compression import compress, write_compressed
 from .logging import get_logger
+from .manifest import Manifest
+from .options import DumpOptions
+from .pool import DEFAULT_POOL_SIZE, ConnectionPool
+from .prefetch import DEFAULT_READ_AHEAD, ReadAhead
+from .utils import (
+    check_columns,
+    get_archive_id,
+    get_columns,
+    get_dependency_levels,
+    get_parameters_hash,
+    get_projected_columns,
+    group_foreign_keys,
+    make_row_value,
+    map_concurrently,
+    run_concurrently,
+)
+from .verify import DEFAULT_RANGE_SIZE, compare_digests, digest_archive
 
 
 class BaseBackend(object):
     dbname = None
     connections = {"default": {}}
     schema_filename = "dump/schema.sql"
+    manifest_filename = "dump/manifest.json"
     initial_setup_files = (schema_filename,)
     data_dir = "dump/data/"
+    pool_min_size = 1
+    pool_max_size = DEFAULT_POOL_SIZE
+    # Could different instances dump the same database at the same time
+    supports_concurrent_dumps = True
+    # Could a snapshot from ``export_snapshot`` be attached by its ID in another session, e.g. to resume a dump
+    supports_snapshots = False
+    # Query parameters style of the DB driver
+    placeholder = "%s"
 
     @property
     def logger(self):
@@ -34,28 +65,71 @@ class BaseBackend(object):
         yield
         self.logger.debug(message, (time() - start))
 
+    @property
+    def manifest(self):
+        """Description of data files, that are written to the archive."""
+        if not hasattr(self, "_manifest"):
+            self._manifest = Manifest()
+        return self._manifest
+
     # Connection
 
-    @lru_cache()
+    def get_pool(self, name="default"):
+        """Connection pool for the given connection alias."""
+        if not hasattr(self, "_pools"):
+            self._pools = {}
+        if name not in self._pools:
+            self._pools[name] = ConnectionPool(
+                partial(self.connect, **self.connections[name]),
+                min_size=self.pool_min_size,
+                max_size=self.pool_max_size,
+                is_usable=self.is_usable,
+            )
+        return self._pools[name]
+
     def get_connection(self, name="default"):
-        return self.connect(**self.connections[name])
+        """Connection, that is used by the backend itself. It is checked out from the pool until ``cache_clear``."""
+        if not hasattr(self, "_connections"):
+            self._connections = {}
+        if name not in self._connections:
+            self._connections[name] = self.get_pool(name).acquire()
+        return self._connections[name]
 
-    @lru_cache()
     def get_cursor(self, name="default"):
-        return self.get_connection(name).cursor()
+        if not hasattr(self, "_cursors"):
+            self._cursors = {}
+        if name not in self._cursors:
+            self._cursors[name] = self.get_connection(name).cursor()
+        return self._cursors[name]
+
+    @contextmanager
+    def connection(self, name="default"):
+        """Checks out a separate connection from the pool. Useful for worker threads."""
+        with self.get_pool(name).connection() as connection:
+            yield connection
 
     def connect(self, *args, **kwargs):
         """Create a connection to the database."""
         raise NotImplementedError
 
+    def is_usable(self, connection):
+        """Health check for idle connections in the pool."""
+        return True
+
     def get_connection_kwargs(self, **kwargs):
         for option in ("dbname", "user", "password", "host", "port"):
             kwargs.setdefault(option, getattr(self, option))
         return kwargs
 
     def cache_clear(self):
-        self.get_cursor.cache_clear()
-        self.get_connection.cache_clear()
+        """Closes all connections. New ones will be created on demand."""
+        for name, connection in getattr(self, "_connections", {}).items():
+            self._pools[name].release(connection, discard=True)
+        for pool in getattr(self, "_pools", {}).values():
+            pool.close()
+        self._cursors = {}
+        self._connections = {}
+        self._pools = {}
 
     # Low-level commands executors
 
@@ -84,7 +158,7 @@ class BaseBackend(object):
 
     # Dumping the data
 
-    def dump(
+    def dump(  # pylint: disable=too-many-locals
         self,
         filename,
         full_tables=(),
@@ -92,30 +166,165 @@ class BaseBackend(object):
         compression=zipfile.ZIP_DEFLATED,
         dump_schema=True,
         dump_data=True,
+        samples=None,
+        chunk_size=None,
+        jobs=1,
+        compression_jobs=1,
+        foreign_keys=None,
+        schema=None,
+        transforms=None,
+        columns=None,
+        work_dir=None,
+        resume=False,
+        skip_unchanged=False,
     ):
-        """Creates a dump, which could be used to restore the database."""
-        self.input_check(full_tables, partial_tables)
+        """Creates a dump, which could be used to restore the database.
+
+        ``samples`` is a mapping of table names to ``xdump.sampling.Sample`` instances. Sampled tables are handled as
+        partial tables.
+        Full tables with more than ``chunk_size`` rows are split into multiple data files by primary key ranges.
+        With ``jobs`` > 1 data files are exported concurrently from the same snapshot of the database.
+        With ``compression_jobs`` > 1 data files are compressed in a pool of threads, while the next ones are exported.
+        Compressed entries are appended with private ``zipfile.ZipFile`` members, therefore it is opt-in.
+        ``foreign_keys`` is a list of relations between tables in the same format as ``get_foreign_keys`` yields. If it
+        is given, then the database is not introspected for them.
+        ``schema`` is an already dumped schema, that is written instead of dumping it again.
+        ``transforms`` is a mapping of table names to mappings of column names to SQL expressions, e.g. to mask
+        personal data. Expressions replace the columns in export queries and are evaluated by the database.
+        ``columns`` is a mapping of table names to projections - ``{"include": [...]}`` or ``{"exclude": [...]}``.
+        Omitted columns are filled with their defaults on load.
+        With ``work_dir`` every exported data file is written there first, so the dump could be finished later with
+        ``resume``. A resumed dump takes tables and queries from the plan of the interrupted one.
+        With ``skip_unchanged`` the dump is not made if ``filename`` is an archive, that was made with the same
+        parameters from the same state of the database. Returns ``False`` in this case and ``True`` otherwise.
+        """
+        options = DumpOptions(
+            full_tables=full_tables,
+            partial_tables=partial_tables,
+            compression=compression,
+            dump_schema=dump_schema,
+            dump_data=dump_data,
+            samples=samples,
+            chunk_size=chunk_size,
+            jobs=jobs,
+            compression_jobs=compression_jobs,
+            foreign_keys=foreign_keys,
+            schema=schema,
+            transforms=transforms,
+            columns=columns,
+        )
+        if work_dir is not None:
+            with self.log_time("Total execution time: %s"):
+                return dump_with_checkpoints(self, filename, options, WorkDir(work_dir), resume, skip_unchanged)
+        self.input_check(full_tables, partial_tables, samples)
         with self.log_time("Total execution time: %s"):
-            partial_tables = partial_tables or {}
-            with zipfile.ZipFile(filename, "w", compression) as file:
-                if dump_schema:
-                    self.write_initial_setup(file)
-                if dump_data:
-                    self.add_related_data(full_tables, partial_tables)
-                    self.write_full_tables(file, full_tables)
-                    self.write_partial_tables(file, partial_tables)
-
-    def input_check(self, full_tables, partial_tables):
-        if full_tables and partial_tables:
-            common_tables = set(full_tables) & set(partial_tables)
-            if common_tables:
-                raise ValueError(
-                    "`partial_tables` should not contain tables from `full_tables`. Common tables: {tables}".format(
-                        tables=", ".join(common_tables)
-                    )
+            return self.dump_to_archive(filename, options, skip_unchanged)
+
+    def dump_to_archive(self, filename, options, skip_unchanged=False):
+        """Writes data files directly to the archive. Returns ``False`` if the dump is skipped."""
+        source = self.get_source(options)
+        if skip_unchanged and self.is_archive_up_to_date(filename, source):
+            return False
+        foreign_keys = options.foreign_keys
+        if foreign_keys is None and options.dump_data:
+            # Relations are introspected once for both related data and the manifest
+            foreign_keys = self.introspect_foreign_keys()
+        with self.create_archive(filename, options.compression, source, foreign_keys) as file:
+            if options.dump_schema:
+                self.write_initial_setup(file, options.schema)
+            if options.dump_data:
+                partial_tables = self.get_partial_tables(options.partial_tables, options.samples)
+                self.add_related_data(options.full_tables, partial_tables, foreign_keys)
+                self.write_data_files(
+                    file,
+                    options.full_tables,
+                    partial_tables,
+                    options.chunk_size,
+                    options.jobs,
+                    options.compression_jobs,
+                    options.transforms,
+                    options.columns,
                 )
+        return True
 
-    def add_related_data(self, full_tables, partial_tables):
+    @contextmanager
+    def create_archive(self, filename, compression, source=None, foreign_keys=None):
+        """Opens a new archive for writing. The manifest is written after all other members."""
+        self._manifest = Manifest(source=source)
+        with zipfile.ZipFile(filename, "w", compression) as file:
+            yield file
+            self.write_manifest(file, foreign_keys)
+
+    def input_check(self, full_tables, partial_tables, samples=None):
+        for name, tables, other_name, other_tables in (
+            ("partial_tables", partial_tables, "full_tables", full_tables),
+            ("samples", samples, "full_tables", full_tables),
+            ("samples", samples, "partial_tables", partial_tables),
+        ):
+            if tables and other_tables:
+                common_tables = set(tables) & set(other_tables)
+                if common_tables:
+                    raise ValueError(
+                        "`{name}` should not contain tables from `{other_name}`. Common tables: {tables}".format(
+                            name=name, other_name=other_name, tables=", ".join(common_tables)
+                        )
+                    )
+
+    def get_source(self, options):
+        """The current state of the database together with the hash of dump parameters. See ``Manifest.source``.
+
+        Sampled tables are hashed by their queries, therefore samples without a seed are different every time.
+        """
+        schema = options.schema
+        if schema is not None and not isinstance(schema, bytes):
+            schema = schema.encode("utf-8")
+        parameters = {
+            "version": __version__,
+            "dbname": self.dbname,
+            "full_tables": list(options.full_tables),
+            "partial_tables": self.get_partial_tables(options.partial_tables, options.samples),
+            "compression": options.compression,
+            "dump_schema": options.dump_schema,
+            "dump_data": options.dump_data,
+            "chunk_size": options.chunk_size,
+            "foreign_keys": options.foreign_keys,
+            "schema": None if schema is None else hashlib.sha256(schema).hexdigest(),
+            "transforms": options.transforms or None,
+            "columns": options.columns or None,
+        }
+        return {"state": self.get_source_state(), "parameters": get_parameters_hash(parameters)}
+
+    def get_source_state(self):
+        """JSON-serializable value, that is changed by every change in the data, which will be dumped.
+
+        It should correspond to the state the data is exported from, e.g. be taken in the same transaction.
+        ``None`` means that the state is unknown and dumps are never skipped.
+        """
+        return None
+
+    def is_archive_up_to_date(self, filename, source):
+        """If the archive was made with the same parameters from the same state of the database."""
+        if not zipfile.is_zipfile(filename):
+            return False
+        with zipfile.ZipFile(filename) as archive:
+            manifest = self.read_manifest(archive)
+        if source["state"] is None or manifest is None or manifest.source != source:
+            return False
+        self.logger.info("The database is not changed since `%s` was made, the dump is skipped", filename)
+        return True
+
+    def get_partial_tables(self, partial_tables, samples=None):
+        """Selects for partial tables, including ones for sampled tables."""
+        partial_tables = dict(partial_tables or {})
+        for table_name, sample in (samples or {}).items():
+            partial_tables[table_name] = self.get_sample_sql(table_name, sample)
+        return partial_tables
+
+    def get_sample_sql(self, table_name, sample):
+        """Generates SQL to select a random sample of rows from the table."""
+        raise NotImplementedError
+
+    def add_related_data(self, full_tables, partial_tables, foreign_keys=None):
         """Updates selects for partial tables to grab all objects, that are referenced by full / partial tables."""
         tables = self.get_tables_for_related_data(full_tables, partial_tables)
         for table in tables:
@@ -132,7 +341,10 @@ class BaseBackend(object):
         for foreign_key in self.get_foreign_keys(table, full_tables, recursive=True):
             if table in partial_tables:
                 partial_tables[table] = RECURSIVE_QUERY_TEMPLATE.format(
-                    source=partial_tables[table], target=table, **foreign_key
+                    source=partial_tables[table],
+                    table_name=foreign_key["table_name"],
+                    columns=make_row_value(foreign_key["column_name"], "recursive_cte"),
+                    foreign_columns=make_row_value(foreign_key["foreign_column_name"], "T"),
                 )
 
     def update_non_recursive_relations(self, table, full_tables, partial_tables):
@@ -151,6 +363,14 @@ class BaseBackend(object):
         """Looks for foreign keys in the given table. Excluding ones, that will be dumped in ``full_tables``."""
         raise NotImplementedError
 
+    def introspect_foreign_keys(self):
+        """All foreign keys in the database in the format, that is accepted by ``dump``."""
+        raise NotImplementedError
+
+    def mogrify(self, sql, params):
+        """Interpolates parameters into the query, e.g. to use a query built by an ORM as a partial table select."""
+        raise NotImplementedError
+
     def get_related_data_sql(self, foreign_key, full_tables, partial_tables):
         """Generates SQL to select related data, that is referred from another table."""
         table_name = foreign_key["table_name"]
@@ -164,18 +384,22 @@ class BaseBackend(object):
             SELECT
                 *
             FROM {foreign_table_name}
-            WHERE {foreign_column_name} IN (
-                SELECT {column_name} FROM {source}
+            WHERE {foreign_columns} IN (
+                SELECT {columns} FROM {source}
             )""".format(
-            source=source, **foreign_key
+            source=source,
+            foreign_table_name=foreign_key["foreign_table_name"],
+            foreign_columns=make_row_value(foreign_key["foreign_column_name"]),
+            columns=", ".join(get_columns(foreign_key["column_name"])),
         )
 
-    def write_initial_setup(self, file):
-        self.write_schema(file)
+    def write_initial_setup(self, file, schema=None):
+        self.write_schema(file, schema)
 
-    def write_schema(self, file):
+    def write_schema(self, file, schema=None):
         """Writes a DB schema, functions, etc to the archive."""
-        schema = self.dump_schema()
+        if schema is None:
+            schema = self.dump_schema()
         file.writestr(self.schema_filename, schema)
 
     def dump_schema(self):
@@ -192,17 +416,176 @@ class BaseBackend(object):
 
     def write_data_file(self, file, table_name, sql):
         data = self.export_to_csv(sql)
-        file.writestr("{0}{1}.csv".format(self.data_dir, table_name), data)
+        self.write_archive_member(file, table_name, self.get_data_filename(table_name), data)
+
+    def get_data_filename(self, table_name, chunk=None):
+        if chunk is None:
+            return "{0}{1}.csv".format(self.data_dir, table_name)
+        return "{0}{1}.{2:04d}.csv".format(self.data_dir, table_name, chunk)
+
+    def write_archive_member(self, file, table_name, filename, data):
+        file.writestr(filename, data)
+        self.manifest.add_file(table_name, file.getinfo(filename), data)
+
+    def write_data_files(
+        self,
+        file,
+        full_tables,
+        partial_tables,
+        chunk_size=None,
+        jobs=1,
+        compression_jobs=1,
+        transforms=None,
+        columns=None,
+    ):
+        """Exports data files in a pool of workers and compresses them in another one.
+
+        The archive is written only from the calling thread, in the same order as data files are listed.
+        """
+        tasks = self.get_data_tasks(full_tables, partial_tables, chunk_size, transforms, columns)
+        snapshot = self.export_snapshot() if jobs > 1 else None
+        self.write_data_members(file, self.export_data_files(tasks, jobs, snapshot), compression_jobs)
+
+    def get_data_tasks(self, full_tables, partial_tables, chunk_size=None, transforms=None, columns=None):
+        """Table names, archive filenames and export queries of all data files."""
+        tasks = []
+        for table_name in full_tables:
+            chunks = self.get_table_chunks(table_name, chunk_size)
+            if len(chunks) == 1:
+                tasks.append((table_name, self.get_data_filename(table_name), chunks[0]))
+            else:
+                for number, sql in enumerate(chunks, 1):
+                    tasks.append((table_name, self.get_data_filename(table_name, number), sql))
+        for table_name, sql in partial_tables.items():
+            tasks.append((table_name, self.get_data_filename(table_name), sql))
+        if transforms or columns:
+            tasks = [
+                (table_name, filename, self.get_export_sql(table_name, sql, transforms, columns))
+                for table_name, filename, sql in tasks
+            ]
+        return tasks
+
+    def export_data_files(self, tasks, jobs=1, snapshot=None):
+        """Yields tasks together with exported data. With a ``snapshot`` every file is exported from it."""
+        if snapshot is not None:
+
+            def export(task):
+                with self.snapshot_connection(snapshot) as connection:
+                    return task, self.export_to_csv(task[2], connection)
+
+        else:
+
+            def export(task):
+                return task, self.export_to_csv(task[2])
 
-    def export_to_csv(self, sql):
+        return map_concurrently(export, tasks, jobs)
+
+    def write_data_members(self, file, exported, compression_jobs=1):
+        """Writes exported data files to the archive, compressing them in a pool of ``compression_jobs`` threads."""
+        if file.compression == zipfile.ZIP_STORED or compression_jobs <= 1:
+            for (table_name, filename, _), data in exported:
+                self.write_archive_member(file, table_name, filename, data)
+        else:
+
+            def compress_data(item):
+                return item[0], compress(item[1], file.compression)
+
+            for (table_name, filename, _), member in map_concurrently(compress_data, exported, compression_jobs):
+                info = write_compressed(file, filename, member)
+                self.manifest.add_file(table_name, info, member.data)
+
+    def get_export_sql(self, table_name, sql, transforms=None, columns=None):
+        """Wraps the export query into ``SELECT`` with columns, that are selected by ``columns`` projection.
+
+        Columns could be replaced with expressions from ``transforms``. The wrapped query is used only for the export,
+        therefore all columns are available for selection of related data.
+        """
+        expressions = (transforms or {}).get(table_name) or {}
+        projection = (columns or {}).get(table_name)
+        if not expressions and not projection:
+            return sql
+        query_columns = self.get_query_columns(sql)
+        check_columns(table_name, "Transformed", expressions, query_columns)
+        selected_columns = get_projected_columns(table_name, query_columns, projection)
+        select_list = ", ".join(
+            "{0} AS {1}".format(expressions[column], column) if column in expressions else column
+            for column in selected_columns
+        )
+        return EXPORT_SQL_TEMPLATE.format(columns=select_list, sql=sql)
+
+    def get_query_columns(self, sql):
+        """Names of columns in the result of the query. The query is not executed."""
+        cursor = self.get_cursor()
+        cursor.execute("SELECT * FROM ({0}) T LIMIT 0".format(sql))
+        cursor.fetchall()
+        return [column[0] for column in cursor.description]
+
+    def get_table_chunks(self, table_name, chunk_size=None):
+        """Queries to select the table data by parts of ~``chunk_size`` rows.
+
+        Tables are split by ranges of an integer primary key. Tables without it are not split.
+        """
+        sql = "SELECT * FROM {0}".format(table_name)
+        if not chunk_size:
+            return [sql]
+        key = self.get_chunk_key(table_name)
+        if key is None:
+            return [sql]
+        rows = self.estimate_rows(table_name)
+        if rows <= chunk_size:
+            return [sql]
+        bounds = self.run(CHUNK_BOUNDS_SQL.format(key=key, table_name=table_name))[0]
+        if bounds["min_value"] is None:
+            return [sql]
+        chunks = -(-rows // chunk_size)
+        step = max(1, -(-(bounds["max_value"] - bounds["min_value"] + 1) // chunks))
+        return [
+            "{sql} WHERE {key} >= {start} AND {key} < {end}".format(sql=sql, key=key, start=start, end=start + step)
+            for start in range(bounds["min_value"], bounds["max_value"] + 1, step)
+        ]
+
+    def get_chunk_key(self, table_name):
+        """Integer column, that could be used to split the table into ranges. ``None`` if there is no such column."""
+        raise NotImplementedError
+
+    def estimate_rows(self, table_name):
+        """Approximate number of rows in the table."""
+        return self.run('SELECT COUNT(*) AS "count" FROM {0}'.format(table_name))[0]["count"]
+
+    def export_snapshot(self):
+        """Makes the current state of the database available for other connections. Required for concurrent export."""
+        raise NotImplementedError
+
+    def snapshot_connection(self, snapshot):
+        """Context manager, that checks out a connection, which sees the database state from the given snapshot."""
+        raise NotImplementedError
+
+    def is_snapshot_valid(self, snapshot):
+        """Could a connection still be attached to the snapshot. It is valid while the exporting transaction is open."""
+        raise NotImplementedError
+
+    def write_manifest(self, file, foreign_keys=None):
+        """Writes the description of the archive content."""
+        if self.manifest.tables:
+            if foreign_keys is None:
+                dependencies = self.get_dependencies(list(self.manifest.tables))
+            else:
+                dependencies = group_foreign_keys(foreign_keys)
+            self.manifest.set_dependencies(dependencies)
+        file.writestr(self.manifest_filename, self.manifest.dumps())
+
+    def export_to_csv(self, sql, connection=None):
         raise NotImplementedError
 
     # Database re-creation
 
-    def recreate_database(self, owner=None):
-        """Drops all connections to the database, drops the database and creates it again."""
+    def recreate_database(self, owner=None, template=None):
+        """Drops all connections to the database, drops the database and creates it again.
+
+        With ``template`` the new database is a copy of the given one.
+        """
         self.drop_database(self.dbname)
-        self.create_database(self.dbname, owner)
+        self.create_database(self.dbname, owner, template=template)
         self.cache_clear()
 
     def drop_database(self, dbname):
@@ -211,18 +594,63 @@ class BaseBackend(object):
     def create_database(self, dbname, *args, **kwargs):
         raise NotImplementedError
 
-    def truncate(self):
-        """Truncates all tables in the DB. Alternative for the re-creation option."""
+    def database_exists(self, dbname):
+        raise NotImplementedError
+
+    def rename_database(self, dbname, new_dbname):
+        """Renames a database, that has no open connections."""
         raise NotImplementedError
 
+    def truncate(self, skip_empty=False):
+        """Truncates all tables in the DB. Alternative for the re-creation option.
+
+        With ``skip_empty`` only tables with at least one row are truncated, they are found by a batched query.
+        Empty tables are kept as is, therefore PostgreSQL doesn't load them with ``COPY FREEZE``.
+        """
+        raise NotImplementedError
+
+    def get_non_empty_tables(self, tables):
+        """Tables, that contain at least one row. Each table is probed with ``EXISTS``, in batches of one query."""
+        tables = list(tables)
+        non_empty = []
+        for start in range(0, len(tables), PROBE_BATCH_SIZE):
+            sql = " UNION ALL ".join(
+                NON_EMPTY_PROBE_TEMPLATE.format(table_name=table_name)
+                for table_name in tables[start : start + PROBE_BATCH_SIZE]
+            )
+            non_empty.extend(row["table_name"] for row in self.run(sql))
+        return non_empty
+
     # Loading the dump
 
-    def load(self, filename):
-        """Loads schema, sequences and data into the database."""
+    def load(
+        self,
+        filename,
+        tables=None,
+        jobs=1,
+        read_ahead=DEFAULT_READ_AHEAD,
+        merge=False,
+        resumable=False,
+        resume=False,
+    ):
+        """Loads schema, sequences and data into the database.
+
+        If ``tables`` are given, then only their data is loaded together with data of all tables they refer to.
+        With ``jobs`` > 1 data files are loaded concurrently, each one in a separate transaction.
+        Otherwise up to ``read_ahead`` next data files are decompressed while the current one is loaded.
+        With ``merge`` the schema is expected to exist. Rows are inserted or updated by their primary keys and
+        rows, that are absent in the dump, are kept.
+        With ``resumable`` every table is committed separately together with a record about its data files in the
+        bookkeeping table. ``resume`` finishes an interrupted resumable load - recorded data files are skipped.
+        """
         with self.log_time("Total execution time: %s"):
             archive = zipfile.ZipFile(filename)
-            self.initial_setup(archive)
-            self.load_data(archive)
+            if resumable or resume:
+                self.load_resumable(archive, tables, jobs, read_ahead, merge, resume)
+                return
+            if not merge:
+                self.initial_setup(archive)
+            self.load_data(archive, tables, jobs, read_ahead, merge)
 
     def initial_setup(self, archive):
         """Loads schema and initial database configuration."""
@@ -236,19 +664,213 @@ class BaseBackend(object):
     def run_setup_file(self, sql):
         return self.run(sql)
 
-    def load_data(self, archive):
+    def load_data(self, archive, tables=None, jobs=1, read_ahead=DEFAULT_READ_AHEAD, merge=False):
         """Loads all data from data files inside the archive to the database."""
+        data_files = self.get_data_files(archive, tables)
+        manifest = self.read_manifest(archive)
+        if jobs > 1 and manifest is not None:
+            self.load_data_concurrently(archive, manifest, data_files, jobs, merge)
+            return
+        load_data_file = self.get_data_file_loader(merge)
         with self.transaction():
-            for name in archive.namelist():
-                if name.startswith(self.data_dir):
-                    fd = archive.open(name)
-                    table_name = os.path.basename(name).split(".")[0]
-                    self.load_data_file(table_name, fd)
+            for table_name, fd in self.read_data_files(archive, data_files, read_ahead):
+                load_data_file(table_name, fd)
+
+    def load_resumable(self, archive, tables=None, jobs=1, read_ahead=DEFAULT_READ_AHEAD, merge=False, resume=False):
+        """Loads data files, that are not recorded in the bookkeeping table yet. The table is dropped at the end."""
+        archive_id = get_archive_id(archive)
+        loaded = self.get_loaded_members(archive_id) if resume else set()
+        if INITIAL_SETUP_MEMBER not in loaded:
+            if not merge:
+                self.initial_setup(archive)
+            self.run(PROGRESS_TABLE_SQL)
+            self.mark_loaded(archive_id, [INITIAL_SETUP_MEMBER])
+            self.get_connection().commit()
+        data_files = self.get_data_files(archive, tables)
+        pending = [(table_name, name) for table_name, name in data_files if name not in loaded]
+        self.logger.info("Data files to load: %s of %s", len(pending), len(data_files))
+        manifest = self.read_manifest(archive)
+        if jobs > 1 and manifest is not None:
+            self.load_data_concurrently(archive, manifest, pending, jobs, merge, archive_id)
+        else:
+            self.load_tables_separately(archive, pending, archive_id, read_ahead, merge)
+        self.run("DROP TABLE {0}".format(PROGRESS_TABLE))
+        self.get_connection().commit()
+
+    def load_tables_separately(self, archive, data_files, archive_id, read_ahead=DEFAULT_READ_AHEAD, merge=False):
+        """Commits every table together with the record about its data files in the bookkeeping table."""
+        load_data_file = self.get_data_file_loader(merge)
+        files = self.read_data_files(archive, data_files, read_ahead)
+        for _, group in itertools.groupby(data_files, key=lambda item: item[0]):
+            names = [name for _, name in group]
+            for _ in names:
+                load_data_file(*next(files))
+            self.mark_loaded(archive_id, names)
+            self.get_connection().commit()
+
+    def get_loaded_members(self, archive_id):
+        """Archive members, that were loaded by an interrupted resumable load of the same archive."""
+        if not self.table_exists(PROGRESS_TABLE):
+            return set()
+        sql = "SELECT member FROM {0} WHERE archive = {1}".format(PROGRESS_TABLE, self.placeholder)
+        return {row["member"] for row in self.run(sql, (archive_id,))}
+
+    def mark_loaded(self, archive_id, names, connection=None):
+        """Records loaded archive members. Should be called in the same transaction, that loads them."""
+        sql = "INSERT INTO {0} (archive, member) VALUES ({1}, {1})".format(PROGRESS_TABLE, self.placeholder)
+        cursor = self.get_cursor() if connection is None else connection.cursor()
+        with self.log_query(sql):
+            cursor.executemany(sql, [(archive_id, name) for name in names])
+
+    def table_exists(self, table_name):
+        raise NotImplementedError
+
+    def verify(self, filename, range_size=DEFAULT_RANGE_SIZE):
+        """Differences between tables in the archive and in the database. Digests are calculated by the database."""
+        with zipfile.ZipFile(filename) as archive:
+            expected = digest_archive(archive, range_size, self.data_dir)
+        actual = {
+            table_name: self.digest_table(table_name, digest.columns, range_size)
+            for table_name, digest in expected.items()
+            if digest.columns
+        }
+        return compare_digests(expected, actual)
+
+    def digest_table(self, table_name, columns, range_size=DEFAULT_RANGE_SIZE):
+        """Row counts and sums of row hashes by ranges of the first column. See ``xdump.verify``."""
+        raise NotImplementedError
+
+    def get_data_file_loader(self, merge=False):
+        if merge:
+            return self.merge_data_file
+        return self.load_data_file
+
+    def read_data_files(self, archive, data_files, read_ahead=DEFAULT_READ_AHEAD):
+        """Opens data files for loading.
+
+        With ``read_ahead`` they are decompressed by a separate thread, up to ``read_ahead`` megabytes ahead of the
+        database.
+
+        Backpressure metrics of the last load are available in ``read_ahead_stats``.
+        """
+        if not read_ahead:
+            for table_name, name in data_files:
+                yield table_name, archive.open(name)
+            return
+        table_names = {name: table_name for table_name, name in data_files}
+        reader = ReadAhead(archive, [name for _, name in data_files], read_ahead)
+        self.read_ahead_stats = reader.stats
+        for name, fd in reader:
+            yield table_names[name], fd
+        self.logger.info("Read-ahead: %s", reader.stats)
+
+    def load_data_concurrently(self, archive, manifest, data_files, jobs, merge=False, archive_id=None):
+        """Loads data files in a pool of workers, level by level from the manifest's restore order.
+
+        Every data file is committed separately, therefore referred rows are always committed before referring ones.
+        Data files of a self-referencing table are loaded sequentially in the same transaction.
+        With ``archive_id`` loaded data files are recorded in the bookkeeping table.
+        """
+        # The schema should be visible for the workers
+        self.get_connection().commit()
+        names = {}
+        for table_name, name in data_files:
+            names.setdefault(table_name, []).append(name)
+        for level in manifest.restore_order:
+            tasks = []
+            for table_name in level:
+                if table_name not in names:
+                    continue
+                if manifest.is_self_referencing(table_name):
+                    tasks.append((table_name, names[table_name]))
+                else:
+                    tasks.extend((table_name, [name]) for name in names[table_name])
+            run_concurrently(
+                lambda task: self.load_data_files(archive, *task, merge=merge, archive_id=archive_id), tasks, jobs
+            )
+
+    def load_data_files(self, archive, table_name, names, merge=False, archive_id=None):
+        """Loads data files of the table with a separate connection."""
+        load_data_file = self.get_data_file_loader(merge)
+        with self.connection() as connection:
+            for name in names:
+                load_data_file(table_name, archive.open(name), connection)
+            if archive_id is not None:
+                self.mark_loaded(archive_id, names, connection)
+            connection.commit()
+
+    def get_data_files(self, archive, tables=None):
+        """Table names and corresponding data files in the archive.
+
+        If the archive has a manifest, data files are returned in its restore order.
+        If ``tables`` are given, only data files for them and for tables they refer to are returned,
+        parent tables go first.
+        """
+        manifest = self.read_manifest(archive)
+        if manifest is not None:
+            data_files = manifest.get_data_files()
+        else:
+            data_files = [
+                (os.path.basename(name).split(".")[0], name)
+                for name in archive.namelist()
+                if name.startswith(self.data_dir)
+            ]
+        if tables is None:
+            return data_files
+        # Big tables are split into multiple data files
+        table_names = []
+        names = {}
+        for table_name, name in data_files:
+            if table_name not in names:
+                table_names.append(table_name)
+            names.setdefault(table_name, []).append(name)
+        missing_tables = set(tables) - set(names)
+        if missing_tables:
+            raise ValueError(
+                "Tables are not found in the archive: {tables}".format(tables=", ".join(sorted(missing_tables)))
+            )
+        if manifest is not None:
+            dependencies = manifest.dependencies
+        else:
+            dependencies = group_foreign_keys(self.introspect_foreign_keys())
+        closure = self.get_tables_closure(tables, dependencies)
+        closure = [table_name for table_name in table_names if table_name in closure]
+        levels = get_dependency_levels(closure, dependencies)
+        return [(table_name, name) for level in levels for table_name in level for name in names[table_name]]
+
+    def read_manifest(self, archive):
+        """Manifest of the archive. Archives, created by older versions, don't have it."""
+        if self.manifest_filename not in archive.namelist():
+            return None
+        return Manifest.loads(archive.read(self.manifest_filename))
+
+    def get_tables_closure(self, tables, dependencies=None):
+        """Given tables together with all tables they refer to, directly or transitively.
+
+        References are taken from ``dependencies`` mapping if it is given, otherwise from the database.
+        """
+        if dependencies is None:
+            dependencies = group_foreign_keys(self.introspect_foreign_keys())
+        closure = set()
+        pending = set(tables)
+        while pending:
+            closure.update(pending)
+            references = [dependencies.get(table_name, ()) for table_name in pending]
+            pending = set(itertools.chain.from_iterable(references)) - closure
+        return closure
+
+    def get_dependencies(self, tables):
+        """Tables, that are referred by foreign keys from the given tables."""
+        raise NotImplementedError
 
-    def load_data_file(self, table_name, fd):
+    def load_data_file(self, table_name, fd, connection=None):
         """Loads a data file into the database."""
         raise NotImplementedError
 
+    def merge_data_file(self, table_name, fd, connection=None):
+        """Inserts rows from a data file into the database or updates existing ones with the same primary key."""
+        raise NotImplementedError
+
 
 RECURSIVE_QUERY_TEMPLATE = """
 WITH RECURSIVE recursive_cte AS (
@@ -256,7 +878,23 @@ WITH RECURSIVE recursive_cte AS (
   UNION
   SELECT T.*
   FROM {table_name} T
-  INNER JOIN recursive_cte ON (recursive_cte.{column_name} = T.{foreign_column_name})
+  INNER JOIN recursive_cte ON ({columns} = {foreign_columns})
 )
 SELECT * FROM recursive_cte
 """
+# Bookkeeping of resumable loads. Loaded archive members are recorded in the same transaction as their data
+PROGRESS_TABLE = "xdump_progress"
+PROGRESS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS xdump_progress (
+  archive VARCHAR(64) NOT NULL,
+  member TEXT NOT NULL,
+  PRIMARY KEY (archive, member)
+)
+"""
+INITIAL_SETUP_MEMBER = "<initial setup>"
+NON_EMPTY_PROBE_TEMPLATE = "SELECT '{table_name}' AS table_name WHERE EXISTS (SELECT 1 FROM {table_name})"
+# SQLite limits the number of terms in a compound SELECT to 500 by default
+PROBE_BATCH_SIZE = 500
+NO_PRIMARY_KEY_MESSAGE = "Table {0} has no primary key, its rows could not be merged"
+EXPORT_SQL_TEMPLATE = "SELECT {columns} FROM ({sql}) T"
+CHUNK_BOUNDS_SQL = "SELECT MIN({key}) AS min_value, MAX({key}) AS max_value FROM {table_name}"
@@ -0,0 +1,230 @@
+# coding: utf-8
+"""Checkpoints of long dumps in a work directory.
+
+The plan of a dump - export queries of all data files and the ID of the snapshot they are exported from - is written
+before the export. Every exported data file is written durably to the work directory, therefore an interrupted dump
+could be resumed from the first missing data file and the archive is assembled only when all of them are exported.
+"""
+import os
+
+import attr
+
+from .utils import dump_json, load_json
+
+PLAN_VERSION = 1
+
+
+class CheckpointError(Exception):
+    """The dump could not be started or resumed in the given work directory."""
+
+
+@attr.s(cmp=False)
+class Plan(object):
+    """Everything that is needed to finish an interrupted dump.
+
+    ``tasks`` is a list of ``(table_name, filename, sql)`` for every data file in the order they are written to the
+    archive.
+    """
+
+    tasks = attr.ib(convert=lambda value: [tuple(task) for task in value])
+    snapshot = attr.ib(default=None)
+    initial_setup_files = attr.ib(default=attr.Factory(list))
+    foreign_keys = attr.ib(default=None)
+    # The state of the database before the export, see ``Manifest.source``
+    source = attr.ib(default=None)
+    version = attr.ib(default=PLAN_VERSION)
+
+    def dumps(self):
+        return dump_json(
+            {
+                "version": self.version,
+                "tasks": self.tasks,
+                "snapshot": self.snapshot,
+                "initial_setup_files": self.initial_setup_files,
+                "foreign_keys": self.foreign_keys,
+                "source": self.source,
+            }
+        )
+
+    @classmethod
+    def loads(cls, data):
+        content = load_json(data)
+        if content["version"] > PLAN_VERSION:
+            raise CheckpointError(
+                "Unsupported plan version: {0}. Maximum supported version is {1}".format(
+                    content["version"], PLAN_VERSION
+                )
+            )
+        return cls(
+            tasks=content["tasks"],
+            snapshot=content["snapshot"],
+            initial_setup_files=content["initial_setup_files"],
+            foreign_keys=content["foreign_keys"],
+            source=content.get("source"),
+            version=content["version"],
+        )
+
+
+def write_durably(path, data):
+    """Writes the file atomically and flushes it to the disk. A partially written file is never visible."""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as fd:
+        fd.write(data)
+        fd.flush()
+        os.fsync(fd.fileno())
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temporary_path, path)
+    fsync_directory(os.path.dirname(path))
+
+
+def fsync_directory(path):
+    """Makes the rename durable. Directories could not be opened on Windows."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@attr.s(cmp=False)
+class WorkDir(object):
+    """Checkpoints of a single dump. Archive members are stored under their names in the archive."""
+
+    path = attr.ib(convert=os.path.abspath)
+    plan_filename = "plan.json"
+
+    def get_path(self, name):
+        return os.path.join(self.path, *name.split("/"))
+
+    def has_plan(self):
+        return os.path.exists(self.get_path(self.plan_filename))
+
+    def read_plan(self):
+        if not self.has_plan():
+            raise CheckpointError("There is no interrupted dump in `{0}`".format(self.path))
+        return Plan.loads(self.read(self.plan_filename))
+
+    def write_plan(self, plan):
+        self.writestr(self.plan_filename, plan.dumps())
+
+    def exists(self, name):
+        return os.path.exists(self.get_path(name))
+
+    def read(self, name):
+        with open(self.get_path(name), "rb") as fd:
+            return fd.read()
+
+    def writestr(self, name, data):
+        """The same signature as ``ZipFile.writestr`` has, to write archive members as checkpoints."""
+        path = self.get_path(name)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        write_durably(path, data)
+
+    def clear(self, names):
+        """Removes the plan and the given checkpoints. Directories are removed only if nothing else is left there."""
+        for name in list(names) + [self.plan_filename]:
+            path = self.get_path(name)
+            if os.path.exists(path):
+                os.remove(path)
+            directory = os.path.dirname(path)
+            while directory != os.path.dirname(self.path) and os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+
+
+def dump_with_checkpoints(backend, filename, options, work_dir, resume=False, skip_unchanged=False):
+    """Exports data files to the work directory, skipping already exported ones, and assembles the archive.
+
+    ``options`` is ``DumpOptions``, only the compression and the number of jobs are taken from it on resume.
+    Returns ``False`` if the dump is skipped, see ``BaseBackend.dump``.
+    """
+    if resume:
+        plan = work_dir.read_plan()
+        snapshot = get_valid_snapshot(backend, plan)
+    else:
+        if work_dir.has_plan():
+            raise CheckpointError(
+                "`{0}` contains an interrupted dump. Resume it or remove the directory".format(work_dir.path)
+            )
+        backend.input_check(options.full_tables, options.partial_tables, options.samples)
+        source = backend.get_source(options)
+        if skip_unchanged and backend.is_archive_up_to_date(filename, source):
+            return False
+        plan = make_plan(backend, work_dir, options, source)
+        work_dir.write_plan(plan)
+        snapshot = plan.snapshot
+    pending = [task for task in plan.tasks if not work_dir.exists(task[1])]
+    backend.logger.info("Data files to export: %s of %s", len(pending), len(plan.tasks))
+    if resume and pending and snapshot is None:
+        check_source_state(backend, plan)
+    # Without a snapshot workers would not see the same state of the database
+    for (_, name, _), data in backend.export_data_files(pending, options.jobs if snapshot else 1, snapshot):
+        work_dir.writestr(name, data)
+    with backend.create_archive(filename, options.compression, plan.source, plan.foreign_keys) as file:
+        for name in plan.initial_setup_files:
+            file.writestr(name, work_dir.read(name))
+        exported = ((task, work_dir.read(task[1])) for task in plan.tasks)
+        backend.write_data_members(file, exported, options.compression_jobs)
+    work_dir.clear(plan.initial_setup_files + [name for _, name, _ in plan.tasks])
+    return True
+
+
+def get_valid_snapshot(backend, plan):
+    """The snapshot of the interrupted dump or ``None`` if it is released.
+
+    An exported snapshot lives only while the exporting transaction is open, e.g. it is released if the process crashes.
+    """
+    if plan.snapshot is not None and not backend.is_snapshot_valid(plan.snapshot):
+        backend.logger.info("Snapshot `%s` of the interrupted dump is not valid anymore", plan.snapshot)
+        return None
+    return plan.snapshot
+
+
+def check_source_state(backend, plan):
+    """Checks that the database is not changed since the plan was made.
+
+    Without a snapshot the rest of data files could be exported only from the same state of the database, otherwise the
+    archive would contain data from different states.
+    """
+    state = backend.get_source_state()
+    if state is None or plan.source is None or state != plan.source["state"]:
+        raise CheckpointError(
+            "The database is changed since the interrupted dump was started or its state is unknown, "
+            "the dump should be started from scratch"
+        )
+
+
+def make_plan(backend, work_dir, options, source=None):
+    """Writes the initial setup to the work directory and builds queries for all data files."""
+    initial_setup_files = []
+    if options.dump_schema:
+        backend.write_initial_setup(work_dir, options.schema)
+        initial_setup_files = [name for name in backend.initial_setup_files if work_dir.exists(name)]
+    tasks = []
+    snapshot = None
+    foreign_keys = options.foreign_keys
+    if options.dump_data:
+        if foreign_keys is None:
+            # Relations are introspected once for both related data and the manifest
+            foreign_keys = backend.introspect_foreign_keys()
+        partial_tables = backend.get_partial_tables(options.partial_tables, options.samples)
+        backend.add_related_data(options.full_tables, partial_tables, foreign_keys)
+        tasks = backend.get_data_tasks(
+            options.full_tables, partial_tables, options.chunk_size, options.transforms, options.columns
+        )
+        if backend.supports_snapshots:
+            snapshot = backend.export_snapshot()
+    return Plan(
+        tasks=tasks,
+        snapshot=snapshot,
+        initial_setup_files=initial_setup_files,
+        foreign_keys=foreign_keys,
+        source=source,
+    )
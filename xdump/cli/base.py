@@ -1,5 +1,7 @@
 import click
 
+from ..verify import DEFAULT_RANGE_SIZE
+
 COMMON_DECORATORS = [
     click.option("-D", "--dbname", required=True, help="database to work with"),
     click.option(
@@ -24,3 +26,10 @@ PG_DECORATORS = [
     ),
     click.option("-P", "--port", default="5432", help="database server port number"),
 ]
+
+RANGE_SIZE_OPTION = click.option(
+    "--range-size",
+    help="size of key ranges, that are compared separately",
+    default=DEFAULT_RANGE_SIZE,
+    type=click.IntRange(1),
+)
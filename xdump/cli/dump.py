@@ -1,10 +1,14 @@
-import sys
-import zipfile
-
+import attr
 import click
 
-from .base import COMMON_DECORATORS, PG_DECORATORS
-from .utils import apply_decorators, init_backend
+from ..checkpoint import CheckpointError
+from ..compression import COMPRESSION_MAPPING
+from ..profiles import get_backend_path, get_profiles, read_config, run_profiles
+from ..sampling import SAMPLING_METHODS, Sample
+from ..utils import DEFAULT_JOBS
+from ..verify import diff_archives
+from .base import COMMON_DECORATORS, PG_DECORATORS, RANGE_SIZE_OPTION
+from .utils import apply_decorators, init_backend, report_differences
 
 
 @click.group(name="xdump")
@@ -29,18 +33,64 @@ def parse_partial(ctx, param, value):
     return dict(parse_value(partial) for partial in value)
 
 
-COMPRESSION_MAPPING = {
-    "deflated": zipfile.ZIP_DEFLATED,
-    "stored": zipfile.ZIP_STORED,
-}
-if sys.version_info[0] == 3:
-    # BZIP2 & LZMA are not available on Python 2
-    COMPRESSION_MAPPING.update(bzip2=zipfile.ZIP_BZIP2, lzma=zipfile.ZIP_LZMA)
+def parse_sample(ctx, param, value):
+    """Parse values for `sample` option. They should be in the format `table:percent%[:seed]`."""
 
+    def parse_value(value):
+        try:
+            table_name, rest = value.split(":", 1)
+            percent, _, seed = rest.partition(":")
+            return table_name.strip(), Sample(percent.strip().rstrip("%"), seed=int(seed) if seed else None)
+        except ValueError:
+            raise click.exceptions.BadParameter(
+                'sample specification should be in the following format: "table:percent%[:seed]", '
+                "where percent is in (0, 100] range",
+                param=param,
+            )
 
-DEFAULT_PARAMETERS = [
-    dump.command(),
-    click.option("-o", "--output", required=True, help="output file name"),
+    return dict(parse_value(sample) for sample in value)
+
+
+def parse_transform(ctx, param, value):
+    """Parse values for `transform` option. They should be in the format `table.column:SQL expression`."""
+    transforms = {}
+    for item in value:
+        try:
+            column, expression = item.split(":", 1)
+            table_name, column = column.split(".", 1)
+        except ValueError:
+            raise click.exceptions.BadParameter(
+                'transform specification should be in the following format: "table.column:SQL expression"',
+                param=param,
+            )
+        transforms.setdefault(table_name.strip(), {})[column.strip()] = expression.strip()
+    return transforms
+
+
+def parse_columns(ctx, param, value):
+    """Parse values for `include-columns` / `exclude-columns` options in the format `table:column1,column2`."""
+    columns = {}
+    for item in value:
+        table_name, _, names = item.partition(":")
+        names = [name.strip() for name in names.split(",") if name.strip()]
+        if not table_name.strip() or not names:
+            raise click.exceptions.BadParameter(
+                'columns specification should be in the following format: "table:column1,column2"', param=param
+            )
+        columns.setdefault(table_name.strip(), []).extend(names)
+    return columns
+
+
+def get_projections(include_columns, exclude_columns):
+    """Projections of tables in the format, that is accepted by ``dump``."""
+    projections = {}
+    for key, columns in (("include", include_columns), ("exclude", exclude_columns)):
+        for table_name, names in columns.items():
+            projections.setdefault(table_name, {})[key] = names
+    return projections
+
+
+COMMON_PARAMETERS = [
     click.option(
         "-f",
         "--full",
@@ -54,6 +104,32 @@ DEFAULT_PARAMETERS = [
         callback=parse_partial,
         multiple=True,
     ),
+    click.option(
+        "--sample",
+        help='random sample of a table in a form "table_name:percent%[:seed]". Could be used multiple times',
+        callback=parse_sample,
+        multiple=True,
+    ),
+    click.option(
+        "-x",
+        "--transform",
+        help='column transform in a form "table.column:SQL expression", e.g. to mask personal data. '
+        "Could be used multiple times",
+        callback=parse_transform,
+        multiple=True,
+    ),
+    click.option(
+        "--include-columns",
+        help='columns to be dumped in a form "table:column1,column2". Could be used multiple times',
+        callback=parse_columns,
+        multiple=True,
+    ),
+    click.option(
+        "--exclude-columns",
+        help='columns to be omitted in a form "table:column1,column2". Could be used multiple times',
+        callback=parse_columns,
+        multiple=True,
+    ),
     click.option(
         "-c",
         "--compression",
@@ -61,6 +137,17 @@ DEFAULT_PARAMETERS = [
         default="deflated",
         type=click.Choice(list(COMPRESSION_MAPPING.keys())),
     ),
+    click.option(
+        "--compression-jobs",
+        help="number of threads compressing data files",
+        default=1,
+        type=click.IntRange(1),
+    ),
+    click.option(
+        "--chunk-size",
+        help="split full tables into data files of about this number of rows by primary key ranges",
+        type=click.IntRange(1),
+    ),
     click.option(
         "--schema/--no-schema",
         help="include / exclude the schema from the dump",
@@ -71,70 +158,240 @@ DEFAULT_PARAMETERS = [
         help="include / exclude the data from the dump",
         default=True,
     ),
+    click.option(
+        "--work-dir",
+        help="directory to keep exported data files until the archive is written. "
+        "An interrupted dump could be resumed from it",
+        type=click.Path(file_okay=False),
+    ),
+    click.option(
+        "--resume",
+        help="finish an interrupted dump from --work-dir. Tables and queries are taken from its plan",
+        is_flag=True,
+    ),
+    click.option(
+        "--skip-unchanged",
+        help="keep the output file if it was made with the same options and the database is not changed since then",
+        is_flag=True,
+    ),
 ] + COMMON_DECORATORS
+DEFAULT_PARAMETERS = [
+    dump.command(),
+    click.option("-o", "--output", required=True, help="output file name"),
+] + COMMON_PARAMETERS
+TRANSFER_DECORATORS = [
+    click.option("--to-db", help="target database to copy the data into, instead of writing an archive"),
+    click.option("--to-user", help="target database user. Defaults to --user"),
+    click.option("--to-password", help="password for the target DB connection. Defaults to --password"),
+    click.option("--to-host", help="target database server host. Defaults to --host"),
+    click.option("--to-port", help="target database server port. Defaults to --port"),
+    click.option(
+        "-j",
+        "--jobs",
+        help="number of concurrent workers. Defaults to {0} with --to-db and to 1 otherwise".format(DEFAULT_JOBS),
+        type=click.IntRange(1),
+    ),
+]
+PG_PARAMETERS = (
+    [
+        dump.command(),
+        click.option("-o", "--output", help="output file name. Required unless --to-db is given"),
+    ]
+    + COMMON_PARAMETERS
+    + [
+        click.option(
+            "--sample-method",
+            help="method of tables sampling",
+            default="bernoulli",
+            type=click.Choice(SAMPLING_METHODS),
+        )
+    ]
+    + PG_DECORATORS
+    + TRANSFER_DECORATORS
+)
+# Options, that describe the archive, with their default values. They are not applicable to `--to-db`
+ARCHIVE_OPTIONS = (
+    ("output", None),
+    ("compression", "deflated"),
+    ("compression_jobs", 1),
+    ("chunk_size", None),
+    ("work_dir", None),
+    ("resume", False),
+    ("skip_unchanged", False),
+)
+
 
+def get_dump_kwargs(options):
+    """Arguments of ``dump`` from values of command line options."""
+    return {
+        "full_tables": options["full"],
+        "partial_tables": options["partial"],
+        "compression": COMPRESSION_MAPPING[options["compression"]],
+        "dump_schema": options["schema"],
+        "dump_data": options["data"],
+        "samples": options["sample"],
+        "chunk_size": options["chunk_size"],
+        "jobs": options["jobs"] or 1,
+        "compression_jobs": options["compression_jobs"],
+        "transforms": options["transform"],
+        "columns": get_projections(options["include_columns"], options["exclude_columns"]),
+        "work_dir": options["work_dir"],
+        "resume": options["resume"],
+        "skip_unchanged": options["skip_unchanged"],
+    }
 
-def base_dump(backend_path, output, full, partial, compression, schema, data, **kwargs):
+
+def base_dump(backend_path, output, dump_kwargs, **kwargs):
     """Common implementation of dump command. Writes a few logs, imports a backend and makes a dump."""
-    compression = COMPRESSION_MAPPING[compression]
+    if dump_kwargs["resume"] and not dump_kwargs["work_dir"]:
+        raise click.UsageError('Option "--resume" requires "--work-dir".')
 
     click.echo("Dumping ...")
     click.echo("Output file: {0}".format(output))
 
     backend = init_backend(backend_path, **kwargs)
-    backend.dump(
-        output,
-        full_tables=full,
-        partial_tables=partial,
-        compression=compression,
-        dump_schema=schema,
-        dump_data=data,
-    )
+    try:
+        is_dumped = backend.dump(output, **dump_kwargs)
+    except CheckpointError as exc:
+        raise click.ClickException(str(exc))
+    if not is_dumped:
+        click.echo("The database is not changed since the last dump, the output file is kept")
     click.echo("Done!")
 
 
-@apply_decorators(DEFAULT_PARAMETERS + PG_DECORATORS)
-def postgres(
-    user,
-    password,
-    host,
-    port,
-    dbname,
-    verbosity,
-    output,
-    full,
-    partial,
-    compression,
-    schema,
-    data,
-):
-    base_dump(
-        "xdump.postgresql.PostgreSQLBackend",
-        output,
-        full,
-        partial,
-        compression,
-        schema,
-        data,
-        user=user,
-        password=password,
-        host=host,
-        port=port,
-        dbname=dbname,
-        verbosity=verbosity,
-    )
+def get_transfer_kwargs(options):
+    """Arguments of ``transfer`` from values of command line options."""
+    return {
+        "full_tables": options["full"],
+        "partial_tables": options["partial"],
+        "dump_schema": options["schema"],
+        "dump_data": options["data"],
+        "samples": options["sample"],
+        "jobs": options["jobs"] or DEFAULT_JOBS,
+        "transforms": options["transform"],
+        "columns": get_projections(options["include_columns"], options["exclude_columns"]),
+    }
 
 
-@apply_decorators(DEFAULT_PARAMETERS)
-def sqlite(dbname, verbosity, output, full, partial, compression, schema, data):
+def check_transfer_options(options):
+    """The transfer doesn't write an archive, therefore options of the archive are not allowed together with it."""
+    for name, default in ARCHIVE_OPTIONS:
+        if options[name] != default:
+            raise click.UsageError('Option "--{0}" can not be used with "--to-db".'.format(name.replace("_", "-")))
+
+
+def get_target_kwargs(connection_kwargs, options):
+    """Connection to the target database of the transfer. Omitted options are taken from the source connection."""
+    target_kwargs = dict(connection_kwargs, dbname=options["to_db"])
+    for name in ("user", "password", "host", "port"):
+        target_kwargs[name] = options["to_" + name] or connection_kwargs[name]
+    return target_kwargs
+
+
+def base_transfer(backend_path, target_kwargs, transfer_kwargs, **kwargs):
+    """Copies the data directly into another database without writing an archive."""
+    click.echo("Transferring ...")
+    click.echo("Target database: {0}".format(target_kwargs["dbname"]))
+
+    backend = init_backend(backend_path, **kwargs)
+    target = init_backend(backend_path, **target_kwargs)
+    backend.transfer(target, **transfer_kwargs)
+    click.echo("Done!")
+
+
+@apply_decorators(PG_PARAMETERS)
+def postgres(**options):
+    connection_kwargs = {name: options[name] for name in ("user", "password", "host", "port", "dbname", "verbosity")}
+    options["sample"] = {
+        table_name: attr.evolve(value, method=options["sample_method"])
+        for table_name, value in options["sample"].items()
+    }
+    if options["to_db"]:
+        check_transfer_options(options)
+        base_transfer(
+            "xdump.postgresql.PostgreSQLBackend",
+            get_target_kwargs(connection_kwargs, options),
+            get_transfer_kwargs(options),
+            **connection_kwargs
+        )
+        return
+    if not options["output"]:
+        raise click.UsageError('Missing option "-o" / "--output".')
+    base_dump("xdump.postgresql.PostgreSQLBackend", options["output"], get_dump_kwargs(options), **connection_kwargs)
+
+
+@apply_decorators(
+    DEFAULT_PARAMETERS
+    + [
+        click.option(
+            "-j",
+            "--jobs",
+            help="number of worker processes, that export data files from the same state of the database",
+            default=1,
+            type=click.IntRange(1),
+        )
+    ]
+)
+def sqlite(**options):
     base_dump(
         "xdump.sqlite.SQLiteBackend",
-        output,
-        full,
-        partial,
-        compression,
-        schema,
-        data,
-        dbname=dbname,
-        verbosity=verbosity,
+        options["output"],
+        get_dump_kwargs(options),
+        dbname=options["dbname"],
+        verbosity=options["verbosity"],
     )
+
+
+@dump.command()
+@click.argument("config", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-p",
+    "--profile",
+    help="profile to run. Could be used multiple times. All profiles are executed by default",
+    multiple=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="number of profiles executed concurrently, if the database allows it",
+    default=1,
+    type=click.IntRange(1),
+)
+@click.option(
+    "-v",
+    "--verbosity",
+    help="verbosity level",
+    default=0,
+    count=True,
+    type=click.IntRange(0, 2),
+)
+def run(config, profile, jobs, verbosity):
+    """Makes dumps for multiple profiles from a TOML config in one process."""
+    config = read_config(config)
+    connection = dict(config.get("connection", {}))
+    backend_path = get_backend_path(connection)
+    connection.pop("backend", None)
+    try:
+        profiles = get_profiles(config, profile)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+
+    click.echo("Running {0} profiles ...".format(len(profiles)))
+    backend = init_backend(backend_path, verbosity=verbosity, **connection)
+    run_profiles(
+        backend,
+        profiles,
+        jobs,
+        callback=lambda item: click.echo("Profile {0}: {1}".format(item.name, item.output)),
+    )
+    click.echo("Done!")
+
+
+@dump.command()
+@click.argument("first", type=click.Path(exists=True, dir_okay=False))
+@click.argument("second", type=click.Path(exists=True, dir_okay=False))
+@RANGE_SIZE_OPTION
+@click.pass_context
+def diff(ctx, first, second, range_size):
+    """Compares data of two archives without loading them."""
+    report_differences(ctx, diff_archives(first, second, range_size))
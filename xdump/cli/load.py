@@ -1,7 +1,8 @@
 import click
 
-from .base import COMMON_DECORATORS, PG_DECORATORS
-from .utils import apply_decorators, init_backend
+from ..prefetch import DEFAULT_READ_AHEAD
+from .base import COMMON_DECORATORS, PG_DECORATORS, RANGE_SIZE_OPTION
+from .utils import apply_decorators, init_backend, report_differences
 
 
 @click.group(name="xload")
@@ -16,33 +17,109 @@ DEFAULT_PARAMETERS = [
     click.option(
         "-m",
         "--cleanup-method",
-        help="method of DB cleaning up",
-        type=click.Choice(("recreate", "truncate")),
+        help="method of DB cleaning up. `merge` keeps existing rows and upserts ones from the dump by primary keys",
+        type=click.Choice(("recreate", "truncate", "merge")),
+    ),
+    click.option(
+        "-t",
+        "--table",
+        help="table to be loaded together with tables it refers to. Could be used multiple times",
+        multiple=True,
+    ),
+    click.option(
+        "--read-ahead",
+        help="megabytes of data decompressed ahead of the data file being loaded. 0 disables the read-ahead",
+        default=DEFAULT_READ_AHEAD,
+        type=click.IntRange(0),
+    ),
+    click.option(
+        "--skip-empty",
+        help="with `-m truncate` clean up only tables with at least one row. Skipped tables are not loaded frozen",
+        is_flag=True,
+    ),
+    click.option(
+        "--resumable",
+        help="commit every table separately and record the progress in the database, so the load could be resumed",
+        is_flag=True,
+    ),
+    click.option(
+        "--resume",
+        help="finish an interrupted resumable load. Loaded tables are skipped and the database is not cleaned up",
+        is_flag=True,
     ),
 ] + COMMON_DECORATORS
 
 
-def base_load(backend_path, input, cleanup_method, **kwargs):
+def base_load(backend_path, input, cleanup_method, table, read_ahead, skip_empty, resumable, resume, jobs=1, **kwargs):
+    if skip_empty and cleanup_method != "truncate":
+        raise click.UsageError('Option "--skip-empty" requires "-m truncate".')
+
     click.echo("Loading ...")
     click.echo("Input file: {0}".format(input))
 
     backend = init_backend(backend_path, **kwargs)
 
-    if cleanup_method == "truncate":
-        backend.truncate()
+    if resume:
+        click.echo("Resuming ...")
+    elif cleanup_method == "truncate":
+        backend.truncate(skip_empty=skip_empty)
     elif cleanup_method == "recreate":
         backend.recreate_database()
 
-    backend.load(input)
+    backend.load(
+        input,
+        tables=table or None,
+        jobs=jobs,
+        read_ahead=read_ahead,
+        merge=cleanup_method == "merge",
+        resumable=resumable,
+        resume=resume,
+    )
     click.echo("Done!")
 
 
-@apply_decorators(DEFAULT_PARAMETERS + PG_DECORATORS)
-def postgres(user, password, host, port, dbname, verbosity, input, cleanup_method):
+PG_PARAMETERS = (
+    DEFAULT_PARAMETERS
+    + PG_DECORATORS
+    + [
+        click.option(
+            "-j",
+            "--jobs",
+            help="number of data files loaded concurrently. Each one is committed separately",
+            default=1,
+            type=click.IntRange(1),
+        )
+    ]
+)
+
+
+@apply_decorators(PG_PARAMETERS)
+def postgres(
+    user,
+    password,
+    host,
+    port,
+    dbname,
+    verbosity,
+    input,
+    cleanup_method,
+    table,
+    read_ahead,
+    skip_empty,
+    resumable,
+    resume,
+    jobs,
+):
     base_load(
         "xdump.postgresql.PostgreSQLBackend",
         input,
         cleanup_method,
+        table,
+        read_ahead,
+        skip_empty,
+        resumable,
+        resume,
+        jobs,
         user=user,
         password=password,
         host=host,
@@ -53,11 +130,54 @@ def postgres(user, password, host, port, dbname, verbosity, input, cleanup_metho
 
 
 @apply_decorators(DEFAULT_PARAMETERS)
-def sqlite(dbname, verbosity, input, cleanup_method):
+def sqlite(dbname, verbosity, input, cleanup_method, table, read_ahead, skip_empty, resumable, resume):
     base_load(
         "xdump.sqlite.SQLiteBackend",
         input,
         cleanup_method,
+        table,
+        read_ahead,
+        skip_empty,
+        resumable,
+        resume,
         dbname=dbname,
         verbosity=verbosity,
     )
+
+
+@load.group()
+def verify():
+    """Compares the database with the archive."""
+
+
+VERIFY_PARAMETERS = [
+    click.pass_context,
+    click.option("-i", "--input", required=True, help="input file name"),
+    RANGE_SIZE_OPTION,
+] + COMMON_DECORATORS
+
+
+def base_verify(ctx, backend_path, input, range_size, **kwargs):
+    backend = init_backend(backend_path, **kwargs)
+    report_differences(ctx, backend.verify(input, range_size))
+
+
+@apply_decorators([verify.command(name="postgres")] + VERIFY_PARAMETERS + PG_DECORATORS)
+def verify_postgres(ctx, user, password, host, port, dbname, verbosity, input, range_size):
+    base_verify(
+        ctx,
+        "xdump.postgresql.PostgreSQLBackend",
+        input,
+        range_size,
+        user=user,
+        password=password,
+        host=host,
+        port=port,
+        dbname=dbname,
+        verbosity=verbosity,
+    )
+
+
+@apply_decorators([verify.command(name="sqlite")] + VERIFY_PARAMETERS)
+def verify_sqlite(ctx, dbname, verbosity, input, range_size):
+    base_verify(ctx, "xdump.sqlite.SQLiteBackend", input, range_size, dbname=dbname, verbosity=verbosity)
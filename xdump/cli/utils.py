@@ -1,3 +1,6 @@
+import click
+
+
 def apply_decorators(decorators):
     """Apply multiple decorators to the same function. Useful for reusing common decorators among many functions."""
 
@@ -20,3 +23,12 @@ def init_backend(backend_path, **kwargs):
     """Initialize a DB backend."""
     backend_class = import_backend(backend_path)
     return backend_class(**kwargs)
+
+
+def report_differences(ctx, differences):
+    """Prints differences and exits with status 1 if there are any."""
+    for difference in differences:
+        click.echo(str(difference))
+    if differences:
+        ctx.exit(1)
+    click.echo("No differences")
@@ -0,0 +1,96 @@
+# coding: utf-8
+"""Compression of archive members outside of ``zipfile.ZipFile``.
+
+It allows to compress data files in worker threads (``zlib``, ``bz2`` and ``lzma`` release the GIL), while a single
+thread appends the finished entries to the archive.
+"""
+import bz2
+import time
+import zipfile
+import zlib
+
+import attr
+
+ZIP_BZIP2 = getattr(zipfile, "ZIP_BZIP2", None)
+ZIP_LZMA = getattr(zipfile, "ZIP_LZMA", None)
+# Compression methods by their names
+COMPRESSION_MAPPING = {
+    "deflated": zipfile.ZIP_DEFLATED,
+    "stored": zipfile.ZIP_STORED,
+}
+if ZIP_BZIP2 is not None:
+    # BZIP2 & LZMA are not available on Python 2
+    COMPRESSION_MAPPING.update(bzip2=ZIP_BZIP2, lzma=ZIP_LZMA)
+# General purpose flag for LZMA entries - compressed data includes an end-of-stream marker
+LZMA_EOS_FLAG = 0x02
+# ``ZipFile`` has no public API to append already compressed data. These private members are the same in all supported
+# Python versions, if they are changed, then data files are compressed again by ``writestr``
+ZIPFILE_INTERNALS = ("_writecheck", "_didModify", "_allowZip64")
+
+
+@attr.s(cmp=False, slots=True)
+class CompressedData(object):
+    """A compressed archive member together with its original content."""
+
+    data = attr.ib()
+    compressed = attr.ib()
+    compress_type = attr.ib()
+    crc = attr.ib()
+
+
+def get_compressor(compress_type):
+    if compress_type == zipfile.ZIP_DEFLATED:
+        # Raw deflate stream without zlib header, as required by the ZIP format
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    if compress_type == ZIP_BZIP2:
+        return bz2.BZ2Compressor()
+    if compress_type == ZIP_LZMA:
+        return zipfile.LZMACompressor()
+    raise ValueError("Unsupported compression method: {0}".format(compress_type))
+
+
+def compress(data, compress_type):
+    """Compresses data the same way as ``ZipFile.writestr`` does."""
+    compressor = get_compressor(compress_type)
+    compressed = compressor.compress(data) + compressor.flush()
+    crc = zlib.crc32(data) & 0xFFFFFFFF
+    return CompressedData(data=data, compressed=compressed, compress_type=compress_type, crc=crc)
+
+
+def can_write_compressed(file):
+    """If private members of ``ZipFile``, that are needed to append already compressed data, are available."""
+    return all(hasattr(file, name) for name in ZIPFILE_INTERNALS) and hasattr(zipfile.ZipInfo, "FileHeader")
+
+
+def write_compressed(file, filename, member):
+    """Appends already compressed data to the archive, which is opened for writing. Returns ``ZipInfo`` of the entry.
+
+    If ``ZipFile`` internals are not available, the data is compressed again in the calling thread.
+    """
+    zinfo = zipfile.ZipInfo(filename=filename, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = member.compress_type
+    zinfo.external_attr = 0o600 << 16
+    if not can_write_compressed(file):
+        file.writestr(zinfo, member.data)
+        return zinfo
+    if member.compress_type == ZIP_LZMA:
+        zinfo.flag_bits |= LZMA_EOS_FLAG
+    zinfo.file_size = len(member.data)
+    zinfo.compress_size = len(member.compressed)
+    zinfo.CRC = member.crc
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+    if zip64 and not file._allowZip64:
+        raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+    start_dir = getattr(file, "start_dir", None)
+    if start_dir is not None:
+        file.fp.seek(start_dir)
+    zinfo.header_offset = file.fp.tell()
+    file._writecheck(zinfo)
+    file._didModify = True
+    file.fp.write(zinfo.FileHeader(zip64))
+    file.fp.write(member.compressed)
+    if start_dir is not None:
+        file.start_dir = file.fp.tell()
+    file.filelist.append(zinfo)
+    file.NameToInfo[zinfo.filename] = zinfo
+    return zinfo
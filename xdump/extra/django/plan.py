@@ -0,0 +1,91 @@
+# coding: utf-8
+"""Dump configuration in terms of Django models.
+
+Tables in ``XDUMP`` settings could be given as model labels (``"app_label.ModelName"``) and partial tables could be
+defined with querysets or lookups, that are compiled to SQL by the ORM. Relations between tables could be taken from
+models metadata instead of the database introspection.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+
+
+def get_model(value):
+    """Model for the given label or ``None`` if the value is a table name."""
+    try:
+        return apps.get_model(value)
+    except (LookupError, ValueError):
+        return None
+
+
+def get_table_name(value):
+    model = get_model(value)
+    if model is None:
+        return value
+    return model._meta.db_table
+
+
+def get_partial_sql(backend, key, value, alias=DEFAULT_DB_ALIAS):
+    """Select for a partial table.
+
+    ``value`` is an SQL string, a queryset, a callable returning a queryset or a dict of lookups for the ``key`` model.
+    """
+    if callable(value):
+        value = value()
+    if isinstance(value, dict):
+        model = get_model(key)
+        if model is None:
+            raise ValueError("Lookups could be used only with model labels. Got: {0}".format(key))
+        value = model._default_manager.filter(**value)
+    if isinstance(value, QuerySet):
+        return queryset_to_sql(backend, value, alias)
+    return value
+
+
+def queryset_to_sql(backend, queryset, alias=DEFAULT_DB_ALIAS):
+    """Selects all columns of rows from the queryset. Annotations, deferred fields, etc. don't affect the result."""
+    meta = queryset.model._meta
+    subquery, params = queryset.values("pk").query.get_compiler(using=alias).as_sql()
+    sql = "SELECT * FROM {0} WHERE {1} IN (".format(meta.db_table, meta.pk.column) + subquery + ")"
+    return backend.mogrify(sql, params)
+
+
+def get_foreign_keys():
+    """Relations between tables of all installed models, including auto-created many-to-many tables."""
+    foreign_keys = []
+    for model in apps.get_models(include_auto_created=True):
+        meta = model._meta
+        if meta.proxy:
+            continue
+        for field in meta.local_concrete_fields:
+            if field.is_relation and (field.many_to_one or field.one_to_one):
+                target = field.target_field
+                foreign_keys.append(
+                    {
+                        "table_name": meta.db_table,
+                        "column_name": field.column,
+                        "foreign_table_name": target.model._meta.db_table,
+                        "foreign_column_name": target.column,
+                    }
+                )
+    return foreign_keys
+
+
+def get_dump_kwargs(backend, alias=DEFAULT_DB_ALIAS):
+    """Arguments for ``backend.dump`` from ``XDUMP`` settings."""
+    config = settings.XDUMP
+    kwargs = {
+        "full_tables": [get_table_name(value) for value in config["FULL_TABLES"]],
+        "partial_tables": {
+            get_table_name(key): get_partial_sql(backend, key, value, alias)
+            for key, value in config["PARTIAL_TABLES"].items()
+        },
+    }
+    if config.get("FOREIGN_KEYS_FROM_MODELS", False):
+        kwargs["foreign_keys"] = get_foreign_keys()
+    if config.get("TRANSFORMS"):
+        kwargs["transforms"] = {get_table_name(key): value for key, value in config["TRANSFORMS"].items()}
+    if config.get("COLUMNS"):
+        kwargs["columns"] = {get_table_name(key): value for key, value in config["COLUMNS"].items()}
+    return kwargs
@@ -0,0 +1,72 @@
+# coding: utf-8
+import zipfile
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+from .xdump.management.core import get_xdump_backend
+
+
+class XDumpTestRunner(DiscoverRunner):
+    """Loads ``XDUMP["TEST_DUMP"]`` into the test databases only once.
+
+    With ``--parallel`` Django clones the loaded database for every worker (``CREATE DATABASE ... TEMPLATE`` on
+    PostgreSQL and a file copy on SQLite) instead of loading the dump again. With ``--keepdb`` the dump is loaded
+    only into test databases, that don't exist yet.
+    """
+
+    def setup_databases(self, **kwargs):
+        existing = self.get_existing_databases() if self.keepdb else set()
+        parallel = self.parallel
+        # Clones should be created after the dump is loaded
+        self.parallel = 1
+        try:
+            old_config = super(XDumpTestRunner, self).setup_databases(**kwargs)
+        finally:
+            self.parallel = parallel
+        for connection, _, is_created in old_config:
+            if not is_created:
+                # Mirror of another database
+                continue
+            if connection.alias in self.get_aliases() and connection.alias not in existing:
+                self.load_dump(connection)
+            if parallel > 1:
+                for index in range(parallel):
+                    connection.creation.clone_test_db(
+                        suffix=str(index + 1), verbosity=self.verbosity, keepdb=self.keepdb
+                    )
+        return old_config
+
+    def get_aliases(self):
+        """Aliases of databases, that get the dump."""
+        return settings.XDUMP.get("TEST_DATABASES", ("default",))
+
+    def get_existing_databases(self):
+        """Aliases of test databases, that exist before the setup. They are kept from previous runs with the dump."""
+        existing = set()
+        for alias in self.get_aliases():
+            connection = connections[alias]
+            backend = get_xdump_backend(connection.settings_dict)
+            if backend.database_exists(connection.creation._get_test_db_name()):
+                existing.add(alias)
+            backend.cache_clear()
+        return existing
+
+    def load_dump(self, connection):
+        """Loads the dump into the test database. If the dump contains the schema, the database is re-created."""
+        filename = settings.XDUMP["TEST_DUMP"]
+        # Open connections prevent the database re-creation and cloning on PostgreSQL
+        connection.close()
+        backend = get_xdump_backend(connection.settings_dict, verbosity=max(self.verbosity - 1, 0))
+        with zipfile.ZipFile(filename) as archive:
+            has_schema = backend.schema_filename in archive.namelist()
+        if has_schema:
+            backend.recreate_database()
+        else:
+            backend.truncate()
+        backend.load(filename)
+        backend.cache_clear()
+        if getattr(connection, "_test_serialized_contents", None) is not None:
+            # Contents for `serialized_rollback` were taken before the load
+            connection._test_serialized_contents = connection.creation.serialize_db_to_string()
@@ -28,5 +28,8 @@ class Command(XDumpCommand):
 
     def _handle(self, filename, backend, **options):
         backend.dump(
-            filename, dump_data=options["dump_data"], dump_schema=options["dump_schema"], **self.get_dump_kwargs()
+            filename,
+            dump_data=options["dump_data"],
+            dump_schema=options["dump_schema"],
+            **self.get_dump_kwargs(backend, options["alias"])
         )
@@ -12,15 +12,23 @@ class Command(XDumpCommand):
             "--cleanup-method",
             action="store",
             nargs="?",
-            choices=["recreate", "truncate"],
+            choices=["recreate", "truncate", "merge"],
             dest="cleanup_method",
             help="Method of DB cleaning up",
             required=False,
         )
+        parser.add_argument(
+            "-t",
+            "--table",
+            action="append",
+            dest="tables",
+            help="Table to be loaded together with tables it refers to. Could be used multiple times.",
+            required=False,
+        )
 
     def _handle(self, filename, backend, **options):
         if options["cleanup_method"] == "truncate":
             backend.truncate()
         elif options["cleanup_method"] == "recreate":
             backend.recreate_database()
-        backend.load(filename)
+        backend.load(filename, tables=options.get("tables"), merge=options["cleanup_method"] == "merge")
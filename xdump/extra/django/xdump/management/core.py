@@ -3,6 +3,8 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils.module_loading import import_string
 
+from ...plan import get_dump_kwargs
+
 
 class XDumpCommand(BaseCommand):
     def add_arguments(self, parser):
@@ -32,40 +34,45 @@ class XDumpCommand(BaseCommand):
 
     def handle(self, filename, alias, backend, verbosity, **options):
         backend = self.get_xdump_backend(alias, backend, verbosity)
-        self._handle(filename, backend, **options)
+        self._handle(filename, backend, alias=alias, **options)
 
     def _handle(self, filename, backend, **options):
         raise NotImplementedError
 
     def get_xdump_backend(self, alias="default", backend=None, verbosity=0):
-        configuration = self.get_database_configuration(alias)
-        if backend is None:
-            if "BACKEND" in settings.XDUMP:
-                backend = settings.XDUMP["BACKEND"]
-            else:
-                backend = {
-                    "django.db.backends.postgresql": "xdump.postgresql.PostgreSQLBackend",
-                    "django.db.backends.postgresql_psycopg2": "xdump.postgresql.PostgreSQLBackend",
-                    "django.db.backends.sqlite": "xdump.sqlite.SQLiteBackend",
-                }[configuration["ENGINE"]]
-        return _init_backend(
-            backend,
-            dbname=configuration["NAME"],
-            user=configuration.get("USER"),
-            password=configuration.get("PASSWORD"),
-            host=configuration.get("HOST"),
-            port=configuration.get("PORT"),
-            verbosity=verbosity,
-        )
+        return get_xdump_backend(self.get_database_configuration(alias), backend, verbosity)
 
     def get_database_configuration(self, alias):
         return settings.DATABASES[alias]
 
-    def get_dump_kwargs(self):
-        return {
-            "full_tables": settings.XDUMP["FULL_TABLES"],
-            "partial_tables": settings.XDUMP["PARTIAL_TABLES"],
-        }
+    def get_dump_kwargs(self, backend, alias="default"):
+        return get_dump_kwargs(backend, alias)
+
+
+ENGINES = {
+    "django.db.backends.postgresql": "xdump.postgresql.PostgreSQLBackend",
+    "django.db.backends.postgresql_psycopg2": "xdump.postgresql.PostgreSQLBackend",
+    "django.db.backends.sqlite": "xdump.sqlite.SQLiteBackend",
+    "django.db.backends.sqlite3": "xdump.sqlite.SQLiteBackend",
+}
+
+
+def get_xdump_backend(configuration, backend=None, verbosity=0):
+    """Creates a backend for the given database configuration from ``DATABASES``."""
+    if backend is None:
+        if "BACKEND" in settings.XDUMP:
+            backend = settings.XDUMP["BACKEND"]
+        else:
+            backend = ENGINES[configuration["ENGINE"]]
+    return _init_backend(
+        backend,
+        dbname=configuration["NAME"],
+        user=configuration.get("USER"),
+        password=configuration.get("PASSWORD"),
+        host=configuration.get("HOST"),
+        port=configuration.get("PORT"),
+        verbosity=verbosity,
+    )
 
 
 def _init_backend(path, **kwargs):
@@ -0,0 +1,129 @@
+# coding: utf-8
+"""Pytest plugin, that loads an archive into the test database once per session.
+
+Enable it in ``conftest.py`` and define the backend of the test database::
+
+    pytest_plugins = ("xdump.extra.pytest_plugin",)
+
+
+    @pytest.fixture(scope="session")
+    def xdump_backend():
+        return SQLiteBackend(dbname="test.db")
+
+The archive is given with ``--xdump-archive`` option or ``xdump_archive`` ini setting. Tests, that use ``xdump_db``
+fixture, run in a transaction, that is rolled back afterwards.
+"""
+import os
+import zipfile
+from contextlib import contextmanager
+
+import attr
+import pytest
+
+from ..sqlite import SQLiteBackend
+from ..utils import get_archive_id
+
+TEMPLATE_PREFIX = "xdump_template_"
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("xdump")
+    group.addoption("--xdump-archive", help="archive to load into the test database once per session")
+    parser.addini("xdump_archive", help="archive to load into the test database once per session")
+
+
+def get_cache_dir(config):
+    """Directory for SQLite templates. ``None`` if the cache provider is disabled."""
+    cache = getattr(config, "cache", None)
+    if cache is None:
+        return None
+    # `makedir` is deprecated in newer pytest versions
+    mkdir = getattr(cache, "mkdir", None) or cache.makedir
+    return str(mkdir("xdump"))
+
+
+def get_template_name(backend, archive_id, directory=None):
+    """Template database for the archive.
+
+    SQLite templates are files in ``directory``, by default - next to the database.
+    """
+    name = TEMPLATE_PREFIX + archive_id[:16]
+    if isinstance(backend, SQLiteBackend):
+        if directory is None:
+            directory = os.path.dirname(os.path.abspath(backend.dbname))
+        return os.path.join(directory, name + ".db")
+    return name
+
+
+def restore_template(backend, filename, template):
+    """Re-creates the database from the template. If there is no template, it is made from the archive first.
+
+    The archive is loaded into another database, that is renamed only after the load is finished, therefore an
+    interrupted session doesn't leave a partially loaded template.
+    """
+    if not backend.database_exists(template):
+        builder = attr.evolve(backend, dbname=template + "_new")
+        builder.recreate_database()
+        builder.load(filename)
+        builder.cache_clear()
+        backend.rename_database(builder.dbname, template)
+    backend.cache_clear()
+    backend.recreate_database(template=template)
+
+
+def load_archive(backend, filename, cache_dir=None):
+    """Restores the archive into the database.
+
+    Archives with the schema are restored from templates, that are named by the archive hash and kept between
+    sessions. Data-only archives are loaded into the existing schema every time.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        archive_id = get_archive_id(archive)
+        has_schema = backend.schema_filename in archive.namelist()
+    if has_schema:
+        restore_template(backend, filename, get_template_name(backend, archive_id, cache_dir))
+    else:
+        backend.truncate()
+        backend.load(filename)
+        backend.cache_clear()
+    return backend
+
+
+@contextmanager
+def rolled_back(backend):
+    """Runs the block in a transaction, that is rolled back at the end. The block should not commit."""
+    connection = backend.get_connection()
+    connection.rollback()
+    # SQLite doesn't begin a transaction before DDL statements, the savepoint begins it explicitly
+    backend.run("SAVEPOINT xdump_test")
+    try:
+        yield backend
+    finally:
+        connection.rollback()
+
+
+@pytest.fixture(scope="session", name="xdump_backend")
+def xdump_backend_fixture():
+    """Backend of the test database. Should be defined in ``conftest.py``."""
+    raise pytest.UsageError("Define `xdump_backend` fixture, that returns a backend of the test database")
+
+
+@pytest.fixture(scope="session", name="xdump_archive")
+def xdump_archive_fixture(request):
+    filename = request.config.getoption("xdump_archive") or request.config.getini("xdump_archive")
+    if not filename:
+        raise pytest.UsageError("Specify the archive with `--xdump-archive` option or `xdump_archive` ini setting")
+    return filename
+
+
+@pytest.fixture(scope="session", name="xdump_database")
+def xdump_database_fixture(request, xdump_backend, xdump_archive):
+    """Backend of the test database with the loaded archive. The archive is loaded once per session."""
+    return load_archive(xdump_backend, xdump_archive, get_cache_dir(request.config))
+
+
+@pytest.fixture(name="xdump_db")
+def xdump_db_fixture(xdump_database):
+    """Backend of the test database. Changes, made by the test, are rolled back."""
+    with rolled_back(xdump_database):
+        yield xdump_database
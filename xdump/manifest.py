@@ -0,0 +1,90 @@
+# coding: utf-8
+import hashlib
+
+import attr
+
+from .utils import count_csv_rows, dump_json, get_dependency_levels, load_json
+
+MANIFEST_VERSION = 1
+
+
+@attr.s(cmp=False)
+class Manifest(object):
+    """Description of the archive content.
+
+    Contains per-table row counts, raw & compressed sizes, the same values together with SHA-256 hashes for every data
+    file of a table and the order in which tables could be restored. ``restore_order`` is a list of levels - tables
+    from the same level don't refer to each other and could be restored concurrently after all tables from the previous
+    levels.
+    ``source`` is the state of the database and the hash of dump parameters, that the archive was made with. If both
+    are the same later, then the same archive would be made again.
+    """
+
+    tables = attr.ib(default=attr.Factory(dict))
+    dependencies = attr.ib(default=attr.Factory(dict))
+    restore_order = attr.ib(default=attr.Factory(list))
+    source = attr.ib(default=None)
+    version = attr.ib(default=MANIFEST_VERSION)
+
+    def add_file(self, table_name, info, data):
+        """Registers a data file, that was written to the archive. A table could be split into multiple files."""
+        file_info = {
+            "file": info.filename,
+            "rows": count_csv_rows(data),
+            "size": info.file_size,
+            "compressed_size": info.compress_size,
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        table_info = self.tables.setdefault(table_name, {"rows": 0, "size": 0, "compressed_size": 0, "files": []})
+        for key in ("rows", "size", "compressed_size"):
+            table_info[key] += file_info[key]
+        table_info["files"].append(file_info)
+
+    def set_dependencies(self, dependencies):
+        """Stores references between tables in the archive and calculates the restore order."""
+        tables = list(self.tables)
+        self.dependencies = {
+            table_name: sorted(set(dependencies.get(table_name, ())) & set(tables)) for table_name in tables
+        }
+        self.restore_order = get_dependency_levels(tables, self.dependencies)
+
+    def get_data_files(self):
+        """Table names and corresponding data files in the restore order."""
+        return [
+            (table_name, file_info["file"])
+            for level in self.restore_order
+            for table_name in level
+            for file_info in self.tables[table_name]["files"]
+        ]
+
+    def is_self_referencing(self, table_name):
+        return table_name in self.dependencies.get(table_name, ())
+
+    def dumps(self):
+        return dump_json(
+            {
+                "version": self.version,
+                "tables": self.tables,
+                "dependencies": self.dependencies,
+                "restore_order": self.restore_order,
+                "source": self.source,
+            }
+        )
+
+    @classmethod
+    def loads(cls, data):
+        content = load_json(data)
+        if content["version"] > MANIFEST_VERSION:
+            raise ValueError(
+                "Unsupported manifest version: {0}. Maximum supported version is {1}".format(
+                    content["version"], MANIFEST_VERSION
+                )
+            )
+        return cls(
+            tables=content["tables"],
+            dependencies=content["dependencies"],
+            restore_order=content["restore_order"],
+            # Absent in archives, created by older versions
+            source=content.get("source"),
+            version=content["version"],
+        )
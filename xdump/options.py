@@ -0,0 +1,23 @@
+# coding: utf-8
+import zipfile
+
+import attr
+
+
+@attr.s(cmp=False)
+class DumpOptions(object):  # pylint: disable=too-many-instance-attributes
+    """Arguments of a single ``dump`` call, that describe the archive. See ``BaseBackend.dump``."""
+
+    full_tables = attr.ib(default=())
+    partial_tables = attr.ib(default=None)
+    compression = attr.ib(default=zipfile.ZIP_DEFLATED)
+    dump_schema = attr.ib(default=True)
+    dump_data = attr.ib(default=True)
+    samples = attr.ib(default=None)
+    chunk_size = attr.ib(default=None)
+    jobs = attr.ib(default=1)
+    compression_jobs = attr.ib(default=1)
+    foreign_keys = attr.ib(default=None)
+    schema = attr.ib(default=None)
+    transforms = attr.ib(default=None)
+    columns = attr.ib(default=None)
@@ -0,0 +1,98 @@
+# coding: utf-8
+from ._compat import Empty, Full, Queue
+
+# Maximum number of chunks, that could be buffered in the pipe
+DEFAULT_PIPE_SIZE = 64
+# How often blocked sides of the pipe check if the other side is gone
+POLL_INTERVAL = 0.1
+
+
+class PipeClosed(IOError):
+    """The other side of the pipe has gone."""
+
+
+class ChunkedReader(object):
+    """File-like reader over a stream of byte chunks.
+
+    Subclasses return the next chunk from ``_get`` or ``None`` at the end of the stream.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._is_eof = False
+
+    def read(self, size=-1):
+        while not self._is_eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0:
+            size = len(self._buffer)
+        return self._take(size)
+
+    def readline(self):
+        while not self._is_eof and b"\n" not in self._buffer:
+            self._fill()
+        position = self._buffer.find(b"\n")
+        if position < 0:
+            return self._take(len(self._buffer))
+        return self._take(position + 1)
+
+    def _fill(self):
+        chunk = self._get()
+        if chunk is None:
+            self._is_eof = True
+        else:
+            self._buffer += chunk
+
+    def _take(self, size):
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _get(self):
+        raise NotImplementedError
+
+
+class Pipe(ChunkedReader):
+    """Bounded in-memory pipe between a writer and a reader, that are running in different threads.
+
+    The writer is blocked when the pipe is full, so the memory usage doesn't depend on the size of the transferred data.
+    """
+
+    def __init__(self, maxsize=DEFAULT_PIPE_SIZE):
+        super(Pipe, self).__init__()
+        self._queue = Queue(maxsize)
+        self._is_closed = False
+
+    # Writer side
+
+    def write(self, data):
+        if data:
+            self._put(bytes(data))
+
+    def close_writer(self):
+        """Signals the reader, that there is no more data."""
+        self._put(None)
+
+    def _put(self, item):
+        while True:
+            if self._is_closed:
+                raise PipeClosed("The reader side of the pipe is closed")
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except Full:
+                continue
+
+    # Reader side
+
+    def _get(self):
+        while True:
+            if self._is_closed:
+                raise PipeClosed("The writer side of the pipe is closed")
+            try:
+                return self._queue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+
+    def close(self):
+        """Closes the pipe from any side. The blocked counterpart will get ``PipeClosed`` exception."""
+        self._is_closed = True
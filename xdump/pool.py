@@ -0,0 +1,105 @@
+# coding: utf-8
+import threading
+from contextlib import contextmanager
+from time import time
+
+DEFAULT_POOL_SIZE = 10
+
+
+class PoolError(Exception):
+    """The pool is closed or there is no free connection in it."""
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of connections to the same database.
+
+    ``min_size`` connections are opened upfront. Up to ``max_size`` connections could be opened in total, after that
+    ``acquire`` waits until some connection is released. Idle connections are checked with ``is_usable`` before
+    they are handed out and broken ones are replaced with new connections.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=DEFAULT_POOL_SIZE, is_usable=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool size should satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self._is_usable = is_usable or (lambda connection: True)
+        self.max_size = max_size
+        self._idle = []
+        self._size = 0
+        self._is_closed = False
+        self._condition = threading.Condition()
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    @property
+    def size(self):
+        """Total number of opened connections."""
+        return self._size
+
+    def acquire(self, timeout=None):
+        """Checks out a connection from the pool."""
+        deadline = None if timeout is None else time() + timeout
+        with self._condition:
+            while True:
+                if self._is_closed:
+                    raise PoolError("The pool is closed")
+                while self._idle:
+                    connection = self._idle.pop()
+                    if self._is_usable(connection):
+                        return connection
+                    self._close(connection)
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise PoolError("No free connections in the pool after {0} seconds".format(timeout))
+                    self._condition.wait(remaining)
+        try:
+            return self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection, discard=False):
+        """Returns the connection to the pool. Unfinished transaction is rolled back."""
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        with self._condition:
+            if discard or self._is_closed:
+                self._close(connection)
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        """Closes all idle connections. Connections, that are checked out, will be closed on release."""
+        with self._condition:
+            self._is_closed = True
+            while self._idle:
+                self._close(self._idle.pop())
+            self._condition.notify_all()
+
+    def _close(self, connection):
+        self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
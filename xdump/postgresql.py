@@ -1,65 +1,134 @@
 # coding: utf-8
+import hashlib
 import os
 import subprocess
+import threading
+from contextlib import contextmanager
 from io import BytesIO
 
 import attr
 import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_REPEATABLE_READ
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_REPEATABLE_READ, TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extras import RealDictConnection
 
-from .base import BaseBackend
-from .utils import make_options
+from .base import NO_PRIMARY_KEY_MESSAGE, BaseBackend
+from .pipe import Pipe
+from .utils import (
+    DEFAULT_JOBS,
+    get_dependency_levels,
+    group_foreign_keys,
+    make_options,
+    make_row_value,
+    read_csv_header,
+    run_concurrently,
+    select_foreign_keys,
+    unwrap_columns,
+)
+from .verify import DEFAULT_RANGE_SIZE, TableDigest
 
 TABLES_SQL = "SELECT relname FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
 SEQUENCES_SQL = "SELECT relname FROM pg_class WHERE relkind = 'S'"
-# The query below doesn't use `information_schema.table_constraints` and ``, but instead uses its modified versions
-# to mitigate permissions insufficiency on that views (they filter data by permissions of the current user)
-# Subqueries for constraints other than FOREIGN KEY are removed as well.
+# Sequences of `serial` and identity columns
+OWNED_SEQUENCES_SQL = """
+SELECT S.relname
+FROM pg_depend D
+  JOIN pg_class S ON S.oid = D.objid
+  JOIN pg_class T ON T.oid = D.refobjid
+WHERE
+  D.classid = 'pg_class'::regclass AND
+  D.refclassid = 'pg_class'::regclass AND
+  D.deptype IN ('a', 'i') AND
+  S.relkind = 'S' AND
+  T.relnamespace = 'public'::regnamespace AND
+  T.relname = ANY(%(tables)s)
+"""
+TABLE_EXISTS_SQL = """
+SELECT EXISTS (
+  SELECT 1 FROM pg_class WHERE relname = %(table_name)s AND relkind = 'r' AND pg_table_is_visible(oid)
+) AS "exists"
+"""
+# The catalog row of a table is written by the transaction, that created or truncated it. Rows written by
+# subtransactions have other `xmin` values, these tables are not matched - FREEZE requires the current subtransaction
+NEW_IN_TRANSACTION_SQL = """
+SELECT EXISTS (
+  SELECT 1
+  FROM pg_class
+  WHERE
+    relname = %(table_name)s AND
+    relkind = 'r' AND
+    pg_table_is_visible(oid) AND
+    xmin::text = (txid_current() %% 4294967296)::text
+) AS "exists"
+"""
+SNAPSHOT_SQL = "SELECT txid_current_snapshot()::text AS snapshot"
+DATABASE_EXISTS_SQL = 'SELECT EXISTS (SELECT 1 FROM pg_database WHERE datname = %(dbname)s) AS "exists"'
+# Only `pg_catalog` is used - `information_schema` views are slow on big catalogs and filter data by permissions of
+# the current user. Columns are paired by their positions in `conkey` / `confkey`, therefore composite keys are
+# returned as ordered arrays of column names.
 BASE_RELATIONS_QUERY = """
 SELECT
-  DISTINCT
-  TC.constraint_name,
-  TC.table_name,
-  KCU.column_name,
-  CCU.foreign_table_name,
-  CCU.foreign_column_name
-FROM
-  (
-    SELECT
-      CN.conname AS constraint_name,
-      CL.relname AS table_name
-    FROM pg_namespace NS,
-      pg_constraint CN,
-      pg_class CL
-    WHERE
-      NS.oid = CL.relnamespace AND
-      CN.conrelid = CL.oid AND
-      CN.contype = 'f' AND
-      CL.relkind = 'r' AND
-      NOT pg_is_other_temp_schema(NS.oid)
-    ) AS TC
-    JOIN information_schema.key_column_usage AS KCU
-      ON TC.constraint_name = KCU.constraint_name AND
-         KCU.table_name = TC.table_name
-    JOIN (
-      SELECT
-        CL.relname AS foreign_table_name,
-        AT.attname AS foreign_column_name,
-        CN.conname AS constraint_name
-      FROM pg_class CL,
-        pg_attribute AT,
-        pg_constraint CN
-      WHERE
-        CL.oid = AT.attrelid AND
-        CL.oid = CN.confrelid AND
-        AT.attnum = ANY (CN.confkey) AND
-        NOT AT.attisdropped AND
-        CN.contype = 'f' AND
-        CL.relkind = 'r'
-      ) AS CCU
-    ON CCU.constraint_name = TC.constraint_name
+  CN.conname AS constraint_name,
+  CL.relname AS table_name,
+  array_agg(AT.attname::text ORDER BY K.position) AS column_name,
+  FCL.relname AS foreign_table_name,
+  array_agg(FAT.attname::text ORDER BY K.position) AS foreign_column_name
+FROM pg_constraint CN
+  JOIN pg_class CL ON CL.oid = CN.conrelid
+  JOIN pg_namespace NS ON NS.oid = CL.relnamespace
+  JOIN pg_class FCL ON FCL.oid = CN.confrelid
+  CROSS JOIN LATERAL unnest(CN.conkey, CN.confkey) WITH ORDINALITY AS K(attnum, foreign_attnum, position)
+  JOIN pg_attribute AT ON AT.attrelid = CN.conrelid AND AT.attnum = K.attnum
+  JOIN pg_attribute FAT ON FAT.attrelid = CN.confrelid AND FAT.attnum = K.foreign_attnum
+WHERE
+  CN.contype = 'f' AND
+  CL.relkind = 'r' AND
+  NOT pg_is_other_temp_schema(NS.oid)
+GROUP BY CN.oid, CN.conname, CL.relname, FCL.relname
+"""
+# Single-column integer primary key
+CHUNK_KEY_SQL = """
+SELECT AT.attname
+FROM pg_index IX
+  JOIN pg_attribute AT ON AT.attrelid = IX.indrelid AND AT.attnum = IX.indkey[0]
+WHERE
+  IX.indrelid = %(table_name)s::regclass AND
+  IX.indisprimary AND
+  IX.indnatts = 1 AND
+  AT.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype)
 """
+PRIMARY_KEY_SQL = """
+SELECT AT.attname
+FROM pg_index IX
+  CROSS JOIN LATERAL unnest(IX.indkey::int2[]) WITH ORDINALITY AS K(attnum, position)
+  JOIN pg_attribute AT ON AT.attrelid = IX.indrelid AND AT.attnum = K.attnum
+WHERE
+  IX.indrelid = %(table_name)s::regclass AND
+  IX.indisprimary
+ORDER BY K.position
+"""
+# Rows, that are equal to the existing ones, are not updated
+MERGE_SQL = """
+INSERT INTO {table_name} AS T ({columns})
+SELECT {columns} FROM {staging_table}
+ON CONFLICT ({primary_key}) DO {action}
+"""
+MERGE_UPDATE_ACTION = "UPDATE SET {assignments} WHERE {current} IS DISTINCT FROM {excluded}"
+# The same row hashes as in `xdump.verify`. `format('%s', ...)` gives the same text as COPY and an empty string for NULL
+DIGEST_SQL = """
+SELECT
+  {key_range} AS key_range,
+  COUNT(*) AS row_count,
+  SUM(('x' || substr(md5({row}), 1, 16))::bit(64)::bigint) AS hash_sum
+FROM {table_name}
+GROUP BY 1
+"""
+KEY_RANGE_SQL = "CASE WHEN {value} ~ '^-?[0-9]+$' THEN floor({value}::numeric / {range_size})::bigint END"
+ROWS_ESTIMATE_SQL = "SELECT reltuples FROM pg_class WHERE oid = %(table_name)s::regclass"
+
+
+def get_staging_table_name(table_name):
+    """Name of the merge staging table. The hash keeps it unique and shorter than the 63 characters limit."""
+    return "xdump_merge_{0}".format(hashlib.md5(table_name.encode("utf-8")).hexdigest())
 
 
 @attr.s(cmp=False)
@@ -72,6 +141,7 @@ class PostgreSQLBackend(BaseBackend):
     verbosity = attr.ib(convert=int, default=0)
     sequences_filename = "dump/sequences.sql"
     initial_setup_files = BaseBackend.initial_setup_files + (sequences_filename,)
+    supports_snapshots = True
     connections = {
         "default": {
             "isolation_level": ISOLATION_LEVEL_REPEATABLE_READ,
@@ -88,6 +158,9 @@ class PostgreSQLBackend(BaseBackend):
         connection.set_isolation_level(isolation_level)
         return connection
 
+    def is_usable(self, connection):
+        return not connection.closed and connection.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN
+
     def get_connection_kwargs(self, **kwargs):
         return super(PostgreSQLBackend, self).get_connection_kwargs(connection_factory=RealDictConnection, **kwargs)
 
@@ -122,8 +195,8 @@ class PostgreSQLBackend(BaseBackend):
         )
         return process.communicate()[0]
 
-    def write_initial_setup(self, file):
-        super(PostgreSQLBackend, self).write_initial_setup(file)
+    def write_initial_setup(self, file, schema=None):
+        super(PostgreSQLBackend, self).write_initial_setup(file, schema)
         self.write_sequences(file)
 
     def dump_schema(self):
@@ -145,37 +218,107 @@ class PostgreSQLBackend(BaseBackend):
         sequences = self.dump_sequences()
         file.writestr(self.sequences_filename, sequences)
 
-    def add_related_data(self, full_tables, partial_tables):
-        if full_tables:
-            query = BASE_RELATIONS_QUERY + " WHERE NOT(CCU.foreign_table_name = ANY(%(full_tables)s))"
-            kwargs = {"full_tables": list(full_tables)}
-        else:
-            query = BASE_RELATIONS_QUERY
-            kwargs = {}
-        self._related_data = self.run(query, kwargs)  # pylint: disable=attribute-defined-outside-init
+    def add_related_data(self, full_tables, partial_tables, foreign_keys=None):
+        if foreign_keys is None:
+            foreign_keys = self.introspect_foreign_keys()
+        foreign_keys = [
+            foreign_key for foreign_key in foreign_keys if foreign_key["foreign_table_name"] not in full_tables
+        ]
+        self._related_data = foreign_keys  # pylint: disable=attribute-defined-outside-init
         super(PostgreSQLBackend, self).add_related_data(full_tables, partial_tables)
 
     def get_foreign_keys(self, table, full_tables=(), recursive=False):
-        # NOTE, `full_tables` is not used, because it is filtered in `BASE_RELATIONS_QUERY`
-        for foreign_key in self._related_data:
-            if foreign_key["table_name"] == table:
-                if foreign_key["foreign_table_name"] == table and not recursive:
-                    continue
-                if foreign_key["foreign_table_name"] != table and recursive:
-                    continue
-                yield foreign_key
-
-    def copy_expert(self, sql, file, **kwargs):
+        # NOTE, `full_tables` is not used, because it is filtered in `add_related_data`
+        foreign_keys = [foreign_key for foreign_key in self._related_data if foreign_key["table_name"] == table]
+        return select_foreign_keys(foreign_keys, table, recursive)
+
+    def introspect_foreign_keys(self):
+        return [
+            dict(
+                foreign_key,
+                column_name=unwrap_columns(foreign_key["column_name"]),
+                foreign_column_name=unwrap_columns(foreign_key["foreign_column_name"]),
+            )
+            for foreign_key in self.run(BASE_RELATIONS_QUERY)
+        ]
+
+    def get_dependencies(self, tables):
+        tables = set(tables)
+        return group_foreign_keys(
+            foreign_key for foreign_key in self.introspect_foreign_keys() if foreign_key["table_name"] in tables
+        )
+
+    def mogrify(self, sql, params):
+        return self.get_cursor().mogrify(sql, params).decode("utf-8")
+
+    def get_sample_sql(self, table_name, sample):
+        return "SELECT * FROM {0} TABLESAMPLE {1} ({2}) REPEATABLE ({3})".format(
+            table_name, sample.method.upper(), sample.percent, sample.seed
+        )
+
+    def copy_expert(self, sql, file, connection=None, **kwargs):
         with self.log_query(sql):
-            cursor = self.get_cursor()
+            if connection is None:
+                cursor = self.get_cursor()
+            else:
+                cursor = connection.cursor()
             return cursor.copy_expert(sql, file, **kwargs)
 
-    def export_to_csv(self, sql):
+    def export_to_csv(self, sql, connection=None):
         """Exports the result of the given sql to CSV with a help of COPY statement."""
         with BytesIO() as output:
-            self.copy_expert("COPY ({0}) TO STDOUT WITH CSV HEADER".format(sql), output)
+            self.copy_expert("COPY ({0}) TO STDOUT WITH CSV HEADER".format(sql), output, connection)
             return output.getvalue()
 
+    def get_chunk_key(self, table_name):
+        result = self.run(CHUNK_KEY_SQL, {"table_name": table_name})
+        if result:
+            return result[0]["attname"]
+
+    def estimate_rows(self, table_name):
+        """Planner's estimate is used to avoid full table scan. Not analyzed tables are counted."""
+        estimate = self.run(ROWS_ESTIMATE_SQL, {"table_name": table_name})[0]["reltuples"]
+        if estimate > 0:
+            return int(estimate)
+        return super(PostgreSQLBackend, self).estimate_rows(table_name)
+
+    def digest_table(self, table_name, columns, range_size=DEFAULT_RANGE_SIZE):
+        values = ["format('%s', {0})".format(column) for column in columns]
+        sql = DIGEST_SQL.format(
+            key_range=KEY_RANGE_SQL.format(value=values[0], range_size=range_size),
+            row="concat_ws(chr(31), {0})".format(", ".join(values)),
+            table_name=table_name,
+        )
+        digest = TableDigest(range_size, columns)
+        for row in self.run(sql):
+            digest.add(row["key_range"], row["row_count"], int(row["hash_sum"]))
+        return digest
+
+    def export_snapshot(self):
+        """Makes the snapshot of the current transaction available for other connections."""
+        return self.run("SELECT pg_export_snapshot()")[0]["pg_export_snapshot"]
+
+    @contextmanager
+    def snapshot_connection(self, snapshot):
+        with self.connection() as connection:
+            connection.cursor().execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+            yield connection
+
+    def is_snapshot_valid(self, snapshot):
+        try:
+            with self.snapshot_connection(snapshot):
+                return True
+        except psycopg2.Error:
+            return False
+
+    def get_source_state(self):
+        """Snapshot of the dump transaction. Equal snapshots contain the same set of committed transactions.
+
+        Transaction IDs are shared by all databases of the cluster, so any write there changes the snapshot too.
+        Sequences are not transactional, their changes without other writes are not noticed.
+        """
+        return self.run(SNAPSHOT_SQL)[0]["snapshot"]
+
     def get_search_path(self):
         return self.run("show search_path;")[0]["search_path"]
 
@@ -187,11 +330,11 @@ class PostgreSQLBackend(BaseBackend):
         super(PostgreSQLBackend, self).initial_setup(archive)
         self.restore_search_path(search_path)
 
-    def recreate_database(self, owner=None):
+    def recreate_database(self, owner=None, template=None):
         if owner is None:
             owner = self.user
         self.drop_connections(self.dbname)
-        super(PostgreSQLBackend, self).recreate_database(owner)
+        super(PostgreSQLBackend, self).recreate_database(owner, template)
 
     def drop_connections(self, dbname):
         self.run(
@@ -203,15 +346,194 @@ class PostgreSQLBackend(BaseBackend):
     def drop_database(self, dbname):
         self.run("DROP DATABASE IF EXISTS {0}".format(dbname), using="maintenance")
 
-    def create_database(self, dbname, owner):
-        self.run(
-            "CREATE DATABASE {0} WITH OWNER {1}".format(dbname, owner),
-            using="maintenance",
-        )
+    def create_database(self, dbname, owner, template=None):
+        sql = "CREATE DATABASE {0} WITH OWNER {1}".format(dbname, owner)
+        if template is not None:
+            # The template should have no open connections
+            sql += " TEMPLATE {0}".format(template)
+        self.run(sql, using="maintenance")
+
+    def database_exists(self, dbname):
+        return self.run(DATABASE_EXISTS_SQL, {"dbname": dbname}, "maintenance")[0]["exists"]
+
+    def rename_database(self, dbname, new_dbname):
+        self.run("ALTER DATABASE {0} RENAME TO {1}".format(dbname, new_dbname), using="maintenance")
 
-    def truncate(self):
+    def table_exists(self, table_name):
+        return self.run(TABLE_EXISTS_SQL, {"table_name": table_name})[0]["exists"]
+
+    def truncate(self, skip_empty=False):
         tables = [row["relname"] for row in self.run(TABLES_SQL)]
-        self.run("TRUNCATE TABLE {0} RESTART IDENTITY CASCADE".format(", ".join(tables)))
+        if skip_empty:
+            non_empty = self.get_non_empty_tables(tables)
+            # Sequences of empty tables are restarted the same way as `RESTART IDENTITY` does it
+            self.restart_sequences(sorted(set(tables) - set(non_empty)))
+            tables = non_empty
+        if tables:
+            self.run("TRUNCATE TABLE {0} RESTART IDENTITY CASCADE".format(", ".join(tables)))
+
+    def restart_sequences(self, tables):
+        """Restarts sequences, that are owned by columns of the given tables."""
+        if not tables:
+            return
+        sequences = [row["relname"] for row in self.run(OWNED_SEQUENCES_SQL, {"tables": tables})]
+        if sequences:
+            self.run("".join("ALTER SEQUENCE {0} RESTART;".format(sequence) for sequence in sequences))
+
+    def load_data_file(self, table_name, fd, connection=None):
+        """Copies the data file into the table.
+
+        Rows are loaded already frozen if the table was created or truncated in the current transaction, then they
+        don't need hint bits and anti-wraparound vacuum rewrites later. Empty tables, that are skipped by
+        ``truncate(skip_empty=True)``, are loaded without freezing. As with any ``COPY FREEZE``, after the commit
+        these rows are visible even to snapshots, that were taken before it.
+        """
+        # Columns, that are not in the data file, are filled with their defaults
+        columns = read_csv_header(fd)
+        options = "CSV"
+        if self.is_new_in_transaction(table_name, connection):
+            options = "(FORMAT CSV, FREEZE)"
+        self.copy_expert(
+            "COPY {0} ({1}) FROM STDIN WITH {2}".format(table_name, ", ".join(columns), options), fd, connection
+        )
+
+    def is_new_in_transaction(self, table_name, connection=None):
+        """If the table was created or truncated in the current transaction of the connection."""
+        if connection is None:
+            connection = self.get_connection()
+        cursor = connection.cursor()
+        self.execute(cursor, NEW_IN_TRANSACTION_SQL, {"table_name": table_name})
+        return cursor.fetchone()["exists"]
+
+    def merge_data_file(self, table_name, fd, connection=None):
+        """Copies the data file into a temporary table and upserts its rows by the primary key.
+
+        A temporary table is used instead of an unlogged one - it is not WAL-logged either, but it is visible only to
+        the current session and is dropped with it, therefore concurrent jobs and interrupted loads leave nothing
+        behind.
+        """
+        if connection is None:
+            connection = self.get_connection()
+        cursor = connection.cursor()
+        self.execute(cursor, PRIMARY_KEY_SQL, {"table_name": table_name})
+        primary_key = [row["attname"] for row in cursor.fetchall()]
+        if not primary_key:
+            raise ValueError(NO_PRIMARY_KEY_MESSAGE.format(table_name))
+        columns = read_csv_header(fd)
+        staging_table = get_staging_table_name(table_name)
+        # Only the columns from the data file, without constraints
+        self.execute(
+            cursor,
+            "CREATE TEMPORARY TABLE {0} AS SELECT {1} FROM {2} WITH NO DATA".format(
+                staging_table, ", ".join(columns), table_name
+            ),
+        )
+        self.copy_expert(
+            "COPY {0} ({1}) FROM STDIN WITH CSV".format(staging_table, ", ".join(columns)), fd, connection
+        )
+        updated_columns = [column for column in columns if column not in primary_key]
+        if updated_columns:
+            action = MERGE_UPDATE_ACTION.format(
+                assignments=", ".join("{0} = EXCLUDED.{0}".format(column) for column in updated_columns),
+                current=make_row_value(updated_columns, "T"),
+                excluded=make_row_value(updated_columns, "EXCLUDED"),
+            )
+        else:
+            action = "NOTHING"
+        self.execute(
+            cursor,
+            MERGE_SQL.format(
+                table_name=table_name,
+                columns=", ".join(columns),
+                staging_table=staging_table,
+                primary_key=", ".join(primary_key),
+                action=action,
+            ),
+        )
+        self.execute(cursor, "DROP TABLE {0}".format(staging_table))
+
+    def execute(self, cursor, sql, params=None):
+        with self.log_query(sql, params):
+            cursor.execute(sql, params)
+
+    # Direct transfer to another database
+
+    def transfer(
+        self,
+        target,
+        full_tables=(),
+        partial_tables=None,
+        dump_schema=True,
+        dump_data=True,
+        samples=None,
+        jobs=DEFAULT_JOBS,
+        transforms=None,
+        columns=None,
+    ):
+        """Copies the schema and the data directly to the ``target`` database without an intermediate archive.
+
+        Tables are transferred concurrently, but a table is transferred only after all tables it refers to.
+        ``transforms`` and ``columns`` are applied in the same way as in ``dump``.
+        """
+        self.input_check(full_tables, partial_tables, samples)
+        with self.log_time("Total execution time: %s"):
+            partial_tables = self.get_partial_tables(partial_tables, samples)
+            if dump_schema:
+                self.transfer_initial_setup(target)
+            if dump_data:
+                snapshot = self.export_snapshot()
+                # Relations are introspected once for both related data and the transfer order
+                foreign_keys = self.introspect_foreign_keys()
+                self.add_related_data(full_tables, partial_tables, foreign_keys)
+                queries = {table_name: "SELECT * FROM {0}".format(table_name) for table_name in full_tables}
+                queries.update(partial_tables)
+                if transforms or columns:
+                    queries = {
+                        table_name: self.get_export_sql(table_name, sql, transforms, columns)
+                        for table_name, sql in queries.items()
+                    }
+                tables = list(full_tables) + list(partial_tables)
+                for level in get_dependency_levels(tables, group_foreign_keys(foreign_keys)):
+                    run_concurrently(
+                        lambda table_name: self.transfer_table(target, table_name, queries[table_name], snapshot),
+                        level,
+                        jobs,
+                    )
+
+    def transfer_initial_setup(self, target):
+        search_path = target.get_search_path()
+        target.run_setup_file(self.dump_schema())
+        target.run_setup_file(self.dump_sequences())
+        target.restore_search_path(search_path)
+        target.get_connection().commit()
+
+    def transfer_table(self, target, table_name, sql, snapshot):
+        """Streams the result of ``sql`` into the ``target`` table through a bounded in-memory pipe."""
+        pipe = Pipe()
+        errors = []
+        with self.snapshot_connection(snapshot) as source, target.connection() as destination:
+            exporter = threading.Thread(target=self._export_to_pipe, args=(source, sql, pipe, errors))
+            exporter.start()
+            try:
+                copy_sql = "COPY {0} ({1}) FROM STDIN WITH CSV".format(table_name, ", ".join(read_csv_header(pipe)))
+                with self.log_query(copy_sql):
+                    destination.cursor().copy_expert(copy_sql, pipe)
+                destination.commit()
+            except Exception:
+                if not errors:
+                    raise
+            finally:
+                pipe.close()
+                exporter.join()
+            if errors:
+                raise errors[0]
 
-    def load_data_file(self, table_name, fd):
-        self.copy_expert("COPY {0} FROM STDIN WITH CSV HEADER".format(table_name), fd)
+    def _export_to_pipe(self, connection, sql, pipe, errors):
+        copy_sql = "COPY ({0}) TO STDOUT WITH CSV HEADER".format(sql)
+        try:
+            with self.log_query(copy_sql):
+                connection.cursor().copy_expert(copy_sql, pipe)
+            pipe.close_writer()
+        except Exception as exc:
+            errors.append(exc)
+            pipe.close()
@@ -0,0 +1,131 @@
+# coding: utf-8
+import threading
+from time import time
+
+import attr
+
+from ._compat import Full, Queue
+from .pipe import POLL_INTERVAL, ChunkedReader
+
+# Megabytes of decompressed data, that could be buffered ahead of the database
+DEFAULT_READ_AHEAD = 8
+# Archive members are decompressed and passed to the consumer by blocks of this size
+READ_AHEAD_BLOCK_SIZE = 64 * 1024
+MEGABYTE = 1024 * 1024
+
+
+@attr.s(cmp=False)
+class ReadAheadStats(object):
+    """Backpressure metrics of the read-ahead.
+
+    Big ``reader_blocked_time`` means that the database is the bottleneck, big ``writer_starved_time`` - that the
+    decompression is.
+    """
+
+    members = attr.ib(default=0)
+    size = attr.ib(default=0)
+    decompression_time = attr.ib(default=0.0)
+    # The reader waited for a free slot in the queue
+    reader_blocked_time = attr.ib(default=0.0)
+    # The writer waited for the next decompressed block
+    writer_starved_time = attr.ib(default=0.0)
+    # Maximum number of blocks in the queue
+    max_buffered = attr.ib(default=0)
+
+
+class MemberReader(ChunkedReader):
+    """Content of a single archive member, that is read from the read-ahead queue by blocks.
+
+    The first block is taken at once, therefore errors of opening the member are raised to the consumer of the
+    iterator, not of the file.
+    """
+
+    def __init__(self, read_ahead):
+        super(MemberReader, self).__init__()
+        self._read_ahead = read_ahead
+        self._fill()
+
+    def _get(self):
+        return self._read_ahead.get_block()
+
+    def skip(self):
+        """Drops the rest of the member, that was not read by the consumer."""
+        while self.read(READ_AHEAD_BLOCK_SIZE):
+            pass
+
+
+class ReadAhead(object):
+    """Decompresses archive members in a separate thread, not more than ``size`` megabytes ahead of the consumer.
+
+    Members are passed by blocks of ``block_size`` bytes, therefore big members are never held in memory as a whole.
+    Iteration yields member names and file-like objects with their content in the given order. Every member should be
+    read before the next one is taken, otherwise the rest of it is skipped.
+    """
+
+    def __init__(self, archive, names, size=DEFAULT_READ_AHEAD, block_size=READ_AHEAD_BLOCK_SIZE):
+        self.archive = archive
+        self.names = list(names)
+        self.block_size = block_size
+        self.stats = ReadAheadStats()
+        self._queue = Queue(max(size * MEGABYTE // block_size, 1))
+        self._is_stopped = False
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._read)
+        thread.start()
+        try:
+            for name in self.names:
+                member = MemberReader(self)
+                yield name, member
+                member.skip()
+        finally:
+            self._is_stopped = True
+            thread.join()
+
+    def get_block(self):
+        """The next decompressed block of the current member. ``None`` at the end of the member."""
+        start = time()
+        # The reader always puts either a block or an error, unless it is stopped by the consumer
+        item = self._queue.get()
+        self.stats.writer_starved_time += time() - start
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def _read(self):
+        for name in self.names:
+            try:
+                for block in self._decompress(name):
+                    if not self._put(block):
+                        return
+            except Exception as exc:
+                self._put(exc)
+                return
+            self.stats.members += 1
+            if not self._put(None):
+                return
+
+    def _decompress(self, name):
+        with self.archive.open(name) as fd:
+            while True:
+                start = time()
+                block = fd.read(self.block_size)
+                self.stats.decompression_time += time() - start
+                if not block:
+                    return
+                self.stats.size += len(block)
+                yield block
+
+    def _put(self, item):
+        start = time()
+        while not self._is_stopped:
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                break
+            except Full:
+                continue
+        else:
+            return False
+        self.stats.reader_blocked_time += time() - start
+        self.stats.max_buffered = max(self.stats.max_buffered, self._queue.qsize())
+        return True
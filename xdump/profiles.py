@@ -0,0 +1,113 @@
+# coding: utf-8
+import threading
+import zipfile
+
+import attr
+
+from ._compat import Queue, toml_loads
+from .compression import COMPRESSION_MAPPING
+from .sampling import Sample
+from .utils import run_concurrently
+
+BACKENDS = {
+    "postgres": "xdump.postgresql.PostgreSQLBackend",
+    "sqlite": "xdump.sqlite.SQLiteBackend",
+}
+
+
+def to_samples(value):
+    return {table_name: Sample(**sample) for table_name, sample in (value or {}).items()}
+
+
+def to_compression(value):
+    return COMPRESSION_MAPPING.get(value, value)
+
+
+@attr.s(cmp=False)
+class Profile(object):  # pylint: disable=too-many-instance-attributes
+    """Arguments for a single ``dump`` call."""
+
+    name = attr.ib()
+    output = attr.ib()
+    full_tables = attr.ib(default=(), convert=tuple)
+    partial_tables = attr.ib(default=attr.Factory(dict))
+    samples = attr.ib(default=None, convert=to_samples)
+    compression = attr.ib(default=zipfile.ZIP_DEFLATED, convert=to_compression)
+    dump_schema = attr.ib(default=True)
+    dump_data = attr.ib(default=True)
+    chunk_size = attr.ib(default=None)
+    transforms = attr.ib(default=None)
+    columns = attr.ib(default=None)
+
+    def get_dump_kwargs(self):
+        kwargs = attr.asdict(self, recurse=False)
+        del kwargs["name"], kwargs["output"]
+        return kwargs
+
+
+def read_config(filename):
+    """Reads a TOML file with a ``connection`` table and ``profiles`` tables."""
+    if toml_loads is None:
+        raise RuntimeError("TOML parser is not available. Install `toml` package")
+    with open(filename, "rb") as fd:
+        return toml_loads(fd.read().decode("utf-8"))
+
+
+def get_backend_path(connection):
+    path = connection.get("backend", "postgres")
+    return BACKENDS.get(path, path)
+
+
+def get_profiles(config, names=()):
+    profiles = []
+    for name, values in config.get("profiles", {}).items():
+        try:
+            profiles.append(Profile(name=name, **values))
+        except TypeError as exc:
+            raise ValueError("Invalid profile `{0}`: {1}".format(name, exc))
+    if names:
+        unknown = set(names) - {profile.name for profile in profiles}
+        if unknown:
+            raise ValueError("Unknown profiles: {0}".format(", ".join(sorted(unknown))))
+        profiles = [profile for profile in profiles if profile.name in names]
+    return profiles
+
+
+def run_profiles(backend, profiles, jobs=1, callback=None):
+    """Makes dumps for all profiles in one process.
+
+    The schema and relations between tables are fetched once and shared among all profiles. Profiles are executed
+    by ``jobs`` copies of the backend, that keep their connections between profiles. If the backend doesn't support
+    concurrent dumps, then profiles are executed one by one.
+    """
+    schema = None
+    if any(profile.dump_schema for profile in profiles):
+        schema = backend.dump_schema()
+    foreign_keys = None
+    if any(profile.dump_data for profile in profiles):
+        foreign_keys = backend.introspect_foreign_keys()
+    if not backend.supports_concurrent_dumps:
+        jobs = 1
+    backends = [backend] + [attr.evolve(backend) for _ in range(min(jobs, len(profiles)) - 1)]
+    idle = Queue()
+    for item in backends:
+        idle.put(item)
+    lock = threading.Lock()
+
+    def run(profile):
+        worker = idle.get()
+        try:
+            worker.dump(profile.output, foreign_keys=foreign_keys, schema=schema, **profile.get_dump_kwargs())
+        finally:
+            # Every profile is dumped from its own snapshot, as it would be with a separate process
+            worker.get_connection().rollback()
+            idle.put(worker)
+        if callback is not None:
+            with lock:
+                callback(profile)
+
+    try:
+        run_concurrently(run, profiles, len(backends))
+    finally:
+        for item in backends[1:]:
+            item.cache_clear()
@@ -0,0 +1,37 @@
+# coding: utf-8
+import random
+
+import attr
+
+SAMPLING_METHODS = ("bernoulli", "system")
+MAX_SEED = 2 ** 31 - 1
+
+
+def to_seed(value):
+    if value is None:
+        return random.randint(0, MAX_SEED)
+    return int(value)
+
+
+def validate_percent(instance, attribute, value):
+    if not 0 < value <= 100:
+        raise ValueError("Sample percent should be in (0, 100] range, got {0}".format(value))
+
+
+def validate_method(instance, attribute, value):
+    if value not in SAMPLING_METHODS:
+        raise ValueError("Sampling method should be one of: {0}".format(", ".join(SAMPLING_METHODS)))
+
+
+@attr.s(frozen=True)
+class Sample(object):
+    """Random sample of rows from a table.
+
+    The sample is always seeded - the same rows should be selected every time the sample query is evaluated during
+    the dump, otherwise related data will not match the sampled rows. If ``seed`` is not given, a random one is used.
+    ``method`` is a hint for backends that support different sampling methods (PostgreSQL).
+    """
+
+    percent = attr.ib(convert=float, validator=validate_percent)
+    seed = attr.ib(default=None, convert=to_seed)
+    method = attr.ib(default="bernoulli", validator=validate_method)
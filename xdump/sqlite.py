@@ -1,50 +1,282 @@
 # coding: utf-8
+import multiprocessing
 import os
+import shutil
 import sqlite3
-import subprocess
+import struct
 import sys
+from contextlib import contextmanager
 from csv import DictReader, DictWriter
 
 import attr
 
-from ._compat import FileNotFoundError, StringIO, lru_cache
-from .base import BaseBackend
+from ._compat import FileNotFoundError, StringIO
+from .base import NO_PRIMARY_KEY_MESSAGE, BaseBackend
+from .prefetch import DEFAULT_READ_AHEAD
+from .utils import make_row_value, map_concurrently, select_foreign_keys, unwrap_columns
+from .verify import DEFAULT_RANGE_SIZE, TableDigest, get_range, row_hash
 
 
 def dict_factory(cursor, row):
     return {description[0]: value for description, value in zip(cursor.description, row)}
 
 
+def read_wal_state(filename):
+    """The checkpoint sequence and salts from the WAL header together with the number and checksum of committed frames.
+
+    Every frame header has the cumulative checksum of all frames up to it, therefore the checksum of the last commit
+    frame is a digest of the committed content and pages are skipped without reading. The WAL file is reused after
+    checkpoints, frames left from the previous generation have other salts and are not counted. ``None`` if there is no
+    WAL file or it is empty.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as fd:
+        header = fd.read(struct.calcsize(WAL_HEADER_FORMAT))
+        if len(header) < struct.calcsize(WAL_HEADER_FORMAT):
+            return None
+        page_size, sequence, salt_1, salt_2 = struct.unpack(WAL_HEADER_FORMAT, header)
+        frames = committed = 0
+        checksum = (0, 0)
+        frame_header_size = struct.calcsize(WAL_FRAME_HEADER_FORMAT)
+        while True:
+            frame_header = fd.read(frame_header_size)
+            if len(frame_header) < frame_header_size:
+                break
+            frame = struct.unpack(WAL_FRAME_HEADER_FORMAT, frame_header)
+            if frame[1:3] != (salt_1, salt_2):
+                break
+            frames += 1
+            # The database size is set only in the last frame of a transaction
+            if frame[0]:
+                committed = frames
+                checksum = frame[3:]
+            fd.seek(page_size, os.SEEK_CUR)
+    return [sequence, salt_1, salt_2, committed] + list(checksum)
+
+
+def is_in_memory(dbname):
+    """Django names in-memory test databases with URIs, e.g. ``file:memorydb_default?mode=memory&cache=shared``."""
+    return dbname == ":memory:" or "mode=memory" in dbname
+
+
+def connect_to(dbname, **kwargs):
+    """Connection to the database. Names, that start with ``file:``, are URIs."""
+    if dbname.startswith("file:"):
+        kwargs["uri"] = True
+    return sqlite3.connect(dbname, **kwargs)
+
+
+def rows_to_csv(fieldnames, rows):
+    """CSV with a header. Rows are dicts - see ``dict_factory``."""
+    output = StringIO()
+    writer = DictWriter(output, fieldnames=fieldnames, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    result = output.getvalue().encode()
+    output.close()  # StringIO doesn't support context manager protocol on Python 2
+    return result
+
+
+def export_in_process(dbname, sql):
+    """Exports the query result with a new connection. It is called in worker processes of a concurrent dump."""
+    connection = connect_to(dbname)
+    connection.row_factory = dict_factory
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        return rows_to_csv([column[0] for column in cursor.description], cursor.fetchall())
+    finally:
+        connection.close()
+
+
+def read_data_file(fd):
+    """Column names and rows of a data file."""
+    reader = DictReader(fd.read().decode().split("\n"), delimiter=",")
+    return reader.fieldnames, [[line[k] for k in reader.fieldnames] for line in reader]
+
+
+def make_placeholders(fieldnames):
+    return ("?," * len(fieldnames))[:-1]
+
+
+def to_csv_value(value):
+    """Text of the value as it is written to a data file."""
+    if value is None:
+        return u""
+    return u"{0}".format(value)
+
+
+class HashSum(object):
+    """Sum of row hashes. It doesn't fit into 64-bit integers of SQLite, therefore it is returned as text."""
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        self.value += value
+
+    def finalize(self):
+        return str(self.value)
+
+
 def force_string(value):
     if isinstance(value, bytes):
         value = value.decode()
     return value
 
 
+# The write version, that is 2 in WAL mode, and the file change counter, that is incremented on every commit in rollback
+# journal modes. In WAL mode commits go to the `-wal` file
+DATABASE_HEADER_FORMAT = ">18xB5xI"
+WAL_WRITE_VERSION = 2
+# The WAL header has the page size, the checkpoint sequence and salts. Every frame header has the database size, that
+# is set in commit frames, the salts and the cumulative checksum
+WAL_HEADER_FORMAT = ">8x4I8x"
+WAL_FRAME_HEADER_FORMAT = ">4x5I"
 TABLES_SQL = "SELECT name AS table_name FROM sqlite_master WHERE type='table'"
+# Table-valued pragma functions allow to read the whole catalog in a few queries. Before 3.16 every table is queried
+HAS_PRAGMA_FUNCTIONS = sqlite3.sqlite_version_info >= (3, 16, 0)
+CATALOG_COLUMNS_SQL = """
+SELECT M.name AS table_name, P.name, P.pk
+FROM sqlite_master M, pragma_table_info(M.name) P
+WHERE M.type = 'table'
+ORDER BY M.rowid, P.cid
+"""
+CATALOG_FOREIGN_KEYS_SQL = """
+SELECT M.name AS table_name, P.*
+FROM sqlite_master M, pragma_foreign_key_list(M.name) P
+WHERE M.type = 'table'
+"""
+# Objects are ordered by their type first, so tables exist before anything that refers to them.
+# Inside each group the creation order (`rowid`) is preserved, e.g. a view defined on top of another view.
+# Internal objects (`sqlite_sequence`, `sqlite_stat1`, etc.) are managed by SQLite itself. `_` is a wildcard in LIKE,
+# therefore the prefix is compared literally.
+SCHEMA_SQL = """
+SELECT sql
+FROM sqlite_master
+WHERE sql IS NOT NULL AND substr(name, 1, 7) != 'sqlite_'
+ORDER BY
+  CASE type
+    WHEN 'table' THEN 0
+    WHEN 'index' THEN 1
+    WHEN 'view' THEN 2
+    WHEN 'trigger' THEN 3
+  END,
+  rowid
+"""
+# Views are dropped before tables. Indexes and triggers are dropped together with their tables
+OBJECTS_SQL = """
+SELECT type, name
+FROM sqlite_master
+WHERE type IN ('table', 'view') AND substr(name, 1, 7) != 'sqlite_'
+ORDER BY type DESC
+"""
+DIGEST_SQL = """
+SELECT
+  xdump_key_range({key}, {range_size}) AS key_range,
+  COUNT(*) AS row_count,
+  xdump_hash_sum(xdump_row_hash({columns})) AS hash_sum
+FROM {table_name}
+GROUP BY 1
+"""
+# Multiplicative hash (MINSTD) of `rowid` or the integer primary key mixed with the seed. Same seed - same rows
+SAMPLE_SQL_TEMPLATE = """
+SELECT *
+FROM {table_name}
+WHERE abs((({key} % 2147483647) * 48271 + {seed}) % 2147483647) % 10000 < {threshold}
+"""
+NO_SAMPLE_KEY_MESSAGE = "Table {0} has no rowid and no single-column integer primary key, it could not be sampled"
+
+
+@attr.s(cmp=False)
+class Catalog(object):
+    """Tables, their columns, primary and foreign keys at the given schema version."""
+
+    schema_version = attr.ib()
+    tables = attr.ib(default=attr.Factory(list))
+    columns = attr.ib(default=attr.Factory(dict))
+    primary_keys = attr.ib(default=attr.Factory(dict))
+    # Rows of `PRAGMA foreign_key_list` by table names
+    foreign_keys = attr.ib(default=attr.Factory(dict))
+
+    def add_column(self, table_name, row):
+        self.columns.setdefault(table_name, []).append(row["name"])
+        if row["pk"]:
+            self.primary_keys.setdefault(table_name, []).append((row["pk"], row["name"]))
+
+    def add_foreign_key(self, table_name, row):
+        self.foreign_keys.setdefault(table_name, []).append(row)
+
+    def get_primary_key(self, table_name):
+        return [name for _, name in sorted(self.primary_keys.get(table_name, ()))]
 
 
 @attr.s(cmp=False)
 class SQLiteBackend(BaseBackend):
     dbname = attr.ib()
     verbosity = attr.ib(convert=int, default=0)
+    # Dumps are made in `BEGIN IMMEDIATE` transactions, that hold the write lock
+    supports_concurrent_dumps = False
+    placeholder = "?"
 
     def __attrs_post_init__(self):
         if sqlite3.sqlite_version_info < (3, 8, 3):
             raise RuntimeError("Minimum supported SQLite version is 3.8.3. You have {0}".format(sqlite3.sqlite_version))
 
     def connect(self, *args, **kwargs):
-        connection = sqlite3.connect(self.dbname)
+        # Pooled connections could be checked out by different threads
+        connection = connect_to(self.dbname, check_same_thread=False)
         connection.row_factory = dict_factory
         return connection
 
-    def run_dump(self, *args, **kwargs):
-        process = subprocess.Popen(("sqlite3",) + args, stdout=subprocess.PIPE)
-        return process.communicate()[0]
+    def is_usable(self, connection):
+        try:
+            connection.cursor()
+            return True
+        except sqlite3.ProgrammingError:
+            # Closed connection
+            return False
 
     @property
     def tables(self):
-        return [result["table_name"] for result in self.run(TABLES_SQL)]
+        return list(self.get_catalog().tables)
+
+    def read_pragma(self, name):
+        """Value of a pragma. Pragma functions are plain selects, that don't commit the dump transaction on Python 2."""
+        if HAS_PRAGMA_FUNCTIONS:
+            return self.run("SELECT * FROM pragma_{0}".format(name))[0][name]
+        return self.run("PRAGMA {0}".format(name))[0][name]
+
+    def get_catalog(self):
+        """Catalog of the database. It is introspected again only if the schema version is changed."""
+        schema_version = self.read_pragma("schema_version")
+        catalog = getattr(self, "_catalog", None)
+        if catalog is None or catalog.schema_version != schema_version:
+            catalog = self._catalog = self.introspect_catalog(schema_version)
+        return catalog
+
+    def introspect_catalog(self, schema_version):
+        catalog = Catalog(schema_version, tables=[row["table_name"] for row in self.run(TABLES_SQL)])
+        if HAS_PRAGMA_FUNCTIONS:
+            for row in self.run(CATALOG_COLUMNS_SQL):
+                catalog.add_column(row["table_name"], row)
+            for row in self.run(CATALOG_FOREIGN_KEYS_SQL):
+                catalog.add_foreign_key(row["table_name"], row)
+            return catalog
+        for table_name in catalog.tables:
+            for row in self.run("PRAGMA table_info({0})".format(table_name)):
+                catalog.add_column(table_name, row)
+            for row in self.run("PRAGMA foreign_key_list({0})".format(table_name)):
+                catalog.add_foreign_key(table_name, row)
+        if sys.version_info[:2] < (3, 6):
+            # Before 3.6 sqlite3 used to implicitly commit an open transaction in this case.
+            self.begin_immediate()
+        return catalog
+
+    def cache_clear(self):
+        super(SQLiteBackend, self).cache_clear()
+        self._catalog = None
 
     def get_tables_for_related_data(self, full_tables, partial_tables):
         # Return all tables for SQLite
@@ -64,65 +296,234 @@ class SQLiteBackend(BaseBackend):
         cursor = self.get_cursor()
         cursor.execute("BEGIN IMMEDIATE")
 
-    @lru_cache()
-    def _get_foreign_keys(self, table):
-        return self.run("PRAGMA foreign_key_list({})".format(table))
+    def add_related_data(self, full_tables, partial_tables, foreign_keys=None):
+        self._related_data = foreign_keys  # pylint: disable=attribute-defined-outside-init
+        super(SQLiteBackend, self).add_related_data(full_tables, partial_tables)
 
     def get_foreign_keys(self, table, full_tables=(), recursive=False):
-        for foreign_key in self._get_foreign_keys(table):
-            if foreign_key["table"] in full_tables:
-                continue
-            if foreign_key["table"] == table and not recursive:
-                continue
-            if foreign_key["table"] != table and recursive:
-                continue
-            yield {
-                "foreign_table_name": foreign_key["table"],
-                "table_name": table,
-                "foreign_column_name": foreign_key["to"],
-                "column_name": foreign_key["from"],
-            }
-        if sys.version_info[:2] < (3, 6):
-            # Before 3.6 sqlite3 used to implicitly commit an open transaction in this case.
-            self.begin_immediate()
+        foreign_keys = [
+            foreign_key
+            for foreign_key in self.get_table_foreign_keys(table)
+            if foreign_key["foreign_table_name"] not in full_tables
+        ]
+        return select_foreign_keys(foreign_keys, table, recursive)
+
+    def get_table_foreign_keys(self, table):
+        """Foreign keys, that were given to ``dump`` or ones from the database."""
+        if getattr(self, "_related_data", None) is not None:
+            return [foreign_key for foreign_key in self._related_data if foreign_key["table_name"] == table]
+        return self.introspect_table_foreign_keys(table)
+
+    def introspect_foreign_keys(self):
+        return [foreign_key for table in self.tables for foreign_key in self.introspect_table_foreign_keys(table)]
 
-    def dump(self, filename, full_tables=(), partial_tables=None, **kwargs):
-        self.input_check(full_tables, partial_tables)
+    def introspect_table_foreign_keys(self, table):
+        # Every column of a composite key is a separate row with the same `id`, ordered by `seq`
+        grouped = {}
+        for row in sorted(self.get_catalog().foreign_keys.get(table, ()), key=lambda row: (row["id"], row["seq"])):
+            foreign_key = grouped.setdefault(
+                row["id"],
+                {"foreign_table_name": row["table"], "table_name": table, "foreign_column_name": [], "column_name": []},
+            )
+            foreign_key["foreign_column_name"].append(row["to"])
+            foreign_key["column_name"].append(row["from"])
+        foreign_keys = [
+            dict(
+                foreign_key,
+                foreign_column_name=unwrap_columns(foreign_key["foreign_column_name"]),
+                column_name=unwrap_columns(foreign_key["column_name"]),
+            )
+            for _, foreign_key in sorted(grouped.items())
+        ]
+        return foreign_keys
+
+    def get_dependencies(self, tables):
+        foreign_keys = self.get_catalog().foreign_keys
+        return {table: {foreign_key["table"] for foreign_key in foreign_keys.get(table, ())} for table in tables}
+
+    def dump(self, filename, full_tables=(), partial_tables=None, samples=None, **kwargs):
+        self.input_check(full_tables, partial_tables, samples)
         self.begin_immediate()
-        super(SQLiteBackend, self).dump(filename, full_tables=full_tables, partial_tables=partial_tables, **kwargs)
+        return super(SQLiteBackend, self).dump(
+            filename, full_tables=full_tables, partial_tables=partial_tables, samples=samples, **kwargs
+        )
+
+    def mogrify(self, sql, params):
+        # Placeholders are in the "format" style, as psycopg2 & Django use
+        values = ()
+        if params:
+            columns = ", ".join("quote(?) AS p{0}".format(index) for index in range(len(params)))
+            row = self.run("SELECT {0}".format(columns), tuple(params))[0]
+            values = tuple(row["p{0}".format(index)] for index in range(len(params)))
+        return sql % values
+
+    def get_sample_sql(self, table_name, sample):
+        # SQLite has no TABLESAMPLE and its `random()` can't be seeded. Rows are selected by a seeded hash of `rowid`
+        return SAMPLE_SQL_TEMPLATE.format(
+            table_name=table_name,
+            key=self.get_sample_key(table_name),
+            seed=sample.seed,
+            threshold=int(round(sample.percent * 100)),
+        )
+
+    def get_sample_key(self, table_name):
+        """``rowid`` or the integer primary key of a WITHOUT ROWID table.
+
+        SQLite has no hash function for values of other types.
+        """
+        key = self.get_chunk_key(table_name)
+        if key is not None:
+            return key
+        primary_key = self.get_catalog().get_primary_key(table_name)
+        if len(primary_key) == 1:
+            types = {row["name"]: row["type"] for row in self.run("PRAGMA table_info({0})".format(table_name))}
+            # Integer affinity
+            if "INT" in types[primary_key[0]].upper():
+                return primary_key[0]
+        raise ValueError(NO_SAMPLE_KEY_MESSAGE.format(table_name))
+
+    def get_chunk_key(self, table_name):
+        try:
+            self.run("SELECT rowid FROM {0} LIMIT 0".format(table_name))
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID table
+            return None
+        return "rowid"
+
+    def digest_table(self, table_name, columns, range_size=DEFAULT_RANGE_SIZE):
+        # Hashes are calculated by Python functions inside the SQLite engine, without fetching rows
+        connection = self.get_connection()
+        connection.create_function(
+            "xdump_row_hash", -1, lambda *values: row_hash([to_csv_value(value) for value in values])
+        )
+        connection.create_function("xdump_key_range", 2, lambda value, size: get_range(to_csv_value(value), size))
+        connection.create_aggregate("xdump_hash_sum", 1, HashSum)
+        sql = DIGEST_SQL.format(
+            key=columns[0], range_size=range_size, columns=", ".join(columns), table_name=table_name
+        )
+        digest = TableDigest(range_size, columns)
+        for row in self.run(sql):
+            digest.add(row["key_range"], row["row_count"], int(row["hash_sum"]))
+        return digest
 
     def dump_schema(self):
-        return self.run_dump(self.dbname, ".schema")
+        """Produces SQL for the schema of the database directly from `sqlite_master`."""
+        return u"".join(u"{0};\n".format(row["sql"]) for row in self.run(SCHEMA_SQL)).encode("utf-8")
 
-    def export_to_csv(self, sql):
-        output = StringIO()
-        cursor = self.get_cursor()
+    def export_to_csv(self, sql, connection=None):
+        if connection is None:
+            cursor = self.get_cursor()
+        else:
+            cursor = connection.cursor()
         with self.log_query(sql):
             cursor.execute(sql)
             data = cursor.fetchall()
-        writer = DictWriter(
-            output,
-            fieldnames=[column[0] for column in cursor.description],
-            lineterminator="\n",
-        )
-        writer.writeheader()
-        writer.writerows(data)
-        result = output.getvalue().encode()
-        output.close()  # StringIO doesn't support context manager protocol on Python 2
-        return result
+        return rows_to_csv([column[0] for column in cursor.description], data)
 
-    def drop_database(self, dbname):
+    def get_data_version(self):
+        """Changes, when other connections commit to the database. Values of different connections are not related."""
+        return self.read_pragma("data_version")
+
+    def export_snapshot(self):
+        """Data version of the dump connection. SQLite has no snapshot IDs, that could be shared between connections.
+
+        The dump holds the write lock (``BEGIN IMMEDIATE``), therefore no other connection could commit until it ends
+        and every read transaction, that starts meanwhile, sees the same state of the database.
+        """
+        return self.get_data_version()
+
+    @contextmanager
+    def snapshot_connection(self, snapshot):
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("BEGIN")
+            # The read transaction starts with the first read
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+            yield connection
+
+    def get_source_state(self):
+        """State of the database files, that is changed by every commit.
+
+        It is the file change counter from the database header. In WAL mode the counter is not updated by every commit,
+        therefore the state also has the size and the modification time of the database file, that are changed by
+        checkpoints, and the committed frames of the WAL file. The dump holds the write lock, therefore they are not
+        changed until the end of the export. Neither file is read entirely.
+
+        ``PRAGMA data_version`` values are not related between connections, they could not be compared with an
+        archive from another run. ``None`` for in-memory databases.
+        """
         try:
-            os.remove(dbname)
-        except FileNotFoundError:
-            pass
+            with open(self.dbname, "rb") as fd:
+                header = fd.read(struct.calcsize(DATABASE_HEADER_FORMAT))
+                write_version, counter = struct.unpack(DATABASE_HEADER_FORMAT, header)
+                if write_version != WAL_WRITE_VERSION:
+                    return {"counter": counter}
+                stat = os.fstat(fd.fileno())
+            return {
+                "counter": counter,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "wal": read_wal_state(self.dbname + "-wal"),
+            }
+        except (IOError, OSError, struct.error):
+            return None
 
-    def create_database(self, dbname, *args, **kwargs):
-        with sqlite3.connect(dbname):
-            pass
+    def export_data_files(self, tasks, jobs=1, snapshot=None):
+        """With ``jobs`` > 1 data files are exported by worker processes, because CSV encoding is CPU-bound.
+
+        Every worker reads with its own connection. They see the same state of the database, because the dump holds
+        the write lock.
+        """
+        if snapshot is None or jobs <= 1:
+            for item in super(SQLiteBackend, self).export_data_files(tasks, jobs, snapshot):
+                yield item
+            return
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for item in map_concurrently(
+                lambda task: (task, pool.apply(export_in_process, (self.dbname, task[2]))), tasks, jobs
+            ):
+                yield item
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def drop_database(self, dbname):
+        if is_in_memory(dbname):
+            # The database exists while it has open connections, therefore only its objects are dropped
+            connection = connect_to(dbname)
+            try:
+                for object_type, name in connection.execute(OBJECTS_SQL).fetchall():
+                    connection.execute("DROP {0} {1}".format(object_type, name))
+                connection.commit()
+            finally:
+                connection.close()
+            return
+        # A stale WAL file would be applied to a new database with the same name
+        for filename in (dbname, dbname + "-wal", dbname + "-shm", dbname + "-journal"):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def create_database(self, dbname, owner=None, template=None):
+        if template is not None:
+            shutil.copyfile(template, dbname)
+            return
+        connect_to(dbname).close()
 
-    def truncate(self):
-        for table in self.tables:
+    def database_exists(self, dbname):
+        return os.path.exists(dbname)
+
+    def rename_database(self, dbname, new_dbname):
+        os.rename(dbname, new_dbname)
+
+    def truncate(self, skip_empty=False):
+        # `DELETE` without `WHERE` frees pages of the table without visiting its rows, unless it has triggers
+        tables = self.tables
+        if skip_empty:
+            tables = self.get_non_empty_tables(tables)
+        for table in tables:
             self.run("DELETE FROM {0}".format(table))
         try:
             self.run("UPDATE sqlite_sequence SET seq=0")
@@ -133,24 +534,63 @@ class SQLiteBackend(BaseBackend):
     def run_setup_file(self, sql):
         self.run_many(sql)
 
-    def load_data(self, archive):
-        """Loads all data from data files inside the archive to the database."""
-        for name in archive.namelist():
-            if name.startswith(self.data_dir):
-                fd = archive.open(name)
-                filename = os.path.basename(name).split(".")[0]
-                self.load_data_file(filename, fd)
+    def table_exists(self, table_name):
+        return table_name in self.get_catalog().tables
+
+    def load_resumable(self, archive, tables=None, jobs=1, read_ahead=DEFAULT_READ_AHEAD, merge=False, resume=False):
+        # SQLite allows only one writer at a time
+        super(SQLiteBackend, self).load_resumable(archive, tables, 1, read_ahead, merge, resume)
+
+    def load_data(self, archive, tables=None, jobs=1, read_ahead=DEFAULT_READ_AHEAD, merge=False):
+        """Loads all data from data files inside the archive to the database.
+
+        SQLite allows only one writer at a time, therefore ``jobs`` is ignored.
+        """
+        load_data_file = self.get_data_file_loader(merge)
+        for table_name, fd in self.read_data_files(archive, self.get_data_files(archive, tables), read_ahead):
+            load_data_file(table_name, fd)
         try:
             self.run("COMMIT")
         except sqlite3.OperationalError:
             pass
 
-    def load_data_file(self, table_name, fd):
-        reader = DictReader(fd.read().decode().split("\n"), delimiter=",")
-        fields = ",".join(reader.fieldnames)
-        placeholders = ("?," * len(reader.fieldnames))[:-1]
-        cursor = self.get_cursor()
-        cursor.executemany(
-            "INSERT INTO {0} ({1}) VALUES ({2})".format(table_name, fields, placeholders),
-            [[line[k] for k in reader.fieldnames] for line in reader],
+    def load_data_file(self, table_name, fd, connection=None):
+        fieldnames, rows = read_data_file(fd)
+        sql = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+            table_name, ",".join(fieldnames), make_placeholders(fieldnames)
         )
+        self.insert_rows(sql, rows, connection)
+
+    def merge_data_file(self, table_name, fd, connection=None):
+        """Upserts rows by the primary key. Rows, that are equal to the existing ones, are not updated.
+
+        Before SQLite 3.24 there is no UPSERT and existing rows are replaced.
+        """
+        primary_key = self.get_catalog().get_primary_key(table_name)
+        if not primary_key:
+            raise ValueError(NO_PRIMARY_KEY_MESSAGE.format(table_name))
+        fieldnames, rows = read_data_file(fd)
+        fields, placeholders = ",".join(fieldnames), make_placeholders(fieldnames)
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            sql = "INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(table_name, fields, placeholders)
+        else:
+            updated_columns = [column for column in fieldnames if column not in primary_key]
+            if updated_columns:
+                action = "UPDATE SET {0} WHERE {1} IS NOT {2}".format(
+                    ", ".join("{0} = excluded.{0}".format(column) for column in updated_columns),
+                    make_row_value(updated_columns, table_name),
+                    make_row_value(updated_columns, "excluded"),
+                )
+            else:
+                action = "NOTHING"
+            sql = "INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO {4}".format(
+                table_name, fields, placeholders, ", ".join(primary_key), action
+            )
+        self.insert_rows(sql, rows, connection)
+
+    def insert_rows(self, sql, rows, connection=None):
+        if connection is None:
+            cursor = self.get_cursor()
+        else:
+            cursor = connection.cursor()
+        cursor.executemany(sql, rows)
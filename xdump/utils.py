@@ -1,7 +1,295 @@
 # coding: utf-8
+import hashlib
 import itertools
+import json
+import threading
+
+from ._compat import Empty, Queue
+
+# Default number of concurrent workers
+DEFAULT_JOBS = 4
 
 
 def make_options(option_key, container):
     """Creates a list of options from the given list of values."""
     return itertools.chain.from_iterable([(option_key, value) for value in container])
+
+
+def count_csv_rows(data):
+    """Number of records in CSV data with a header. Line breaks inside quoted values are not counted."""
+    if not data:
+        return 0
+    # Parts with even indexes are outside of quotes. Escaped quotes (`""`) don't break this property
+    newlines = sum(part.count(b"\n") for part in data.split(b'"')[::2])
+    if not data.endswith(b"\n"):
+        newlines += 1
+    return newlines - 1
+
+
+def read_csv_header(fd):
+    """Column names from the header of a data file. The file position is moved to the first record."""
+    return fd.readline().decode("utf-8").rstrip("\r\n").split(",")
+
+
+def get_archive_id(archive):
+    """Identifies the archive content by names, sizes and CRC-32 of its members. Nothing is decompressed."""
+    digest = hashlib.sha256()
+    for info in sorted(archive.infolist(), key=lambda info: info.filename):
+        digest.update(u"{0}:{1}:{2}\n".format(info.filename, info.file_size, info.CRC).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def dump_json(content):
+    """Human-readable JSON with a stable order of keys."""
+    return json.dumps(content, indent=2, sort_keys=True)
+
+
+def load_json(data):
+    """Parses JSON from bytes or text, e.g. from an archive member."""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def get_parameters_hash(parameters):
+    """SHA-256 of JSON-serializable parameters. The order of mapping keys doesn't matter."""
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def check_columns(table_name, kind, columns, existing_columns):
+    unknown_columns = set(columns) - set(existing_columns)
+    if unknown_columns:
+        raise ValueError(
+            "{0} columns are not found in `{1}` table: {2}".format(kind, table_name, ", ".join(sorted(unknown_columns)))
+        )
+
+
+def get_projected_columns(table_name, columns, projection=None):
+    """Columns, that are left by the projection - ``{"include": [...]}`` or ``{"exclude": [...]}``.
+
+    The order of ``columns`` is preserved.
+    """
+    if not projection:
+        return list(columns)
+    if len(projection) != 1 or not set(projection) <= {"include", "exclude"}:
+        raise ValueError("Projection of `{0}` table should contain either `include` or `exclude`".format(table_name))
+    if "include" in projection:
+        check_columns(table_name, "Included", projection["include"], columns)
+        selected_columns = [column for column in columns if column in projection["include"]]
+    else:
+        check_columns(table_name, "Excluded", projection["exclude"], columns)
+        selected_columns = [column for column in columns if column not in projection["exclude"]]
+    if not selected_columns:
+        raise ValueError("All columns of `{0}` table are excluded".format(table_name))
+    return selected_columns
+
+
+def group_foreign_keys(foreign_keys):
+    """Mapping of table names to names of tables they refer to."""
+    dependencies = {}
+    for foreign_key in foreign_keys:
+        dependencies.setdefault(foreign_key["table_name"], set()).add(foreign_key["foreign_table_name"])
+    return dependencies
+
+
+def select_foreign_keys(foreign_keys, table, recursive=False):
+    """Foreign keys, that refer to the ``table`` itself if ``recursive``, or to other tables otherwise."""
+    return [foreign_key for foreign_key in foreign_keys if (foreign_key["foreign_table_name"] == table) is recursive]
+
+
+def get_columns(value):
+    """Column names of a foreign key side. Composite keys are given as lists of names."""
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def unwrap_columns(columns):
+    """A single column name instead of a list for non-composite keys."""
+    if len(columns) == 1:
+        return columns[0]
+    return list(columns)
+
+
+def make_row_value(value, alias=None):
+    """SQL expression for the given column(s), e.g. ``T.id`` or a row value ``(T.a, T.b)`` for composite keys."""
+    columns = get_columns(value)
+    if alias is not None:
+        columns = ["{0}.{1}".format(alias, column) for column in columns]
+    if len(columns) == 1:
+        return columns[0]
+    return "({0})".format(", ".join(columns))
+
+
+def get_dependency_levels(tables, dependencies):
+    """Splits tables into levels, where every table depends only on tables from the previous levels.
+
+    ``dependencies`` is a mapping of a table name to names of tables it refers to.
+    Self-references and references to tables outside of ``tables`` are ignored.
+    Tables with cyclic dependencies are placed into the last level.
+    """
+    tables = list(tables)
+    remaining = {table: set(dependencies.get(table, ())) & set(tables) - {table} for table in tables}
+    levels = []
+    while remaining:
+        level = [table for table in tables if table in remaining and not remaining[table]]
+        if not level:
+            levels.append([table for table in tables if table in remaining])
+            break
+        levels.append(level)
+        for table in level:
+            del remaining[table]
+        for parents in remaining.values():
+            parents.difference_update(level)
+    return levels
+
+
+def run_concurrently(function, items, workers):
+    """Calls ``function`` for every item using a pool of threads.
+
+    The first exception stops the processing of the remaining items and is re-raised in the calling thread.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            function(item)
+        return
+    queue = Queue()
+    for item in items:
+        queue.put(item)
+    errors = []
+
+    def worker():
+        while not errors:
+            try:
+                item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                function(item)
+            except Exception as exc:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+class OrderedResults(object):
+    """Results of ``map_concurrently`` by indexes of their items."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._results = {}
+        self._total = None
+
+    def store(self, index, result):
+        with self._condition:
+            self._results[index] = result
+            self._condition.notify_all()
+
+    def finish(self, total):
+        """There are no items after the ``total`` first ones."""
+        with self._condition:
+            self._total = total
+            self._condition.notify_all()
+
+    def pop(self, index):
+        """Waits for the result of the item with the given index. ``None`` if there is no such item."""
+        with self._condition:
+            while index not in self._results and (self._total is None or index < self._total):
+                self._condition.wait()
+            return self._results.pop(index, None)
+
+
+class ItemSource(object):
+    """Hands out items of ``map_concurrently`` with their indexes. The iterator is advanced by one thread at a time."""
+
+    def __init__(self, items, results):
+        self._items = iter(items)
+        self._results = results
+        self._lock = threading.Lock()
+        self._next = 0
+        self._is_stopped = False
+
+    def take(self):
+        """The next index and item. ``None`` if items are exhausted or the processing is stopped."""
+        with self._lock:
+            if self._is_stopped:
+                return None
+            index = self._next
+            self._next += 1
+            try:
+                return index, next(self._items)
+            except StopIteration:
+                self._is_stopped = True
+                self._results.finish(index)
+            except Exception as exc:
+                self._is_stopped = True
+                self._results.store(index, (False, exc))
+            return None
+
+    def stop(self):
+        with self._lock:
+            self._is_stopped = True
+
+    def close(self):
+        close = getattr(self._items, "close", None)
+        if close is not None:
+            close()
+
+
+def map_concurrently(function, items, workers):
+    """Like ``map``, but ``function`` is called in a pool of threads. Results are yielded in the order of ``items``.
+
+    ``items`` are consumed lazily, therefore calls could be chained into a pipeline of stages, each one with its own
+    pool. Not more than ``workers`` results are computed ahead of the consumer, which bounds the memory usage.
+    """
+    if workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+    results = OrderedResults()
+    source = ItemSource(items, results)
+    slots = threading.Semaphore(workers)
+
+    def worker():
+        while True:
+            slots.acquire()
+            task = source.take()
+            if task is None:
+                # Pass the slot to the next waiting worker
+                slots.release()
+                return
+            index, item = task
+            try:
+                result = (True, function(item))
+            except Exception as exc:
+                result = (False, exc)
+            results.store(index, result)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        index = 0
+        while True:
+            result = results.pop(index)
+            if result is None:
+                return
+            slots.release()
+            is_successful, value = result
+            if not is_successful:
+                raise value
+            yield value
+            index += 1
+    finally:
+        source.stop()
+        slots.release()
+        for thread in threads:
+            thread.join()
+        source.close()
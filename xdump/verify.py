@@ -0,0 +1,150 @@
+# coding: utf-8
+"""Order-independent digests of table data.
+
+Every row is hashed separately - the first 64 bits of MD5 over its CSV values, joined with the unit separator.
+Row hashes are summed per range of the first column, that is usually the primary key. Only sums and row counts are
+kept in memory, therefore archives and databases of any size are compared in constant memory.
+"""
+import csv
+import hashlib
+import io
+import os
+import re
+import sys
+import zipfile
+
+import attr
+
+# Rows are grouped into ranges of the first column values, if they are integers
+DEFAULT_RANGE_SIZE = 10000
+SEPARATOR = u"\x1f"
+INTEGER_RE = re.compile(r"^-?[0-9]+$")
+
+
+def row_hash(fields):
+    """Signed 64-bit hash of a row. The same value is calculated by databases as ``md5`` prefix casted to bigint."""
+    fields = [field.decode("utf-8") if isinstance(field, bytes) else field for field in fields]
+    value = int(hashlib.md5(SEPARATOR.join(fields).encode("utf-8")).hexdigest()[:16], 16)
+    if value >= 2 ** 63:
+        value -= 2 ** 64
+    return value
+
+
+def get_range(value, range_size):
+    """Number of the key range for the first column value. Non-integer values fall into the ``None`` range."""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if INTEGER_RE.match(value):
+        return int(value) // range_size
+    return None
+
+
+@attr.s(cmp=False)
+class TableDigest(object):
+    """Row counts and sums of row hashes by key ranges of a table."""
+
+    range_size = attr.ib(default=DEFAULT_RANGE_SIZE)
+    columns = attr.ib(default=None)
+    ranges = attr.ib(default=attr.Factory(dict))
+
+    def add_row(self, fields):
+        self.add(get_range(fields[0], self.range_size), 1, row_hash(fields))
+
+    def add(self, key_range, rows, hash_sum):
+        counters = self.ranges.setdefault(key_range, [0, 0])
+        counters[0] += rows
+        counters[1] += hash_sum
+
+    @property
+    def rows(self):
+        return sum(rows for rows, _ in self.ranges.values())
+
+    def get_rows(self, key_range):
+        return self.ranges.get(key_range, (0, 0))[0]
+
+    def get_different_ranges(self, other):
+        key_ranges = set(self.ranges) | set(other.ranges)
+        return sorted(
+            (key_range for key_range in key_ranges if self.ranges.get(key_range) != other.ranges.get(key_range)),
+            key=lambda key_range: (key_range is not None, key_range),
+        )
+
+
+@attr.s(cmp=False)
+class Difference(object):
+    """A key range of a table, that has different rows on two sides."""
+
+    table_name = attr.ib()
+    key_range = attr.ib()
+    range_size = attr.ib()
+    rows = attr.ib()
+    other_rows = attr.ib()
+
+    @property
+    def bounds(self):
+        """First and last keys of the range. ``None`` for rows with non-integer keys."""
+        if self.key_range is None:
+            return None
+        start = self.key_range * self.range_size
+        return start, start + self.range_size - 1
+
+    def __str__(self):
+        if self.key_range is None:
+            description = "rows with non-integer keys"
+        else:
+            description = "keys {0}..{1}".format(*self.bounds)
+        return "{0}: {1} differ ({2} rows vs {3} rows)".format(self.table_name, description, self.rows, self.other_rows)
+
+
+def read_csv(fd):
+    if sys.version_info[0] == 2:
+        return csv.reader(fd)
+    return csv.reader(io.TextIOWrapper(fd, encoding="utf-8", newline=""))
+
+
+def get_table_name(filename):
+    """Data files of big tables are split into chunks - ``table.0001.csv``."""
+    return os.path.basename(filename).split(".")[0]
+
+
+def digest_archive(archive, range_size=DEFAULT_RANGE_SIZE, data_dir="dump/data/"):
+    """Digests of all tables in the archive. Data files are read as streams, one row at a time."""
+    digests = {}
+    for name in archive.namelist():
+        if not name.startswith(data_dir):
+            continue
+        digest = digests.setdefault(get_table_name(name), TableDigest(range_size))
+        with archive.open(name) as fd:
+            reader = read_csv(fd)
+            digest.columns = next(reader, None)
+            for fields in reader:
+                digest.add_row(fields)
+    return digests
+
+
+def compare_digests(digests, other_digests):
+    """Differences between two sets of table digests. A table, that is absent on one side, is considered empty there."""
+    differences = []
+    for table_name in sorted(set(digests) | set(other_digests)):
+        digest = digests.get(table_name)
+        other_digest = other_digests.get(table_name)
+        range_size = (digest or other_digest).range_size
+        digest = digest or TableDigest(range_size)
+        other_digest = other_digest or TableDigest(range_size)
+        for key_range in digest.get_different_ranges(other_digest):
+            differences.append(
+                Difference(
+                    table_name=table_name,
+                    key_range=key_range,
+                    range_size=range_size,
+                    rows=digest.get_rows(key_range),
+                    other_rows=other_digest.get_rows(key_range),
+                )
+            )
+    return differences
+
+
+def diff_archives(filename, other_filename, range_size=DEFAULT_RANGE_SIZE):
+    """Differences between data of two archives."""
+    with zipfile.ZipFile(filename) as archive, zipfile.ZipFile(other_filename) as other_archive:
+        return compare_digests(digest_archive(archive, range_size), digest_archive(other_archive, range_size))